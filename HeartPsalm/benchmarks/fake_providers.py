@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+""" Local HTTP stand-ins for the Gemini and Spotify APIs, for load tests. """
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+GEMINI_RE = re.compile(
+    r"^/v1beta/models/[^/:]+:(generateContent|streamGenerateContent|"
+    r"countTokens)$"
+)
+
+REPLY = (
+    "I hear you, and I am praying with you. Remember that you are never "
+    "alone: the Lord is near to the brokenhearted and His peace guards "
+    "your heart. Take one small step today, and lean on Him for the rest."
+)
+PLAN = {
+    "song_request": False,
+    "emotion": "comforting",
+    "reply": REPLY,
+}
+
+# Pause between the chunks of a streamed reply
+STREAM_CHUNK_SECONDS = 0.02
+STREAM_CHUNKS = 6
+
+
+class LatencyProfile:
+    """
+    How a stand-in behaves: a lognormal latency around a median, and the
+        share of requests that fail.
+    """
+
+    def __init__(self, median=0.0, sigma=0.0, error_rate=0.0, seed=None):
+        """Sets up the distribution."""
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Draws a latency in seconds."""
+        if self.median <= 0:
+            return 0.0
+        with self._lock:
+            return self._random.lognormvariate(
+                math.log(self.median), self.sigma
+            )
+
+    def fails(self):
+        """Draws whether this request fails."""
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Answers the Gemini REST and Spotify Web API calls the app makes."""
+
+    protocol_version = "HTTP/1.1"
+    gemini = LatencyProfile()
+    spotify = LatencyProfile()
+
+    def log_message(self, format, *args):
+        """Keeps the load test's output readable."""
+
+    def _read_json(self):
+        """Reads the request body as JSON, or an empty dict."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status, payload):
+        """Sends a JSON response."""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        """Writes one chunk of a chunked response."""
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        """Serves Spotify's token endpoint and Gemini's model methods."""
+        path = urlparse(self.path).path
+        body = self._read_json()
+        if path == "/api/token":
+            return self._send_json(200, {
+                "access_token": "fake-token",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+            })
+
+        match = GEMINI_RE.match(path)
+        if not match:
+            return self._send_json(404, {"error": {"code": 404}})
+        method = match.group(1)
+        if method == "countTokens":
+            return self._send_json(200, {"totalTokens": 3})
+
+        time.sleep(self.gemini.sample())
+        if self.gemini.fails():
+            return self._send_json(503, {"error": {
+                "code": 503,
+                "message": "The stand-in model is overloaded.",
+                "status": "UNAVAILABLE",
+            }})
+
+        config = body.get("generationConfig") or \
+            body.get("generation_config") or {}
+        mime_type = config.get("responseMimeType") or \
+            config.get("response_mime_type")
+        text = json.dumps(PLAN) if mime_type == "application/json" else REPLY
+
+        if method == "generateContent":
+            return self._send_json(200, _candidate(text))
+
+        # streamed replies are one JSON array, sent a few words at a time
+        words = text.split(" ")
+        size = max(1, math.ceil(len(words) / STREAM_CHUNKS))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._send_chunk(b"[")
+        for start in range(0, len(words), size):
+            part = " ".join(words[start:start + size])
+            if start + size < len(words):
+                part += " "
+            separator = b"," if start else b""
+            self._send_chunk(separator + json.dumps(_candidate(part)).encode())
+            time.sleep(STREAM_CHUNK_SECONDS)
+        self._send_chunk(b"]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        """Serves Spotify's track search."""
+        url = urlparse(self.path)
+        if url.path != "/v1/search":
+            return self._send_json(404, {"error": {"status": 404}})
+
+        time.sleep(self.spotify.sample())
+        if self.spotify.fails():
+            return self._send_json(500, {"error": {
+                "status": 500, "message": "Stand-in Spotify failed."
+            }})
+
+        query = parse_qs(url.query)
+        q = query.get("q", ["gospel"])[0]
+        limit = int(query.get("limit", ["20"])[0])
+        return self._send_json(200, {"tracks": {"items": [
+            {
+                "id": f"{q.replace(' ', '-')}-{number}",
+                "name": f"Stand-in Song {number}",
+                "artists": [{"name": "Stand-in Choir"}],
+                "external_urls": {
+                    "spotify": f"https://open.spotify.com/track/{number}"
+                },
+                "popularity": number,
+            }
+            for number in range(limit)
+        ]}})
+
+
+def _candidate(text):
+    """Wraps text in a GenerateContentResponse."""
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": 1,
+            "index": 0,
+        }],
+        "usageMetadata": {"totalTokenCount": len(text.split())},
+    }
+
+
+def serve(host="127.0.0.1", port=0, gemini=None, spotify=None):
+    """
+    Starts the stand-ins on a background thread.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port, 0 for any free one.
+        gemini (LatencyProfile): How the Gemini stand-in behaves.
+        spotify (LatencyProfile): How the Spotify stand-in behaves.
+
+    Returns:
+        ThreadingHTTPServer: The running server; `shutdown()` stops it.
+    """
+    handler = type("ConfiguredHandler", (FakeProviderHandler,), {
+        "gemini": gemini or LatencyProfile(),
+        "spotify": spotify or LatencyProfile(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="fake-providers", daemon=True
+    ).start()
+    return server
+
+
+def provider_env(server):
+    """
+    The settings that point the app at the stand-ins.
+
+    Returns:
+        dict: Environment variables for the app's process.
+    """
+    url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    return {
+        "GENERATIVE_AI_ENDPOINT": url,
+        "GENERATIVE_AI_TRANSPORT": "rest",
+        "GENERATIVE_AI_API_KEY": "load-test",
+        "SPOTIFY_API_URL": url,
+        "SPOTIPY_CLIENT_ID": "load-test",
+        "SPOTIPY_CLIENT_SECRET": "load-test",
+    }
+
+
+def add_profile_arguments(parser):
+    """Adds the stand-ins' latency and error options to a parser."""
+    parser.add_argument("--gemini-median", type=float, default=0.8,
+                        help="median Gemini latency in seconds")
+    parser.add_argument("--gemini-sigma", type=float, default=0.5,
+                        help="spread of the lognormal Gemini latency")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--spotify-median", type=float, default=0.15)
+    parser.add_argument("--spotify-sigma", type=float, default=0.3)
+    parser.add_argument("--spotify-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def profiles_from_arguments(args):
+    """
+    Builds the stand-ins' profiles from parsed options.
+
+    Returns:
+        tuple: The Gemini and Spotify LatencyProfile.
+    """
+    return (
+        LatencyProfile(args.gemini_median, args.gemini_sigma,
+                       args.gemini_error_rate, args.seed),
+        LatencyProfile(args.spotify_median, args.spotify_sigma,
+                       args.spotify_error_rate, args.seed),
+    )
+
+
+def main():
+    """Runs the stand-ins until interrupted, for an app started by hand."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8081)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    gemini, spotify = profiles_from_arguments(args)
+    server = serve(port=args.port, gemini=gemini, spotify=spotify)
+    print("Start the app with:")
+    for name, value in provider_env(server).items():
+        print(f"  export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+""" Simulates concurrent users against HeartPsalm served by gunicorn. """
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+import numpy as np
+import requests
+from benchmarks.fake_providers import (
+        serve, provider_env, add_profile_arguments, profiles_from_arguments)
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+SESSION_LINK_RE = re.compile(r"/load_chat/([\w-]+)")
+
+PASSWORD = "load-test-password"
+REQUEST_TIMEOUT = 60
+
+# What users type, a mix of feelings, questions and song requests
+MESSAGES = (
+    "I feel so anxious today",
+    "I'm really tired and worn out",
+    "Work has been hard and I don't know what to do",
+    "I feel grateful for my family",
+    "Can you recommend a worship song?",
+    "Play me something uplifting",
+    "My friend is sick, please pray with me",
+    "What does the Bible say about forgiveness?",
+    "I lost my job this week",
+    "Thank you, that helped",
+)
+
+
+class RouteStats:
+    """Latencies and errors per route, shared by the simulated users."""
+
+    def __init__(self):
+        """Starts empty."""
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, failed):
+        """Records one request."""
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if failed:
+                self.errors[route] += 1
+
+    def report(self, duration):
+        """
+        Summarizes every route.
+
+        Args:
+            duration (float): The measured period, in seconds.
+
+        Returns:
+            dict: Per route, the request count, throughput, error rate
+                and latency percentiles in ms.
+        """
+        report = {}
+        with self._lock:
+            for route, latencies in sorted(self.latencies.items()):
+                count = len(latencies)
+                p50, p90, p99 = np.percentile(
+                    np.array(latencies) * 1000, [50, 90, 99]
+                )
+                report[route] = {
+                    "requests": count,
+                    "throughput_rps": round(count / duration, 2),
+                    "error_rate": round(self.errors[route] / count, 4),
+                    "p50_ms": round(float(p50), 1),
+                    "p90_ms": round(float(p90), 1),
+                    "p99_ms": round(float(p99), 1),
+                }
+        return report
+
+
+class SimulatedUser(threading.Thread):
+    """
+    One user: registers, logs out and back in, then chats, opens old
+        sessions and deletes sessions until the test ends.
+    """
+
+    def __init__(self, number, run_id, base_url, stats, stop_at,
+                 think_time, seed):
+        """Prepares the user; `start()` runs it."""
+        super().__init__(name=f"user-{number}", daemon=True)
+        self.username = f"load{run_id}{number}"
+        self.base_url = base_url
+        self.stats = stats
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.http = requests.Session()
+        self.sessions = []
+
+    def request(self, route, method, path, **kwargs):
+        """
+        Makes a request without following redirects and records it.
+
+        Returns:
+            requests.Response: The response, or None if it failed to send.
+        """
+        started = time.perf_counter()
+        try:
+            response = self.http.request(
+                method, self.base_url + path, allow_redirects=False,
+                timeout=REQUEST_TIMEOUT, **kwargs
+            )
+            if kwargs.get("stream"):
+                for _ in response.iter_content(chunk_size=None):
+                    pass
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            response, failed = None, True
+        self.stats.record(route, time.perf_counter() - started, failed)
+        return response
+
+    def _csrf_token(self, route, path):
+        """Opens a form page and reads its CSRF token."""
+        response = self.request(route, "GET", path)
+        match = CSRF_RE.search(response.text) if response else None
+        return match.group(1) if match else ""
+
+    def register(self):
+        """Creates the account, which also logs the user in."""
+        token = self._csrf_token("GET /register", "/register")
+        self.request("POST /register", "POST", "/register", data={
+            "csrf_token": token,
+            "username": self.username,
+            "email_address": f"{self.username}@example.com",
+            "password1": PASSWORD,
+            "password2": PASSWORD,
+        })
+
+    def log_in_again(self):
+        """Logs out and back in through the login form."""
+        self.request("GET /logout", "GET", "/logout")
+        token = self._csrf_token("GET /login", "/login")
+        self.request("POST /login", "POST", "/login", data={
+            "csrf_token": token,
+            "username": self.username,
+            "password": PASSWORD,
+        })
+
+    def chat(self):
+        """Sends a message and waits for the whole reply."""
+        self.request("POST /chat", "POST", "/chat", data={
+            "user_feeling": self.random.choice(MESSAGES)
+        })
+
+    def chat_stream(self):
+        """Sends a message and reads the streamed reply to the end."""
+        self.request("POST /chat/stream", "POST", "/chat/stream", data={
+            "user_feeling": self.random.choice(MESSAGES)
+        }, stream=True)
+
+    def view_chat(self):
+        """Reopens the current chat page."""
+        self.request("GET /chat", "GET", "/chat")
+
+    def list_chats(self):
+        """Lists the user's sessions and remembers their ids."""
+        response = self.request("GET /load_chats", "GET", "/load_chats")
+        if response is not None and response.ok:
+            self.sessions = list(dict.fromkeys(
+                SESSION_LINK_RE.findall(response.text)
+            ))
+
+    def open_chat(self):
+        """Switches to one of the user's older sessions."""
+        if self.sessions:
+            session_id = self.random.choice(self.sessions)
+            self.request(
+                "GET /load_chat/<id>", "GET", f"/load_chat/{session_id}"
+            )
+
+    def new_chat(self):
+        """Starts a new session."""
+        self.request("GET /new_chat", "GET", "/new_chat")
+
+    def delete_chat(self):
+        """Deletes one of the user's sessions."""
+        if self.sessions:
+            session_id = self.sessions.pop(
+                self.random.randrange(len(self.sessions))
+            )
+            self.request(
+                "GET /delete_chat/<id>", "GET", f"/delete_chat/{session_id}"
+            )
+
+    # How often each action is picked
+    ACTIONS = (
+        (chat, 40), (chat_stream, 10), (view_chat, 12), (list_chats, 10),
+        (open_chat, 10), (new_chat, 10), (delete_chat, 8),
+    )
+
+    def run(self):
+        """Signs up, then acts with think time until the test ends."""
+        self.register()
+        self.log_in_again()
+        actions = [action for action, _ in self.ACTIONS]
+        weights = [weight for _, weight in self.ACTIONS]
+        while time.monotonic() < self.stop_at:
+            self.random.choices(actions, weights)[0](self)
+            if self.think_time > 0:
+                pause = self.random.expovariate(1 / self.think_time)
+                remaining = self.stop_at - time.monotonic()
+                time.sleep(max(0, min(pause, remaining)))
+
+
+def start_app(port, workers, env, data_dir):
+    """
+    Starts gunicorn with the app's gunicorn.conf.py, so the worker class
+        and its settings come from the usual GUNICORN_* variables. The
+        workers run in `data_dir`, where spotipy writes its token cache.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers),
+         "-b", f"127.0.0.1:{port}", "--chdir", data_dir,
+         "--pythonpath", APP_DIR, "run:app"],
+        cwd=APP_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+
+
+def wait_until_up(base_url, server, timeout=60):
+    """Waits for the app to answer, failing if gunicorn exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited:\n{server.stderr.read()}")
+        try:
+            requests.get(f"{base_url}/home", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not come up in {timeout} s")
+
+
+def describe(profile):
+    """The settings of a LatencyProfile, for the report."""
+    return {
+        "median_s": profile.median,
+        "sigma": profile.sigma,
+        "error_rate": profile.error_rate,
+    }
+
+
+def main():
+    """Runs the load test and prints a per-route report."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60,
+                        help="seconds of load after the ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=5,
+                        help="seconds over which the users start")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="mean pause between a user's requests")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="gunicorn workers to start")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--database-url",
+                        help="defaults to a new SQLite file")
+    parser.add_argument("--base-url",
+                        help="test an app that is already running instead")
+    parser.add_argument("--json", help="also write the report to this file")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    gemini, spotify = profiles_from_arguments(args)
+    providers = serve(gemini=gemini, spotify=spotify)
+    data_dir = tempfile.mkdtemp(prefix="heartpsalm-load-")
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        env = dict(os.environ)
+        env.update(provider_env(providers))
+        env["SQLALCHEMY_DATABASE_URI"] = args.database_url or (
+            f"sqlite:///{os.path.join(data_dir, 'load.db')}"
+        )
+        env.setdefault("SECRET_KEY", "load-test")
+        env.setdefault("CACHE_TYPE", "SimpleCache")
+        server = start_app(args.port, args.workers, env, data_dir)
+        base_url = f"http://127.0.0.1:{args.port}"
+    else:
+        print("Point the app at the stand-ins with:")
+        for name, value in provider_env(providers).items():
+            print(f"  {name}={value}")
+
+    try:
+        wait_until_up(base_url, server)
+        stats = RouteStats()
+        run_id = uuid.uuid4().hex[:6]
+        started = time.monotonic()
+        stop_at = started + args.ramp_up + args.duration
+        users = []
+        for number in range(args.users):
+            user = SimulatedUser(
+                number, run_id, base_url, stats, stop_at, args.think_time,
+                (args.seed or 0) + number
+            )
+            user.start()
+            users.append(user)
+            time.sleep(args.ramp_up / max(1, args.users))
+        for user in users:
+            user.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(30)
+        providers.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "users": args.users,
+        "duration_s": round(elapsed, 1),
+        "workers": args.workers if args.base_url is None else None,
+        "worker_class": os.getenv("GUNICORN_WORKER_CLASS", "sync"),
+        "gemini": describe(gemini),
+        "spotify": describe(spotify),
+        "routes": stats.report(elapsed),
+    }
+
+    print(f"{'route':<24}{'requests':>9}{'rps':>8}{'errors':>8}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for route, row in report["routes"].items():
+        print(f"{route:<24}{row['requests']:>9}{row['throughput_rps']:>8}"
+              f"{row['error_rate']:>8.1%}{row['p50_ms']:>9}"
+              f"{row['p90_ms']:>9}{row['p99_ms']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+""" Measures credential lookups and logins per second per core. """
+import os
+import tempfile
+
+# The benchmark drops and seeds its database, so it never uses the
+# configured one; it must be set before the app creates its engine on import.
+# The password pool's processes import this module again, so they reuse the
+# directory through the environment instead of making their own.
+if "LOGIN_BENCH_DIR" not in os.environ:
+    os.environ["LOGIN_BENCH_DIR"] = tempfile.mkdtemp(
+        prefix="heartpsalm-login-"
+    )
+_DATA_DIR = os.environ["LOGIN_BENCH_DIR"]
+os.environ["SQLALCHEMY_DATABASE_URI"] = (
+    f"sqlite:///{os.path.join(_DATA_DIR, 'login.db')}"
+)
+os.environ.setdefault("CACHE_TYPE", "SimpleCache")
+os.environ.setdefault("SECRET_KEY", "bench")
+for _name in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET",
+              "GENERATIVE_AI_API_KEY"):
+    os.environ.setdefault(_name, "bench")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import random  # noqa: E402
+import resource  # noqa: E402
+import shutil  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+import numpy as np  # noqa: E402
+from sqlalchemy import insert, text  # noqa: E402
+from heartpsalm import app, db, passwords  # noqa: E402
+from heartpsalm.models import User, ChatConfiguration  # noqa: E402
+
+PASSWORD = "bench-password"
+
+
+def seed(users):
+    """
+    Recreates the database with `users` users sharing one password hash.
+
+    Returns:
+        list: The usernames.
+    """
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.add(ChatConfiguration(role="user", content="Be kind"))
+    db.session.add(ChatConfiguration(role="assistant", content="Hello"))
+    password_hash = passwords.hash_password(PASSWORD)
+    usernames = [f"bench{number}" for number in range(users)]
+    db.session.execute(insert(User), [
+        {
+            "id": f"bench-{number}",
+            "username": username,
+            "email_address": f"{username}@bench.local",
+            "password_hash": password_hash,
+        }
+        for number, username in enumerate(usernames)
+    ])
+    db.session.commit()
+    return usernames
+
+
+def time_lookups(usernames, lookups):
+    """
+    Times the login page's user lookup by username.
+
+    Returns:
+        dict: Latency percentiles in µs.
+    """
+    chosen = random.Random(0).choices(usernames, k=lookups)
+    latencies = []
+    for username in chosen:
+        started = time.perf_counter()
+        User.query.filter_by(username=username).first()
+        latencies.append((time.perf_counter() - started) * 1e6)
+        db.session.rollback()
+    return {
+        "p50_us": round(float(np.percentile(latencies, 50)), 1),
+        "p99_us": round(float(np.percentile(latencies, 99)), 1),
+    }
+
+
+def _process_cpu_seconds(pid):
+    """A live process's CPU time from /proc, in seconds."""
+    with open(f"/proc/{pid}/stat", encoding="ascii") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds():
+    """
+    CPU time of this process and of the password pool's processes, which
+        the fork server started, so they are not this process's children.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    pool = passwords._pool
+    return own.ru_utime + own.ru_stime + sum(
+        _process_cpu_seconds(pid)
+        for pid in (pool._processes if pool is not None else ())
+    )
+
+
+def time_logins(usernames, logins, threads):
+    """
+    Logs users in through `POST /login` from concurrent clients.
+
+    Args:
+        usernames (list): The seeded users.
+        logins (int): How many logins to make in total.
+        threads (int): How many clients log in at once.
+
+    Returns:
+        dict: Throughput, latency percentiles in ms and logins per
+            CPU-second, i.e. per fully used core.
+    """
+    chosen = random.Random(1).choices(usernames, k=logins)
+    latencies = []
+    failures = []
+
+    def log_in(batch):
+        """Makes one client's share of the logins."""
+        client = app.test_client()
+        for username in batch:
+            started = time.perf_counter()
+            response = client.post("/login", data={
+                "username": username, "password": PASSWORD
+            })
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 302:
+                failures.append(response.status_code)
+
+    passwords.start_pool()
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    workers = [
+        threading.Thread(target=log_in, args=(chosen[number::threads],))
+        for number in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_before
+    passwords.shutdown()
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} logins failed: {failures[:5]}")
+    return {
+        "logins": logins,
+        "logins_per_second": round(logins / elapsed, 2),
+        "logins_per_cpu_second": round(logins / cpu, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+    }
+
+
+def main():
+    """Runs the lookups and logins and prints the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=4,
+                        help="clients logging in at once")
+    parser.add_argument("--pool-sizes", default="0,1,2",
+                        help="PASSWORD_HASH_WORKERS values to compare")
+    parser.add_argument("--rounds", type=int, default=None,
+                        help="bcrypt cost, defaults to BCRYPT_LOG_ROUNDS")
+    args = parser.parse_args()
+
+    if args.rounds is not None:
+        app.config["BCRYPT_LOG_ROUNDS"] = args.rounds
+    app.config["WTF_CSRF_ENABLED"] = False
+    # Hash as a gevent worker would, so the pool sizes are compared
+    passwords.WORKER_CLASS = "gevent"
+    results = {
+        "cores": os.cpu_count(),
+        "bcrypt_rounds": passwords.log_rounds(),
+        "users": args.users,
+        "lookups": {},
+        "logins": {},
+    }
+    with app.app_context():
+        try:
+            usernames = seed(args.users)
+            results["lookups"]["indexed"] = time_lookups(
+                usernames, args.lookups
+            )
+            db.session.execute(text("DROP INDEX idx_user_username"))
+            results["lookups"]["unindexed"] = time_lookups(
+                usernames, args.lookups
+            )
+            db.session.execute(text(
+                'CREATE UNIQUE INDEX idx_user_username ON "user" (username)'
+            ))
+            db.session.commit()
+            for name, stats in results["lookups"].items():
+                print(f"lookup {name:<10}p50 {stats['p50_us']:9.1f} µs  "
+                      f"p99 {stats['p99_us']:9.1f} µs", file=sys.stderr)
+
+            for size in (int(size) for size in args.pool_sizes.split(",")):
+                passwords.PASSWORD_HASH_WORKERS = size
+                stats = time_logins(usernames, args.logins, args.threads)
+                results["logins"][f"pool_{size}"] = stats
+                print(f"pool {size:<3}"
+                      f"{stats['logins_per_second']:8.2f} logins/s  "
+                      f"{stats['logins_per_cpu_second']:8.2f} per CPU-s  "
+                      f"p50 {stats['p50_ms']:8.1f} ms  "
+                      f"p99 {stats['p99_ms']:8.1f} ms", file=sys.stderr)
+        finally:
+            db.session.remove()
+            shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+""" Compares building a Gemini model per call with the model registry. """
+import argparse
+import time
+import timeit
+from google.generativeai import client as genai_client
+from heartpsalm import genai
+from heartpsalm import model_registry
+
+
+def main():
+    """Times both ways of getting a model and prints the cost per call."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    config = model_registry.JSON_RESPONSE
+    per_call = timeit.timeit(
+        lambda: genai.GenerativeModel(
+            model_registry.GEMINI_MODEL, generation_config=config
+        ),
+        number=args.calls
+    )
+    model_registry.get_model(config)
+    registry = timeit.timeit(
+        lambda: model_registry.get_model(config), number=args.calls
+    )
+
+    for name, total in (("per call", per_call), ("registry", registry)):
+        print(f"{name:<10}{total / args.calls * 1e6:8.2f} us per model")
+    print(f"speedup   {per_call / registry:8.1f}x")
+
+    # what warming moves off a worker's first request, before any TLS
+    # handshake: building the SDK client and its channel
+    started = time.perf_counter()
+    genai_client._client_manager.make_client("generative")
+    client_ms = (time.perf_counter() - started) * 1000
+    print(f"client and channel setup, once per process: {client_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
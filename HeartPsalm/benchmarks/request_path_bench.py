@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+""" Measures HeartPsalm's own request overhead with stubbed providers. """
+import os
+import tempfile
+
+# The harness drops and seeds its database, so it never uses the configured
+# one; it must be set before the app creates its engine on import
+_DATA_DIR = tempfile.mkdtemp(prefix="heartpsalm-bench-")
+os.environ["SQLALCHEMY_DATABASE_URI"] = (
+    f"sqlite:///{os.path.join(_DATA_DIR, 'bench.db')}"
+)
+os.environ.setdefault("CACHE_TYPE", "SimpleCache")
+os.environ.setdefault("SECRET_KEY", "bench")
+# Seeding hashes one password, not worth starting the password pool for
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+for _name in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET",
+              "GENERATIVE_AI_API_KEY"):
+    os.environ.setdefault(_name, "bench")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import shutil  # noqa: E402
+import sqlite3  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from datetime import datetime, timedelta, timezone  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+import numpy as np  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from heartpsalm import app, db, cache, core_functions  # noqa: E402
+from heartpsalm import llm_providers  # noqa: E402
+from heartpsalm.helper_functions import (  # noqa: E402
+        build_message_rows, store_message_rows)
+from heartpsalm.models import User, ChatConfiguration  # noqa: E402
+
+DEFAULT_DATASETS = "1x5x20,10x20x100,20x50x400"
+PASSWORD = "bench-password"
+
+
+class StubSpotify:
+    """A deterministic, in-process stand-in for the spotipy client."""
+
+    latency = 0.0
+
+    def search(self, q, limit=10, type="track", **kwargs):
+        """Returns `limit` made-up tracks for the query."""
+        time.sleep(self.latency)
+        return {"tracks": {"items": [
+            {
+                "id": f"{q}-{number}",
+                "name": f"Song {number}",
+                "artists": [{"name": "Stub Choir"}],
+                "external_urls": {
+                    "spotify": f"https://open.spotify.com/track/{number}"
+                },
+                "popularity": number,
+            }
+            for number in range(limit)
+        ]}}
+
+
+class QueryCounter:
+    """Counts the SQL statements the engine executes."""
+
+    def __init__(self, engine):
+        """Starts listening to the engine."""
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        """Counts one statement."""
+        self.count += 1
+
+
+def parse_datasets(spec):
+    """
+    Parses "usersxsessionsxmessages" sizes, comma separated.
+
+    Returns:
+        list: (users, sessions, messages per session) tuples.
+    """
+    datasets = []
+    for size in spec.split(","):
+        users, sessions, messages = (int(part) for part in size.split("x"))
+        datasets.append((users, sessions, messages))
+    return datasets
+
+
+def seed(users, sessions, messages):
+    """
+    Recreates the database with users × sessions × messages rows, written
+        through the app's own bulk write path.
+
+    Returns:
+        list: The session ids of the benchmark user, oldest first.
+    """
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    cache.clear()
+    db.session.add(ChatConfiguration(role="user", content="Be kind"))
+    db.session.add(ChatConfiguration(role="assistant", content="Hello"))
+
+    hashed = User(username="bench0", email_address="bench0@bench.local")
+    hashed.password = PASSWORD
+    db.session.add(hashed)
+    db.session.add_all(
+        User(username=f"bench{number}",
+             email_address=f"bench{number}@bench.local",
+             password_hash=hashed.password_hash)
+        for number in range(1, users)
+    )
+    db.session.commit()
+
+    started = datetime.now(timezone.utc) - timedelta(days=30)
+    bench_sessions = []
+    for user in User.query.order_by(User.id):
+        rows = []
+        for session_number in range(sessions):
+            session_id = f"{user.username}-session-{session_number}"
+            if user.username == "bench0":
+                bench_sessions.append(session_id)
+            rows.extend(build_message_rows(user.id, session_id, [
+                (
+                    "user" if number % 2 == 0 else "assistant",
+                    f"Message {number} of {session_id}, **with** markup.",
+                    started + timedelta(minutes=session_number * 10_000
+                                        + number),
+                )
+                for number in range(messages)
+            ]))
+        store_message_rows(rows)
+    return bench_sessions
+
+
+def measure(client, counter, name, requests, call):
+    """
+    Times an endpoint.
+
+    Args:
+        client (FlaskClient): The logged-in test client.
+        counter (QueryCounter): Counts each request's queries.
+        name (str): The endpoint being measured.
+        requests (int): How many requests to time.
+        call (callable): Makes request `number` with the client.
+
+    Returns:
+        dict: Latency percentiles in ms and queries per request.
+    """
+    latencies = []
+    queries = []
+    for number in range(requests):
+        counter.count = 0
+        started = time.perf_counter()
+        response = call(client, number)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} returned {response.status_code}")
+
+    latencies = np.array(latencies)
+    return {
+        "requests": requests,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "queries_per_request": round(float(np.mean(queries)), 2),
+        "max_queries": int(max(queries)),
+    }
+
+
+def run_dataset(users, sessions, messages, requests, counter):
+    """
+    Seeds one dataset and measures every endpoint against it.
+
+    Returns:
+        dict: The dataset's size and each endpoint's measurements.
+    """
+    bench_sessions = seed(users, sessions, messages)
+    client = app.test_client()
+    client.post(
+        "/login", data={"username": "bench0", "password": PASSWORD}
+    )
+    newest = bench_sessions[-1]
+
+    def use_session(session_id):
+        """Makes a session the client's current chat."""
+        with client.session_transaction() as flask_session:
+            flask_session["session_id"] = session_id
+
+    endpoints = {}
+    use_session(newest)
+    # compile the templates before anything is timed
+    client.get("/chat")
+    client.get("/load_chats")
+    endpoints["GET /chat"] = measure(
+        client, counter, "GET /chat", requests,
+        lambda client, number: client.get("/chat")
+    )
+    endpoints["POST /chat"] = measure(
+        client, counter, "POST /chat", requests,
+        lambda client, number: client.post(
+            "/chat", data={"user_feeling": f"Long day at work, part {number}"}
+        )
+    )
+    endpoints["GET /load_chats"] = measure(
+        client, counter, "GET /load_chats", requests,
+        lambda client, number: client.get("/load_chats")
+    )
+    # every delete removes one seeded session, so at most that many
+    deletable = bench_sessions[:-1][:requests]
+    if deletable:
+        endpoints["POST /delete_chat"] = measure(
+            client, counter, "POST /delete_chat", len(deletable),
+            lambda client, number: client.post(
+                f"/delete_chat/{deletable[number]}"
+            )
+        )
+    return {
+        "users": users,
+        "sessions_per_user": sessions,
+        "messages_per_session": messages,
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    """Runs every dataset and prints the results as JSON on stdout."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--datasets", default=DEFAULT_DATASETS,
+        help="users x sessions x messages, e.g. 1x5x20,10x20x100"
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="seconds each local model or stubbed Spotify call takes"
+    )
+    args = parser.parse_args()
+
+    StubSpotify.latency = args.latency
+    local_provider = llm_providers.LocalProvider(latency=args.latency)
+    app.config["WTF_CSRF_ENABLED"] = False
+    results = {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "stub_latency_s": args.latency,
+        "datasets": [],
+    }
+    with app.app_context(), \
+            patch.object(llm_providers, "LLM_PROVIDER", "local"), \
+            patch.object(llm_providers, "routes", {}), \
+            patch.dict(llm_providers._providers, local=local_provider), \
+            patch.object(core_functions, "sp", StubSpotify()):
+        counter = QueryCounter(db.engine)
+        try:
+            for users, sessions, messages in parse_datasets(args.datasets):
+                result = run_dataset(
+                    users, sessions, messages, args.requests, counter
+                )
+                results["datasets"].append(result)
+                label = f"{users}x{sessions}x{messages}"
+                for name, stats in result["endpoints"].items():
+                    print(
+                        f"{label:<12}{name:<20}"
+                        f"p50 {stats['p50_ms']:8.2f} ms  "
+                        f"p99 {stats['p99_ms']:8.2f} ms  "
+                        f"{stats['queries_per_request']:6.2f} queries",
+                        file=sys.stderr
+                    )
+        finally:
+            db.session.remove()
+            shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+""" Times semantic cache lookups against a brute-force scan. """
+import argparse
+import random
+import time
+import numpy as np
+from heartpsalm.semantic_cache import SemanticCache, embed
+
+WORDS = (
+    "love hope grace fear anxious lonely tired joy peace sad angry lost "
+    "faith pray song worship mother father job exam sick heal strength "
+    "family friend church sleep night morning help thank bless"
+).split()
+
+
+def main():
+    """Fills a cache with synthetic messages and prints lookup latency."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts = [
+        " ".join(rng.choices(WORDS, k=rng.randint(3, 9))) + f" {number}"
+        for number in range(args.entries)
+    ]
+    vectors = [embed(text) for text in texts]
+    semantic = SemanticCache(capacity=args.entries)
+    for text, vector in zip(texts, vectors):
+        semantic.add(text, text, vector)
+
+    queries = rng.sample(range(args.entries), args.lookups)
+    started = time.perf_counter()
+    hits = sum(
+        semantic.lookup(texts[query], vectors[query]) == texts[query]
+        for query in queries
+    )
+    indexed = (time.perf_counter() - started) / args.lookups
+
+    matrix = np.stack(vectors)
+    started = time.perf_counter()
+    for query in queries:
+        int(np.argmax(matrix @ vectors[query]))
+    scan = (time.perf_counter() - started) / args.lookups
+
+    print(f"entries      {args.entries}")
+    print(f"indexed      {indexed * 1000:8.3f} ms per lookup")
+    print(f"brute force  {scan * 1000:8.3f} ms per lookup")
+    print(f"recall       {hits / args.lookups:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
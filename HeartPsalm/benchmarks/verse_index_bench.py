@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+""" Times verse retrieval by emotion tag and by full-text search. """
+import argparse
+import timeit
+from heartpsalm import verses
+
+
+def main():
+    """Builds the verse index and prints the cost of each lookup."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    build = timeit.timeit(
+        lambda: verses.VerseIndex(verses.load_verses()), number=1
+    )
+    index = verses.get_index()
+    timings = {
+        "tag": timeit.timeit(
+            lambda: verses.verses_for_emotion("anxious"), number=args.calls
+        ),
+        "feeling": timeit.timeit(
+            lambda: verses.detect_feeling("I feel so anxious today"),
+            number=args.calls
+        ),
+        "search": timeit.timeit(
+            lambda: index.search("I can't sleep at night"),
+            number=args.calls
+        ),
+    }
+
+    print(f"verses    {len(index.verses)}, built in {build * 1e3:.1f} ms")
+    for name, total in timings.items():
+        print(f"{name:<10}{total / args.calls * 1e6:8.2f} us per lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+""" Measures chat turns stored per second, per commit vs one bulk write. """
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+from heartpsalm import app, db
+from heartpsalm.helper_functions import write_messages
+from heartpsalm.models import User, ChatMessage, ChatSession
+
+
+def per_message_commits(user_id, session_id, turn):
+    """The previous write path: one ORM add and commit per message."""
+    for role, content in (("user", f"Hello {turn}"), ("assistant", "Hi!")):
+        db.session.add(ChatMessage(
+            user_id=user_id, role=role, content=content,
+            timestamp=datetime.now(timezone.utc), session_id=session_id
+        ))
+        db.session.commit()
+
+
+def bulk_write(user_id, session_id, turn):
+    """The turn writer: both messages in one insert and one commit."""
+    now = datetime.now(timezone.utc)
+    write_messages(user_id, session_id, [
+        ("user", f"Hello {turn}", now),
+        ("assistant", "Hi!", now),
+    ])
+
+
+def main():
+    """Stores the same turns both ways against SQLALCHEMY_DATABASE_URI."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        print(f"database  {db.engine.url.render_as_string()}")
+        user = User(
+            username="bench", email_address=f"{uuid.uuid4()}@bench.local",
+            password_hash="not-a-real-hash"
+        )
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        try:
+            for name, write in (("per message", per_message_commits),
+                                ("bulk turn", bulk_write)):
+                session_id = str(uuid.uuid4())
+                started = time.perf_counter()
+                for turn in range(args.turns):
+                    write(user_id, session_id, turn)
+                elapsed = time.perf_counter() - started
+                print(f"{name:<12}{args.turns / elapsed:8.1f} turns/s")
+        finally:
+            for model in (ChatMessage, ChatSession):
+                model.query.filter_by(user_id=user_id).delete()
+            db.session.delete(db.session.get(User, user_id))
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
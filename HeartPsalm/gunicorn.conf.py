@@ -0,0 +1,69 @@
+""" Gunicorn settings, picked up automatically from this directory. """
+import os
+import time
+
+# "sync" (default) or "gevent" for the async worker profile
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+
+# Concurrent requests each gevent worker will hold open
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Streamed chat replies can take a while to finish
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Create the Gemini models and open the client's channel in each worker
+# before it serves requests, so the first chat turn skips that setup
+warm_gemini = os.getenv("GEMINI_WARM_ON_BOOT", "false").lower() == "true"
+
+
+def post_worker_init(worker):
+    """
+    Warms the worker's Gemini models once the app is loaded, and starts
+        its password pool under an async worker class so the first login
+        does not wait for it.
+    """
+    if warm_gemini:
+        from heartpsalm.model_registry import warm_models
+        warm_models()
+    from heartpsalm import passwords
+    # `-k` on the command line overrides GUNICORN_WORKER_CLASS
+    passwords.WORKER_CLASS = worker.cfg.worker_class_str
+    passwords.start_pool()
+
+
+# Chat turns queued in write-behind mode are stored before a worker exits
+write_behind = os.getenv("WRITE_BEHIND", "false").lower() == "true"
+
+
+def worker_exit(server, worker):
+    """Stores the chat turns still queued in write-behind mode."""
+    if write_behind:
+        from heartpsalm.write_behind import write_queue
+        write_queue.shutdown()
+
+
+# Workers share their metrics through METRICS_DIR, see heartpsalm.metrics
+metrics_dir = os.getenv("METRICS_DIR", "")
+
+
+def on_starting(server):
+    """Clears the metrics left by a previous run of the server."""
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith("metrics-") and name.endswith(".json"):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    """
+    Keeps an exited worker's metrics in the totals under a name a new
+        worker with the same pid cannot overwrite. The next scrape folds
+        the file into the exited workers' totals.
+    """
+    if not metrics_dir:
+        return
+    path = os.path.join(metrics_dir, f"metrics-{worker.pid}.json")
+    if os.path.exists(path):
+        os.replace(path, os.path.join(
+            metrics_dir, f"metrics-{worker.pid}-exited-{time.time_ns()}.json"
+        ))
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import sys
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
@@ -20,10 +21,22 @@ app = Flask(__name__)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("SQLALCHEMY_DATABASE_URI")
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
 
+# Connection pool sizing, e.g. for the gevent worker profile
+if os.getenv("SQLALCHEMY_POOL_SIZE"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": int(os.getenv("SQLALCHEMY_POOL_SIZE")),
+        "max_overflow": int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "10"))
+    }
+
+# bcrypt cost factor for new hashes; older hashes are redone on login
+app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+
 # Database setup
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
+# Each revision commits on its own, so one that stops the upgrade keeps the
+# ones before it applied and the upgrade resumes from there
+migrate = Migrate(app, db, transaction_per_migration=True)
 login_manager = LoginManager(app)
 login_manager.login_view = "login_page"
 login_manager.login_message_category = "info"
@@ -47,7 +60,32 @@ client_credentials_manager = SpotifyClientCredentials(
 )
 sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
 
+# Alternative Spotify host, e.g. the load test's local stand-in
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL")
+if SPOTIFY_API_URL:
+    sp.prefix = f"{SPOTIFY_API_URL.rstrip('/')}/v1/"
+    client_credentials_manager.OAUTH_TOKEN_URL = (
+        f"{SPOTIFY_API_URL.rstrip('/')}/api/token"
+    )
+
 # Generative AI Setup
-genai.configure(api_key=os.getenv("GENERATIVE_AI_API_KEY"))
+# Under gevent workers, gRPC must use gevent's event loop to cooperate
+if "gevent" in sys.modules:
+    from gevent import monkey
+    if monkey.is_module_patched("socket"):
+        import grpc.experimental.gevent
+        grpc.experimental.gevent.init_gevent()
+
+# Alternative Gemini host, e.g. the load test's local stand-in; an
+# http:// endpoint needs GENERATIVE_AI_TRANSPORT=rest
+GENERATIVE_AI_ENDPOINT = os.getenv("GENERATIVE_AI_ENDPOINT")
+genai.configure(
+    api_key=os.getenv("GENERATIVE_AI_API_KEY"),
+    transport=os.getenv("GENERATIVE_AI_TRANSPORT"),
+    client_options=(
+        {"api_endpoint": GENERATIVE_AI_ENDPOINT}
+        if GENERATIVE_AI_ENDPOINT else None
+    )
+)
 
-from heartpsalm import routes
+from heartpsalm import routes, commands
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+""" Flask CLI commands for maintaining the app. """
+import click
+import numpy as np
+from collections import Counter
+from heartpsalm import app, db, sp
+from heartpsalm import intent_classifier
+from heartpsalm.context_builder import context_report
+from heartpsalm.core_functions import EMOTIONS
+from heartpsalm.models import ChatConfiguration, ChatMessage, GospelTrack
+from heartpsalm.sentiment import detect_emotions
+
+
+@app.cli.command("intent-train")
+def intent_train():
+    """Trains the local intent model and saves its weights."""
+    examples = intent_classifier.load_examples(intent_classifier.TRAIN_PATH)
+    weights = intent_classifier.train(examples)
+    np.save(intent_classifier.WEIGHTS_PATH, weights)
+    click.echo(
+        f"Trained on {len(examples)} examples, "
+        f"saved to {intent_classifier.WEIGHTS_PATH}"
+    )
+
+
+@app.cli.command("intent-eval")
+def intent_eval():
+    """Reports the local intent classifier's accuracy and escalation rate."""
+    examples = intent_classifier.load_examples(intent_classifier.EVAL_PATH)
+    report = intent_classifier.evaluate(examples)
+    click.echo(f"Examples:        {report['examples']}")
+    click.echo(f"Escalation rate: {report['escalation_rate']:.1%}")
+    click.echo(f"Local accuracy:  {report['local_accuracy']:.1%}")
+
+
+@app.cli.command("emotion-report")
+@click.option("--batch-size", default=1000, help="Messages scored per batch.")
+def emotion_report(batch_size):
+    """Counts the detected emotion of every stored user message."""
+    counts = Counter()
+    contents = db.session.execute(
+        db.select(ChatMessage.content)
+        .filter_by(role='user')
+        .execution_options(yield_per=batch_size)
+    ).scalars()
+    for batch in contents.partitions():
+        counts.update(detect_emotions(batch))
+
+    for emotion, count in counts.most_common():
+        click.echo(f"{emotion:<12}{count}")
+
+
+@app.cli.command("context-report")
+@click.option("--budget", default=None, type=int, help="Token budget.")
+def context_report_command(budget):
+    """Compares prompt tokens per turn with and without the budget."""
+    instructions = [
+        config.content for config in ChatConfiguration.query if config.content
+    ]
+    report = context_report(instructions, budget)
+    click.echo(f"Turns:            {report['turns']}")
+    click.echo(
+        "Full history:     mean {:.0f}, max {} tokens".format(
+            *report['full'])
+    )
+    click.echo(
+        "Budgeted context: mean {:.0f}, max {} tokens".format(
+            *report['budgeted'])
+    )
+
+
+@app.cli.command("harvest-tracks")
+@click.option("--pages", default=4, help="Result pages fetched per query.")
+@click.option("--page-size", default=50, help="Tracks per page (max 50).")
+@click.option(
+    "--keyword", "keywords", multiple=True, default=["gospel"],
+    help="Search keyword combined with each emotion; repeatable."
+)
+def harvest_tracks(pages, page_size, keywords):
+    """Pages through Spotify searches to fill the local track catalog."""
+    for emotion in EMOTIONS:
+        known = {
+            track.spotify_id: track
+            for track in GospelTrack.query.filter_by(emotion=emotion)
+        }
+        for keyword in keywords:
+            for page in range(pages):
+                results = sp.search(
+                    q=f"{keyword} {emotion}", type='track',
+                    limit=page_size, offset=page * page_size
+                )
+                items = results['tracks']['items']
+                for item in items:
+                    track = known.get(item['id'])
+                    if track is None:
+                        track = GospelTrack(
+                            spotify_id=item['id'], emotion=emotion
+                        )
+                        known[item['id']] = track
+                        db.session.add(track)
+                    track.name = item['name']
+                    track.artist = item['artists'][0]['name']
+                    track.url = item['external_urls']['spotify']
+                    track.popularity = item.get('popularity', 0)
+                if len(items) < page_size:
+                    break
+        db.session.commit()
+        click.echo(f"{emotion:<12}{len(known)} tracks")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+""" Process-local cache of the chat instructions. """
+from heartpsalm import cache
+from heartpsalm.helper_functions import build_gemini_history
+from heartpsalm.models import ChatConfiguration
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+import os
+import threading
+import time
+import uuid
+
+CONFIG_VERSION_KEY = "chat_config_version"
+
+# How often a worker checks the shared version for admin edits
+CONFIG_CHECK_SECONDS = float(os.getenv("CONFIG_CHECK_SECONDS", "5"))
+
+# Detached copy of a ChatConfiguration row, safe to share across requests
+Instruction = namedtuple("Instruction", ["role", "content"])
+
+ChatInstructions = namedtuple(
+    "ChatInstructions",
+    ["user", "assistant", "history_prefix", "version", "checked_at"]
+)
+
+_lock = threading.Lock()
+_instructions = None
+
+
+def _load(version):
+    """Reads both instructions with one query and builds the prefix."""
+    by_role = {
+        config.role: Instruction(config.role, config.content)
+        for config in ChatConfiguration.query.filter(
+            ChatConfiguration.role.in_(("user", "assistant"))
+        )
+    }
+    user = by_role.get("user")
+    assistant = by_role.get("assistant")
+    return ChatInstructions(
+        user, assistant,
+        tuple(build_gemini_history(user, assistant, [])),
+        version, time.monotonic()
+    )
+
+
+def get_chat_instructions():
+    """
+    Returns the user and assistant instructions from process memory.
+    The shared version stamp is checked at most every CONFIG_CHECK_SECONDS
+        and the instructions are reloaded only when it has changed, so
+        edits reach every worker within seconds.
+
+    Returns:
+        ChatInstructions: The `user` and `assistant` instructions (either
+            may be None), and the Gemini `history_prefix` built from them.
+    """
+    global _instructions
+    current = _instructions
+    if current is not None and \
+            time.monotonic() - current.checked_at < CONFIG_CHECK_SECONDS:
+        return current
+
+    version = cache.get(CONFIG_VERSION_KEY)
+    with _lock:
+        if _instructions is not None and _instructions.version == version:
+            _instructions = _instructions._replace(checked_at=time.monotonic())
+        else:
+            _instructions = _load(version)
+        return _instructions
+
+
+def bump_config_version():
+    """
+    Publishes a new version stamp so every worker reloads the
+        instructions, starting with this one.
+    """
+    global _instructions
+    cache.set(CONFIG_VERSION_KEY, uuid.uuid4().hex, timeout=0)
+    with _lock:
+        _instructions = None
+
+
+@event.listens_for(ChatConfiguration, 'after_insert')
+@event.listens_for(ChatConfiguration, 'after_update')
+@event.listens_for(ChatConfiguration, 'after_delete')
+def chat_configuration_changed(mapper, connection, target):
+    """Flags the session so the version is bumped once it commits."""
+    object_session(target).info["chat_config_changed"] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_chat_configuration(session):
+    """Bumps the version after a commit that changed an instruction."""
+    if session.info.pop("chat_config_changed", False):
+        bump_config_version()
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_chat_configuration(session):
+    """Forgets a pending change that was rolled back."""
+    session.info.pop("chat_config_changed", None)
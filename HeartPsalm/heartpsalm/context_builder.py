@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+""" Builds the token-budgeted chat history sent to Gemini. """
+from heartpsalm import app, db, cache
+from heartpsalm import turn_executor
+from heartpsalm.core_functions import generative_ai_response
+from heartpsalm.helper_functions import get_message_page
+from heartpsalm.models import ChatMessage, ChatSession
+from sqlalchemy import and_, or_, update
+import os
+
+# Estimated tokens of instructions, summary and verbatim turns per prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# Messages read per page while filling the verbatim window
+CONTEXT_PAGE_SIZE = 50
+# Messages folded into the summary per Gemini call
+SUMMARY_BATCH_SIZE = 100
+SUMMARY_MAX_WORDS = 250
+
+SUMMARY_PREFIX = "Summary of our earlier conversation: "
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation between a user and "
+    "HeartPsalm, a caring assistant that recommends gospel songs. "
+    "Update the summary with the new messages below. Keep the user's "
+    "feelings, circumstances, requests and any songs already suggested. "
+    f"Reply with the updated summary only, at most {SUMMARY_MAX_WORDS} "
+    "words.\n\nCurrent summary:\n{summary}\n\nNew messages:\n{messages}"
+)
+
+
+def estimate_tokens(text):
+    """
+    Estimates the tokens of a text locally, at about four characters per
+        token, so building a prompt needs no count_tokens round trip.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+def _history_tokens(history):
+    """Estimates the tokens of Gemini history entries."""
+    return sum(
+        estimate_tokens(part) for entry in history for part in entry["parts"]
+    )
+
+
+def _is_summarized(message, chat_session):
+    """
+    Whether a message is already folded into the session summary. Rows
+        still pending in the write-behind queue have no id yet and come
+        after every stored message, so they never are.
+    """
+    if chat_session is None or chat_session.summary_through_id is None \
+            or message.id is None:
+        return False
+    position = (message.timestamp, message.id)
+    return position <= (
+        chat_session.summary_through_at, chat_session.summary_through_id
+    )
+
+
+def _summary_entries(chat_session):
+    """The history entry of a session's rolling summary, if it has one."""
+    if chat_session is None or not chat_session.summary:
+        return []
+    return [{"role": "user", "parts": [SUMMARY_PREFIX + chat_session.summary]}]
+
+
+def _latest_messages(user_id, session_id):
+    """Yields a session's messages newest first, a page at a time."""
+    before = None
+    while True:
+        messages, next_cursor = get_message_page(
+                user_id, session_id, before, CONTEXT_PAGE_SIZE
+            )
+        yield from reversed(messages)
+        if next_cursor is None:
+            return
+        before = (messages[0].timestamp, messages[0].id)
+
+
+def _fit_recent(messages, chat_session, used, budget):
+    """
+    Picks the verbatim window: the latest messages that still fit the
+        budget, stopping at the first one the summary already covers.
+
+    Args:
+        messages (iterable): The candidate messages, newest first.
+        chat_session (ChatSession): The session's summary row, or None.
+        used (int): The tokens already taken by instructions and summary.
+        budget (int): The token budget.
+
+    Returns:
+        tuple: The picked messages oldest first, the tokens used in
+            total, and whether unsummarized messages were left out.
+    """
+    recent = []
+    unsummarized = False
+    for message in messages:
+        if _is_summarized(message, chat_session):
+            break
+        tokens = estimate_tokens(message.content)
+        if used + tokens > budget:
+            unsummarized = True
+            break
+        recent.append(message)
+        used += tokens
+    recent.reverse()
+    return recent, used, unsummarized
+
+
+def build_context(history_prefix, user_id, session_id, budget=None):
+    """
+    Builds the history for the next turn within a token budget: the
+        instructions, the session's rolling summary, then as many of the
+        latest messages verbatim as still fit.
+    When older messages fall outside the window without being summarized,
+        the summary is brought up to date in the background.
+
+    Args:
+        history_prefix (tuple): The history entries of the instructions,
+            see `get_chat_instructions`.
+        user_id (str): The owner of the session.
+        session_id (str): The session the turn belongs to.
+        budget (int): Optional token budget, defaults to
+            CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        list: Dictionaries with the role and parts of each message.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    chat_session = ChatSession.query.filter_by(
+            user_id=user_id, session_id=session_id
+        ).first()
+    history = list(history_prefix) + _summary_entries(chat_session)
+    recent, used, unsummarized = _fit_recent(
+            _latest_messages(user_id, session_id), chat_session,
+            _history_tokens(history), budget
+        )
+    history.extend(
+            {"role": message.role, "parts": [message.content]}
+            for message in recent
+        )
+
+    if unsummarized:
+        # the oldest stored message in the window; pending rows are newer
+        # than every stored one, so without it all of them are folded
+        keep_from = next(
+                (
+                    (message.timestamp, message.id) for message in recent
+                    if message.id is not None
+                ),
+                None
+            )
+        schedule_summary_update(user_id, session_id, keep_from)
+
+    app.logger.info(
+            "turn context ~%d tokens: %d of %d messages verbatim, summary %s",
+            used, len(recent),
+            chat_session.message_count if chat_session is not None else 0,
+            "yes" if chat_session is not None and chat_session.summary
+            else "no"
+        )
+    return history
+
+
+def schedule_summary_update(user_id, session_id, keep_from):
+    """
+    Starts folding a session's older messages into its summary on the turn
+        pool, unless an update for the session is already running.
+
+    Args:
+        user_id (str): The owner of the session.
+        session_id (str): The session to summarize.
+        keep_from (tuple): The (timestamp, id) of the oldest verbatim
+            message; only older messages are folded. None folds all.
+    """
+    lock = f"context_summary:{user_id}:{session_id}"
+    if cache.add(lock, True, timeout=300):
+        turn_executor.submit(
+                "update_session_summary", update_session_summary,
+                user_id, session_id, keep_from, lock
+            )
+
+
+def update_session_summary(user_id, session_id, keep_from, lock=None):
+    """
+    Folds the messages between the summary and the verbatim window into
+        the session's rolling summary, a batch per Gemini call, so each
+        message is summarized once.
+
+    Args:
+        user_id (str): The owner of the session.
+        session_id (str): The session to summarize.
+        keep_from (tuple): The (timestamp, id) of the oldest verbatim
+            message, or None to fold every message.
+        lock (str): Optional cache key released when done.
+
+    Returns:
+        str: The updated summary.
+    """
+    try:
+        chat_session = ChatSession.query.filter_by(
+                user_id=user_id, session_id=session_id
+            ).first()
+        if chat_session is None:
+            return None
+        summary = chat_session.summary or ""
+        through_at = chat_session.summary_through_at
+        through_id = chat_session.summary_through_id
+
+        while True:
+            query = ChatMessage.query.filter_by(
+                    user_id=user_id, session_id=session_id
+                )
+            if through_id is not None:
+                query = query.filter(or_(
+                        ChatMessage.timestamp > through_at,
+                        and_(
+                            ChatMessage.timestamp == through_at,
+                            ChatMessage.id > through_id
+                        )
+                    ))
+            if keep_from is not None:
+                query = query.filter(or_(
+                        ChatMessage.timestamp < keep_from[0],
+                        and_(
+                            ChatMessage.timestamp == keep_from[0],
+                            ChatMessage.id < keep_from[1]
+                        )
+                    ))
+            messages = query.order_by(
+                    ChatMessage.timestamp, ChatMessage.id
+                ).limit(SUMMARY_BATCH_SIZE).all()
+            if not messages:
+                break
+
+            transcript = "\n".join(
+                    f"{message.role}: {message.content}"
+                    for message in messages
+                )
+            reply = generative_ai_response(
+                    SUMMARY_PROMPT.format(
+                        summary=summary or "(none yet)",
+                        messages=transcript
+                    ),
+                    [], kind="summary"
+                )
+            if reply.startswith("Error"):
+                print(f"Error updating the session summary: {reply}")
+                break
+
+            summary = reply.strip()
+            through_at, through_id = messages[-1].timestamp, messages[-1].id
+            db.session.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == chat_session.id)
+                    .values(
+                        summary=summary,
+                        summary_through_at=through_at,
+                        summary_through_id=through_id
+                    )
+                )
+            db.session.commit()
+        return summary
+    finally:
+        if lock:
+            cache.delete(lock)
+
+
+def context_report(instructions, budget=None):
+    """
+    Replays every stored session to compare the estimated prompt tokens
+        per turn when the full history is sent against the context
+        `build_context` selects. Each turn is measured with the messages
+        before it; the session's stored summary counts from the first
+        turn after the messages it covers, and before that turn the
+        window is only cut by the budget.
+
+    Args:
+        instructions (list): Texts of the configured instructions.
+        budget (int): Optional token budget, defaults to
+            CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        dict: The number of turns and the mean and max tokens per turn
+            with the full history and with the budgeted context.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    fixed = sum(estimate_tokens(text) for text in instructions)
+    full = []
+    budgeted = []
+
+    for chat_session in ChatSession.query.all():
+        messages = db.session.execute(
+            db.select(
+                ChatMessage.id, ChatMessage.timestamp, ChatMessage.role,
+                ChatMessage.content
+            )
+            .filter_by(
+                user_id=chat_session.user_id,
+                session_id=chat_session.session_id
+            )
+            .order_by(ChatMessage.timestamp, ChatMessage.id)
+        ).all()
+        summary_tokens = _history_tokens(_summary_entries(chat_session))
+        history = 0
+        for position, message in enumerate(messages):
+            if message.role == "user":
+                full.append(fixed + history)
+                summarized = _is_summarized(
+                        messages[0], chat_session
+                    ) and not _is_summarized(message, chat_session)
+                _, used, _ = _fit_recent(
+                        reversed(messages[:position]),
+                        chat_session if summarized else None,
+                        fixed + (summary_tokens if summarized else 0),
+                        budget
+                    )
+                budgeted.append(used)
+            history += estimate_tokens(message.content)
+
+    def stats(values):
+        """Mean and max of a list, or zeros when it is empty."""
+        return (sum(values) / len(values), max(values)) if values else (0, 0)
+
+    return {
+        "turns": len(full),
+        "full": stats(full),
+        "budgeted": stats(budgeted),
+    }
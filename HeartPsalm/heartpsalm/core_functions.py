@@ -1,89 +1,413 @@
 #!/usr/bin/env python3
 """ Core logic of the app. """
-from heartpsalm import app, genai, sp
+from heartpsalm import app, sp, cache
+import json
+import os
 import random
-from heartpsalm.models import ChatMessage
+import time
+from markupsafe import escape
+from heartpsalm.models import ChatMessage, GospelTrack
+from heartpsalm.intent_classifier import classify_intent
+from heartpsalm.sentiment import detect_emotion
+from heartpsalm import (
+        llm_providers, metrics, response_cache, semantic_cache,
+        turn_executor, verses)
 
+EMOTIONS = ("joyful", "worship", "comforting", "praise")
 
-def search_gospel_song(emotion):
+# "spotify" or "catalog" to serve songs from the harvested GospelTrack table
+SONG_SOURCE = os.getenv("SONG_SOURCE", "spotify")
+
+# Tracks recently recommended to a user are skipped for a while
+RECENT_TRACKS_LIMIT = 20
+RECENT_TRACKS_SECONDS = 12 * 60 * 60
+
+# Cached track pools are refreshed in the background once this old
+TRACK_POOL_FRESH_SECONDS = int(os.getenv("TRACK_POOL_FRESH_SECONDS", "21600"))
+# and are dropped from the cache entirely once this old
+TRACK_POOL_MAX_AGE_SECONDS = int(
+    os.getenv("TRACK_POOL_MAX_AGE_SECONDS", "604800")
+)
+
+
+@metrics.timed("search_gospel_song")
+def search_gospel_song(emotion, user_id=None):
     """
     Searches for an uplifting gospel song based on the user's emotion.
+    Picks from the local catalog when SONG_SOURCE is "catalog", otherwise
+        (or when the catalog has nothing for the emotion) from the cached
+        Spotify track pool, so most requests do not reach Spotify.
 
     Args:
         emotion (str): The user's emotion.
+        user_id (str): Optional user, whose recently recommended tracks
+            are skipped.
 
     Returns:
         str: Song recommendation or error message.
     """
     try:
-        query = f"gospel {emotion}"
-        results = sp.search(q=query, limit=20, type='track')
-
-        if results['tracks']['items']:
-            song = random.choice(results['tracks']['items'])
-            song_name = song['name']
-            song_artist = song['artists'][0]['name']
-            song_url = song['external_urls']['spotify']
-            song_recommendation = (
-                    f"<div>I found a gospel song for you: "
-                    f"<strong>'{song_name}'</strong> by <em>{song_artist}</em>. "
-                    f'<a href="{song_url}" target="_blank" class="spotify-btn">'
-                    '<i class="fab fa-spotify"></i> Listen on Spotify</a>'
-                    "</div>"
-                )
-            return song_recommendation
-        else:
-            return "Sorry, I couldn't find a gospel song for that emotion."
+        return recommend_track(find_tracks(emotion), user_id)
+    except Exception as e:
+        return f"Error searching for a song: {str(e)}"
+
+
+def find_tracks(emotion):
+    """
+    Finds the candidate tracks for an emotion, see `search_gospel_song`.
+    Touches no per-user state, so it is safe to run speculatively.
+
+    Args:
+        emotion (str): The user's emotion.
+
+    Returns:
+        list: Track dictionaries, empty if none were found.
+    """
+    tracks = None
+    if SONG_SOURCE == "catalog":
+        tracks = get_catalog_tracks(emotion)
+    if not tracks:
+        tracks = get_track_pool(emotion)
+    return tracks or []
+
+
+def recommend_track(tracks, user_id=None):
+    """
+    Picks one of the candidate tracks and formats it as a song card.
+    The pick is remembered as recently recommended to the user, so call
+        this only once the song is going to be shown.
+
+    Args:
+        tracks (list): Candidate track dictionaries.
+        user_id (str): Optional user the track is recommended to.
+
+    Returns:
+        str: Song recommendation or a message that none was found.
+    """
+    if not tracks:
+        return "Sorry, I couldn't find a gospel song for that emotion."
+    song = pick_track(tracks, user_id)
+    return (
+            f"<div>I found a gospel song for you: "
+            f"<strong>'{escape(song['name'])}'</strong> by "
+            f"<em>{escape(song['artist'])}</em>. "
+            f'<a href="{escape(song["url"])}" target="_blank" '
+            'class="spotify-btn">'
+            '<i class="fab fa-spotify"></i> Listen on Spotify</a>'
+            "</div>"
+        )
+
+
+def recommend_found_track(tracks, user_id=None):
+    """
+    Recommends a track from a speculative `find_tracks` call once the
+        turn plan has chosen the song.
+
+    Args:
+        tracks (concurrent.futures.Future): The pending `find_tracks`.
+        user_id (str): Optional user the track is recommended to.
+
+    Returns:
+        str: Song recommendation or error message.
+    """
+    try:
+        return recommend_track(tracks.result(), user_id)
     except Exception as e:
         return f"Error searching for a song: {str(e)}"
 
 
-def generative_ai_response(user_message, chat_history):
+def pick_track(tracks, user_id=None):
+    """
+    Picks a track at random, weighted by popularity, skipping the tracks
+        recently recommended to the user unless none would be left.
+
+    Args:
+        tracks (list): Candidate track dictionaries.
+        user_id (str): Optional user the track is recommended to.
+
+    Returns:
+        dict: The chosen track.
+    """
+    recent_key = f"recent_tracks:{user_id}"
+    recent = (cache.get(recent_key) or []) if user_id else []
+
+    candidates = [
+            track for track in tracks if track.get("id") not in recent
+        ] or tracks
+    song = random.choices(
+            candidates,
+            weights=[track.get("popularity", 0) + 1 for track in candidates]
+        )[0]
+
+    if user_id and song.get("id"):
+        cache.set(
+                recent_key,
+                (recent + [song["id"]])[-RECENT_TRACKS_LIMIT:],
+                timeout=RECENT_TRACKS_SECONDS
+            )
+    return song
+
+
+def get_catalog_tracks(emotion):
+    """
+    Reads the locally harvested tracks tagged with an emotion.
+
+    Args:
+        emotion (str): The user's emotion.
+
+    Returns:
+        list: Track dictionaries, empty if nothing was harvested.
+    """
+    return [
+            track.to_dict()
+            for track in GospelTrack.query.filter_by(emotion=emotion)
+        ]
+
+
+def get_track_pool(emotion):
+    """
+    Returns the pool of gospel tracks for an emotion from the cache.
+    A pool older than TRACK_POOL_FRESH_SECONDS is still served while a
+        background refresh fetches a new one (stale-while-revalidate).
+    Spotify is only searched inline when no pool is cached at all.
+
+    Args:
+        emotion (str): The user's emotion.
+
+    Returns:
+        list: Dictionaries with the name, artist and url of each track.
+    """
+    pool = cache.get(f"track_pool:{emotion}")
+    if pool is None:
+        return refresh_track_pool(emotion)
+
+    is_stale = time.time() - pool["fetched_at"] > TRACK_POOL_FRESH_SECONDS
+    if is_stale and cache.add(f"track_pool_refresh:{emotion}", True,
+                              timeout=60):
+        turn_executor.submit(
+                "refresh_track_pool", refresh_track_pool, emotion
+            )
+    return pool["tracks"]
+
+
+def refresh_track_pool(emotion):
+    """
+    Searches Spotify for gospel tracks matching an emotion and caches them.
+
+    Args:
+        emotion (str): The user's emotion.
+
+    Returns:
+        list: The fetched tracks, see `get_track_pool`.
+    """
+    try:
+        with metrics.span("spotify_search"):
+            results = sp.search(
+                    q=f"gospel {emotion}", limit=20, type='track'
+                )
+        tracks = [
+                {
+                    "id": item['id'],
+                    "name": item['name'],
+                    "artist": item['artists'][0]['name'],
+                    "url": item['external_urls']['spotify'],
+                    "popularity": item.get('popularity', 0),
+                }
+                for item in results['tracks']['items']
+            ]
+        if tracks:
+            cache.set(
+                    f"track_pool:{emotion}",
+                    {"tracks": tracks, "fetched_at": time.time()},
+                    timeout=TRACK_POOL_MAX_AGE_SECONDS
+                )
+        return tracks
+    finally:
+        cache.delete(f"track_pool_refresh:{emotion}")
+
+
+@metrics.timed("generative_ai_response")
+def generative_ai_response(user_message, chat_history, kind="reply",
+                           instructions=None):
     """
     Generates a response from the AI model using
         the user's message and chat history.
+    The provider and model answering depend on the kind of call, see
+        `llm_providers.route`.
 
     Args:
         user_message (str): The user's input message.
         chat_history (list): A list of past chat messages.
+        kind (str): The kind of call, one of `llm_providers.CALL_KINDS`.
+        instructions (str): Optional instructions to describe the message
+            as a JSON object instead of replying to it.
 
     Returns:
         str: The AI's generated response or an error message.
     """
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-
-        gemini_history = []
-        for message in chat_history:
-            if isinstance(message, ChatMessage):
-                gemini_history.append(
-                        {
-                            "role": message.role,
-                            "parts": [message.content],
-                            }
-                    )
-            elif isinstance(message, dict):
-                gemini_history.append(message)
-            elif isinstance(message, str):
-                gemini_history.append({"role": "user", "parts": [message]})
-            else:
-                print(f"Type: {type(message)}, value: {message}")
-                return "Error: Unexpected message type in chat history."
-
-        chat = model.start_chat(history=gemini_history)
-        response = chat.send_message(user_message)
-
-        return response.text
+        provider, model = llm_providers.route(kind)
+
+        gemini_history = _to_gemini_history(chat_history)
+        if gemini_history is None:
+            return "Error: Unexpected message type in chat history."
+
+        if instructions is not None:
+            return provider.classify(
+                    user_message, instructions, gemini_history, model
+                )
+        return provider.generate(user_message, gemini_history, model)
 
     except Exception as e:
         return f"Error generating response: {str(e)}"
 
 
+@metrics.timed("generative_ai_response_stream")
+def generative_ai_response_stream(user_message, chat_history):
+    """
+    Streams a response from the AI model using
+        the user's message and chat history.
+    Yields partial text as soon as the provider routed for "stream"
+        produces it instead of waiting for the whole reply.
+
+    Args:
+        user_message (str): The user's input message.
+        chat_history (list): A list of past chat messages.
+
+    Yields:
+        str: Successive chunks of the AI's response or an error message.
+    """
+    try:
+        provider, model = llm_providers.route("stream")
+
+        gemini_history = _to_gemini_history(chat_history)
+        if gemini_history is None:
+            yield "Error: Unexpected message type in chat history."
+            return
+
+        yield from provider.stream(user_message, gemini_history, model)
+
+    except Exception as e:
+        yield f"Error generating response: {str(e)}"
+
+
+def _to_gemini_history(chat_history):
+    """
+    Converts chat history entries into the format expected by Gemini.
+
+    Args:
+        chat_history (list): ChatMessage rows, dicts or plain strings.
+
+    Returns:
+        list: The Gemini history, or None if an entry has an unexpected type.
+    """
+    gemini_history = []
+    for message in chat_history:
+        if isinstance(message, ChatMessage):
+            gemini_history.append(
+                    {
+                        "role": message.role,
+                        "parts": [message.content],
+                        }
+                )
+        elif isinstance(message, dict):
+            gemini_history.append(message)
+        elif isinstance(message, str):
+            gemini_history.append({"role": "user", "parts": [message]})
+        else:
+            app.logger.debug(
+                    "unexpected chat history entry of type %s",
+                    type(message).__name__
+                )
+            return None
+    return gemini_history
+
+
+def plan_turn(user_input, chat_history, with_reply=True):
+    """
+    Plans a chat turn with a single structured model call: whether the
+        user wants a song, the emotion to match it to and, optionally,
+        the reply to send otherwise.
+
+    Args:
+        user_input (str): The user's input message.
+        chat_history (list): A list of past chat messages.
+        with_reply (bool): Whether Gemini should also write the reply.
+
+    Returns:
+        dict: `song_request` (bool), `emotion` (one of EMOTIONS) and
+            `reply` (str, empty when `with_reply` is False).
+    """
+    reply_key = (
+        ', "reply": your reply to the message as the HeartPsalm assistant'
+        if with_reply else ""
+    )
+    instructions = (
+        "Answer with a JSON object describing the user's message below. "
+        'Use the keys "song_request": true if the user is asking for a '
+        "song recommendation, false if they are asking about a particular "
+        "song (e.g. a song title or artist) or only describing their "
+        'feelings; "emotion": the one of '
+        f"{', '.join(EMOTIONS)} that best matches the user's mood"
+        f"{reply_key}."
+    )
+
+    # plans of context-free turns depend on the message alone
+    kind = "plan" if with_reply else "intent"
+    cacheable = (
+        not chat_history or response_cache.is_context_free(chat_history)
+    )
+    if cacheable:
+        plan = response_cache.lookup(kind, user_input)
+        if plan is not None:
+            return plan
+
+    response_text = generative_ai_response(
+            user_input, chat_history, kind=kind, instructions=instructions
+        )
+    plan = _parse_turn_plan(response_text, with_reply)
+    if cacheable and not response_text.startswith("Error"):
+        response_cache.store(kind, user_input, plan)
+    return plan
+
+
+def _parse_turn_plan(response_text, with_reply):
+    """
+    Parses the planner's JSON answer. Falls back to treating the whole
+        text as the reply when Gemini did not return valid JSON.
+
+    Args:
+        response_text (str): The raw text returned by Gemini.
+        with_reply (bool): Whether a reply was requested.
+
+    Returns:
+        dict: The turn plan, see `plan_turn`.
+    """
+    try:
+        plan = json.loads(response_text)
+        if not isinstance(plan, dict):
+            raise ValueError("Turn plan is not a JSON object.")
+    except (TypeError, ValueError):
+        return {
+            "song_request": False,
+            "emotion": "praise",
+            "reply": (response_text or "") if with_reply else "",
+        }
+
+    emotion = str(plan.get("emotion", "")).lower().strip()
+    return {
+        "song_request": plan.get("song_request") is True,
+        "emotion": emotion if emotion in EMOTIONS else "praise",
+        "reply": str(plan.get("reply", "")) if with_reply else "",
+    }
+
+
 def analyze_intent_with_gemini(user_input):
     """
     Analyzes the user's input to determine if they are asking
         for a song recommendation.
-    Uses a generative AI model to classify the input as a song request or not.
+    Decides locally when the input is clear-cut and only escalates
+        ambiguous inputs to Gemini through `plan_turn`.
 
     Args:
         user_input (str): The user's input message.
@@ -91,29 +415,17 @@ def analyze_intent_with_gemini(user_input):
     Returns:
         bool: True if a song recommendation request is implied, else False.
     """
-    prompt = (
-        "You are a helpful assistant. "
-        "Based on the following input, determine if the user is "
-        "asking for a song recommendation or inquiring about a specific "
-        "song. If the input implies that the user is looking for a song "
-        "suggestion, respond with 'yes'. If the user is asking about a "
-        "particular song (e.g., asking about a song title or artist), "
-        "respond with 'no'. If the user describes the user feelings and "
-        "it doesn't implies wanting a song reply with 'no'.\n"
-        f"Input: {user_input}\n"
-        "Does this input indicate interest in a song recommendation? "
-        "Respond with 'yes' or 'no':"
-    )
-
-    response_text = generative_ai_response(prompt, chat_history=[])
-    if response_text:
-        return response_text.lower().strip() == "yes"
-    return False
+    is_song_request = classify_intent(user_input)
+    if is_song_request is not None:
+        return is_song_request
+    return plan_turn(user_input, [], with_reply=False)["song_request"]
 
 
 def detect_sentiment_with_gemini(user_input):
     """
-    Analyzes user's input sentiment using GeminiAI and maps it to an emotion.
+    Analyzes user's input sentiment and maps it to an emotion.
+    Runs the local lexicon scorer in `heartpsalm.sentiment`, so no
+        Gemini call is made despite the name.
 
     Args:
         user_input (str): The user's input message.
@@ -121,18 +433,166 @@ def detect_sentiment_with_gemini(user_input):
     Returns:
         str: The detected emotion, such as "joyful," "worship," etc."
     """
-    try:
-        # GeminiAI's sentiment analyser
-        sentiment = gemini_ai.analyze_sentiment(user_input)
-
-        # Map sentiment to emotion
-        if sentiment == "positive":
-            return "joyful"
-        elif sentiment == "neutral":
-            return "worship"
-        elif sentiment == "negative":
-            return "comforting"
-        else:
-            return "praise"
-    except Exception as e:
-        return "praise"
+    return detect_emotion(user_input)
+
+
+def reply_to_message(user_input, chat_history):
+    """
+    Gets Gemini's reply to a message. Routine "I feel X" messages may be
+        answered from the local verse corpus instead. Replies to the first
+        message of a session are served from the response cache when
+        possible, or from the semantic cache when a similar message was
+        answered before. Otherwise Gemini is given a few retrieved verses
+        to ground its reply.
+
+    Args:
+        user_input (str): The user's input message.
+        chat_history (list): A list of past chat messages.
+
+    Returns:
+        str: The AI's reply.
+    """
+    reply = verses.answer_from_verses(user_input)
+    if reply is not None:
+        return reply
+
+    cacheable = response_cache.is_context_free(chat_history)
+    if cacheable:
+        reply = response_cache.lookup("reply", user_input) or \
+            semantic_cache.lookup_reply(user_input)
+        if reply is not None:
+            return reply
+
+    reply = turn_executor.timed(
+            "generative_ai_response",
+            generative_ai_response, verses.ground_message(user_input),
+            chat_history
+        )
+    if cacheable and not reply.startswith("Error"):
+        response_cache.store("reply", user_input, reply)
+        semantic_cache.store_reply(user_input, reply)
+    return reply
+
+
+def reply_to_message_stream(user_input, chat_history):
+    """
+    Streaming counterpart of `reply_to_message`. A cached or retrieved
+        reply is sent as a single chunk; a streamed one is cached once
+        complete.
+
+    Args:
+        user_input (str): The user's input message.
+        chat_history (list): A list of past chat messages.
+
+    Yields:
+        str: Chunks of the AI's reply.
+    """
+    reply = verses.answer_from_verses(user_input)
+    if reply is not None:
+        yield reply
+        return
+
+    cacheable = response_cache.is_context_free(chat_history)
+    if cacheable:
+        reply = response_cache.lookup("reply", user_input) or \
+            semantic_cache.lookup_reply(user_input)
+        if reply is not None:
+            yield reply
+            return
+
+    parts = []
+    for chunk in generative_ai_response_stream(
+            verses.ground_message(user_input), chat_history):
+        parts.append(chunk)
+        yield chunk
+
+    reply = "".join(parts)
+    if cacheable and reply and not reply.startswith("Error"):
+        response_cache.store("reply", user_input, reply)
+        semantic_cache.store_reply(user_input, reply)
+
+
+def respond_to_message(user_input, chat_history, user_id=None):
+    """
+    Produces the assistant's response to a chat turn. Clear-cut intents
+        are decided locally and cost at most one external call. Ambiguous
+        ones are planned with a single structured Gemini call while the
+        track lookup runs speculatively alongside it; a track is only
+        picked for the user once the plan asks for a song.
+
+    Args:
+        user_input (str): The user's input message.
+        chat_history (list): A list of past chat messages.
+        user_id (str): Optional user, passed on to `search_gospel_song`.
+
+    Returns:
+        str: A song recommendation or the AI's reply.
+    """
+    is_song_request = classify_intent(user_input)
+    if is_song_request is False:
+        return reply_to_message(user_input, chat_history)
+
+    detected_emotion = detect_sentiment_with_gemini(user_input)
+    if is_song_request:
+        return turn_executor.timed(
+                "search_gospel_song", search_gospel_song, detected_emotion,
+                user_id=user_id
+            )
+
+    # only the track lookup runs ahead; picking one for the user is
+    # remembered, so it waits until the plan has chosen the song
+    tracks = turn_executor.submit(
+            "find_tracks", find_tracks, detected_emotion
+        )
+    turn_plan = turn_executor.timed(
+            "plan_turn", plan_turn, user_input, chat_history
+        )
+    if turn_plan["song_request"]:
+        return recommend_found_track(tracks, user_id)
+    tracks.cancel()
+    return turn_plan["reply"]
+
+
+def stream_response_to_message(user_input, chat_history, user_id=None):
+    """
+    Streaming counterpart of `respond_to_message`. For ambiguous inputs the
+        reply starts streaming and the track lookup starts while Gemini is
+        still deciding the intent; the losing branch is discarded.
+
+    Args:
+        user_input (str): The user's input message.
+        chat_history (list): A list of past chat messages.
+        user_id (str): Optional user, passed on to `search_gospel_song`.
+
+    Yields:
+        str: Chunks of the song recommendation or the AI's reply.
+    """
+    is_song_request = classify_intent(user_input)
+    if is_song_request is False:
+        yield from reply_to_message_stream(user_input, chat_history)
+        return
+
+    detected_emotion = detect_sentiment_with_gemini(user_input)
+    if is_song_request:
+        yield turn_executor.timed(
+                "search_gospel_song", search_gospel_song, detected_emotion,
+                user_id=user_id
+            )
+        return
+
+    reply = turn_executor.SpeculativeStream(
+            "generative_ai_response_stream",
+            reply_to_message_stream, user_input, chat_history
+        )
+    tracks = turn_executor.submit(
+            "find_tracks", find_tracks, detected_emotion
+        )
+    turn_plan = turn_executor.timed(
+            "plan_turn", plan_turn, user_input, [], with_reply=False
+        )
+    if turn_plan["song_request"]:
+        reply.cancel()
+        yield recommend_found_track(tracks, user_id)
+    else:
+        tracks.cancel()
+        yield from reply
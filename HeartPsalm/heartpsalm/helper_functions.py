@@ -1,29 +1,146 @@
 #!/usr/bin/env python3
 """ Helper functions. """
-from heartpsalm import db, cache
+from heartpsalm import db, cache, metrics
 from flask import session
-from heartpsalm.models import ChatMessage
-from datetime import datetime
+from heartpsalm.models import ChatMessage, ChatSession, record_chat_messages
+from heartpsalm.rendering import render_message
+from datetime import datetime, timezone
+from sqlalchemy import and_, event, insert, or_
+from sqlalchemy.orm import Session, object_session
+import os
+import threading
 import uuid
-import re
 
+# Messages rendered with the chat page and returned per history page
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))
 
-def process_message_for_bold_and_paragraphs(text):
+# Rows queued by the write-behind mode, by (user_id, session_id)
+_pending_lock = threading.Lock()
+_pending_rows = {}
+
+
+def build_gemini_history(user_instruction, assistant_instruction, messages):
+    """
+    Builds the history sent to Gemini: the configured instructions
+        followed by the session's previous messages.
+
+    Args:
+        user_instruction (ChatConfiguration): The user role instruction.
+        assistant_instruction (ChatConfiguration): The assistant instruction.
+        messages (list): The session's ChatMessage rows, oldest first.
+
+    Returns:
+        list: Dictionaries with the role and parts of each message.
+    """
+    chat_history_for_gemini = []
+    if user_instruction:
+        chat_history_for_gemini.append(
+                {
+                    "role": "user",
+                    "parts": [user_instruction.content]
+                }
+            )
+
+    if assistant_instruction:
+        chat_history_for_gemini.append(
+                {
+                    "role": "assistant",
+                    "parts": [assistant_instruction.content]
+                }
+            )
+
+    for message in messages:
+        chat_history_for_gemini.append(
+                {
+                    "role": message.role,
+                    "parts": [message.content]
+                }
+            )
+
+    return chat_history_for_gemini
+
+
+def encode_cursor(message):
+    """
+    Builds the opaque cursor pointing just before a message.
+
+    Returns:
+        str: The message's timestamp and id.
+    """
+    return f"{message.timestamp.isoformat()}_{message.id}"
+
+
+def decode_cursor(cursor):
+    """
+    Parses a cursor made by `encode_cursor`.
+
+    Returns:
+        tuple: The timestamp and id of the message, or None if the
+            cursor is malformed.
+    """
+    try:
+        timestamp, message_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_message_page(user_id, session_id, before=None, limit=None):
     """
-    Converts text surrounded by `**` for bold formatting.
-    Converts text that spans multiple lines into paragraphs.
-    Ignores text that already contains HTML tags to avoid altering them.
+    Fetches one page of a session's messages with keyset pagination on
+        (timestamp, id), so each page costs the same however long the
+        session has grown.
+
+    Args:
+        user_id (int): The owner of the session.
+        session_id (str): The session to read.
+        before (tuple): Optional decoded cursor; only messages older than
+            it are returned. Defaults to the latest messages.
+        limit (int): The maximum number of messages in the page,
+            defaults to CHAT_PAGE_SIZE.
 
-    Returns: str: The processed text with bold formatting and paragraph tags.
+    Returns:
+        tuple: The page's ChatMessage rows oldest first, and the cursor of
+            the next older page or None when there are no older messages.
+            The latest page ends with any messages still pending in the
+            write-behind queue, as unsaved ChatMessage objects.
     """
-    if '<' in text and '>' in text:
-        return f'<div class="message-content">{text}</div>'
+    limit = limit or CHAT_PAGE_SIZE
+    query = ChatMessage.query.filter_by(
+            user_id=user_id, session_id=session_id
+        )
+    if before is not None:
+        timestamp, message_id = before
+        query = query.filter(or_(
+                ChatMessage.timestamp < timestamp,
+                and_(
+                    ChatMessage.timestamp == timestamp,
+                    ChatMessage.id < message_id
+                )
+            ))
+
+    # one extra row tells whether an older page exists
+    messages = query.order_by(
+            ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+        ).limit(limit + 1).all()
 
-    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
-    text = text.replace('*', '')
-    text = re.sub(r'([^\n]+)', r'<p>\1</p>', text)
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1])
+    messages.reverse()
 
-    return text
+    # the latest page also shows writes still queued for the database
+    if before is None:
+        stored = {
+            (msg.timestamp, msg.role, msg.content) for msg in messages
+        }
+        messages.extend(
+            ChatMessage(**row)
+            for row in get_pending_rows(user_id, session_id)
+            if (row["timestamp"], row["role"], row["content"]) not in stored
+        )
+    return messages, next_cursor
 
 
 def generate_session_id():
@@ -58,6 +175,120 @@ def load_chat_history(user_id, session_id):
     return chat_history
 
 
+def build_message_rows(user_id, session_id, messages):
+    """
+    Turns a turn's messages into ChatMessage rows ready to insert,
+        rendering each message and normalizing timestamps to naive UTC
+        as the database returns them.
+
+    Args:
+        user_id (int): The owner of the session.
+        session_id (str): The session the messages belong to.
+        messages (list): (role, content, timestamp) tuples, oldest first.
+
+    Returns:
+        list: One dictionary per message.
+    """
+    rows = []
+    for role, content, timestamp in messages:
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        rows.append(
+            {
+                "user_id": user_id,
+                "session_id": session_id,
+                "role": role,
+                "content": content,
+                "rendered_html": render_message(content, role),
+                "timestamp": timestamp,
+            }
+        )
+    return rows
+
+
+def store_message_rows(rows):
+    """
+    Inserts rows from `build_message_rows` with one bulk INSERT and
+        updates their session summaries, committed as a single
+        transaction. The cached history and preview of each session are
+        invalidated once the transaction commits.
+
+    Args:
+        rows (list): The rows to insert, oldest first per session.
+    """
+    sessions = {}
+    for row in rows:
+        sessions.setdefault((row["user_id"], row["session_id"]), []).append(
+            (row["timestamp"], row["content"])
+        )
+    try:
+        # a bulk insert skips the mapper events, so the summaries are
+        # recorded here on the same connection
+        db.session.execute(insert(ChatMessage), rows)
+        for (user_id, session_id), messages in sessions.items():
+            record_chat_messages(
+                db.session.connection(), user_id, session_id, messages
+            )
+            mark_chat_changed(db.session(), user_id, session_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def write_messages(user_id, session_id, messages):
+    """
+    Stores a turn's messages in one transaction, see `store_message_rows`.
+
+    Args:
+        user_id (int): The owner of the session.
+        session_id (str): The session the messages belong to.
+        messages (list): (role, content, timestamp) tuples, oldest first.
+
+    Returns:
+        list: The inserted rows as dictionaries, including the
+            `rendered_html` of each message.
+    """
+    rows = build_message_rows(user_id, session_id, messages)
+    store_message_rows(rows)
+    return rows
+
+
+def add_pending_rows(rows):
+    """
+    Makes rows queued for a later write visible to `get_message_page`,
+        so a user always reads their own writes.
+    """
+    with _pending_lock:
+        for row in rows:
+            _pending_rows.setdefault(
+                (row["user_id"], row["session_id"]), []
+            ).append(row)
+
+
+def discard_pending_rows(rows):
+    """Removes rows from the pending overlay once they are stored."""
+    with _pending_lock:
+        for row in rows:
+            key = (row["user_id"], row["session_id"])
+            pending = _pending_rows.get(key, [])
+            if row in pending:
+                pending.remove(row)
+            if not pending:
+                _pending_rows.pop(key, None)
+
+
+def get_pending_rows(user_id, session_id):
+    """
+    Returns the rows of a session still waiting to be written.
+
+    Returns:
+        list: The pending rows, oldest first.
+    """
+    with _pending_lock:
+        return list(_pending_rows.get((user_id, session_id), ()))
+
+
 def save_chat_history(user_id, session_id, chat_history):
     """
     Saves the chat history to the database for a specific user and session.
@@ -70,32 +301,62 @@ def save_chat_history(user_id, session_id, chat_history):
         chat_history (list): A list of dictionaries
             containing the role and content of each message.
     """
-    for message in chat_history:
-        new_message = ChatMessage(
-            user_id=user_id,
-            role=message["role"],
-            content=message["content"],
-            timestamp=datetime.utcnow(),
-            session_id=session_id
-        )
-        db.session.add(new_message)
+    timestamp = datetime.utcnow()
     try:
-        db.session.commit()
-
-        cache.delete_memoized(get_chat_files_for_user, user_id)
-        cache.delete_memoized(load_chat_history, user_id, session_id)
-        cache.delete_memoized(get_chat_preview, user_id, session_id)
+        write_messages(
+            user_id, session_id,
+            [
+                (message["role"], message["content"], timestamp)
+                for message in chat_history
+            ]
+        )
     except Exception as e:
-        db.session.rollback()
         print(f"Error saving chat history to the database: {e}")
 
 
-@cache.memoize(timeout=300)
+def mark_chat_changed(db_session, user_id, session_id):
+    """
+    Queues a chat session's cached history and preview to be dropped
+        when the database session commits.
+
+    Args:
+        db_session (Session): The database session making the change.
+        user_id (int): The owner of the chat session.
+        session_id (str): The chat session that changed.
+    """
+    db_session.info.setdefault("changed_chats", set()).add(
+        (user_id, session_id)
+    )
+
+
+@event.listens_for(ChatMessage, 'after_insert')
+def chat_message_added(mapper, connection, target):
+    """Queues the caches of a message added through the ORM."""
+    mark_chat_changed(
+        object_session(target), target.user_id, target.session_id
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_chats(db_session):
+    """Drops the cached history and preview of the committed chats."""
+    for user_id, session_id in db_session.info.pop("changed_chats", ()):
+        cache.delete_memoized(load_chat_history, user_id, session_id)
+        cache.delete(preview_cache_key(user_id, session_id))
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_chats(db_session):
+    """Keeps the caches of chats whose changes were rolled back."""
+    db_session.info.pop("changed_chats", None)
+
+
 def get_chat_files_for_user(user_id):
     """
-    Queries the database to retrieve session IDs for the given user,
-        groups them by session ID, and orders them by the most recent message.
-    Uses caching to store the results for 5 minutes to improve performance.
+    Retrieves the session IDs of the given user's chat sessions, ordered
+        by the most recent message.
+    Reads the ChatSession summaries with one indexed range read, so the
+        cost does not grow with the number of messages.
 
     Args:
         user_id (int): The user ID for whom the session files are fetched for.
@@ -104,38 +365,64 @@ def get_chat_files_for_user(user_id):
         A list of session IDs for the user's chat sessions,
             ordered by the most recent message.
     """
-    sessions = db.session.query(ChatMessage.session_id) \
+    sessions = db.session.query(ChatSession.session_id) \
         .filter_by(user_id=user_id) \
-        .group_by(ChatMessage.session_id) \
-        .order_by(db.func.max(ChatMessage.timestamp).desc()) \
+        .order_by(ChatSession.last_message_at.desc()) \
         .all()
     return [session[0] for session in sessions]
 
 
-@cache.memoize(timeout=300)
-def get_chat_preview(user_id, session_id):
+def preview_cache_key(user_id, session_id):
+    """Returns the cache key holding a session's sidebar preview."""
+    return f"chat_preview:{user_id}:{session_id}"
+
+
+def get_chat_previews(user_id, session_ids):
     """
-    Fetches a preview of the first message for a specific user's session.
+    Fetches the sidebar previews of many sessions at once: one cache
+        multi-get, then a single ChatSession query for the misses.
+    Previews are cached for 5 minutes.
 
     Args:
-        user_id (int): The user whose session preview is being fetched.
-        session_id (str): The session ID for the message preview.
+        user_id (int): The user whose session previews are being fetched.
+        session_ids (list): The session IDs to fetch previews for.
 
     Returns:
-        str: A preview of the first message in the session.
+        dict: Maps each session ID to a preview of its first message.
     """
-    message = (
-            ChatMessage.query
-            .filter_by(user_id=user_id, session_id=session_id)
-            .order_by(ChatMessage.timestamp)
-            .first()
+    if not session_ids:
+        return {}
+
+    keys = [preview_cache_key(user_id, session_id)
+            for session_id in session_ids]
+    previews = {
+        session_id: preview
+        for session_id, preview in zip(session_ids, cache.get_many(*keys))
+        if preview is not None
+    }
+
+    missing = [
+        session_id for session_id in session_ids
+        if session_id not in previews
+    ]
+    metrics.count_cache("chat_preview", len(previews), len(missing))
+    if missing:
+        rows = db.session.query(ChatSession.session_id, ChatSession.preview) \
+            .filter(ChatSession.user_id == user_id) \
+            .filter(ChatSession.session_id.in_(missing)) \
+            .all()
+        found = dict(rows)
+        fetched = {
+            session_id: found.get(session_id) or "No messages available"
+            for session_id in missing
+        }
+        cache.set_many(
+            {
+                preview_cache_key(user_id, session_id): preview
+                for session_id, preview in fetched.items()
+            },
+            timeout=300
         )
-    if message:
-        preview = (
-                message.content[:30] + "..."
-                if len(message.content) > 30
-                else message.content
-            )
-    else:
-        preview = "No messages available"
-    return preview
+        previews.update(fetched)
+
+    return previews
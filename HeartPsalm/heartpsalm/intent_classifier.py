@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+""" Local fast-path classifier for song recommendation requests. """
+import os
+import re
+import zlib
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+WEIGHTS_PATH = os.path.join(DATA_DIR, "intent_weights.npy")
+TRAIN_PATH = os.path.join(DATA_DIR, "intent_train.tsv")
+EVAL_PATH = os.path.join(DATA_DIR, "intent_eval.tsv")
+
+N_FEATURES = 2 ** 12
+
+# Model probabilities between these bounds are escalated to Gemini
+LOWER_CONFIDENCE = 0.2
+UPPER_CONFIDENCE = 0.8
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Messages without any of these words are never song requests
+MUSIC_WORDS_RE = re.compile(
+    r"\b(songs?|music|hymns?|tracks?|tunes?|playlists?|sing\w*|sang|"
+    r"listen\w*|play\w*|spotify|album|melody|gospel|praise|worship)\b"
+)
+
+# Asking about a particular song rather than for a recommendation
+SONG_QUESTION_RE = re.compile(
+    r"\b(who (sang|sings|wrote|is the (artist|singer))|lyrics|"
+    r"meaning of|what (year|album))\b"
+)
+
+# Explicitly declining a song
+SONG_REFUSAL_RE = re.compile(
+    r"\b(no|not|don't|do not)\b(\s+\w+){0,3}\s+(songs?|music)\b"
+)
+
+SONG_REQUEST_RE = re.compile(
+    r"\b(play|recommend|suggest|give|send|share|find|pick|need|want)\b"
+    r"(\s+(me|us|a|an|some|any|something|for|good))*"
+    r"(\s+(gospel|worship|praise|christian|uplifting))?"
+    r"\s+(songs?|music|hymns?|tracks?|playlist)\b"
+    r"|^(any|got any|do you have any)\b.*\b(songs?|music|hymns?)\b"
+    r"|^(please\s+)?play(\s+me)?\s+something\b"
+)
+
+_weights = None
+
+
+def tokenize(text):
+    """
+    Lowercases the text and splits it into word tokens.
+
+    Returns:
+        list: The tokens of the text.
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def hash_features(text):
+    """
+    Maps the unigrams and bigrams of a text onto hashed feature indices.
+    Uses crc32 so the indices are stable across processes.
+
+    Returns:
+        numpy.ndarray: The unique feature indices present in the text.
+    """
+    tokens = tokenize(text)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return np.unique(np.fromiter(
+        (zlib.crc32(gram.encode()) % N_FEATURES for gram in grams),
+        dtype=np.int64, count=len(grams)
+    ))
+
+
+def load_weights(path=WEIGHTS_PATH):
+    """
+    Loads the trained weight array, with the bias as its last element.
+    The array is read once per process.
+
+    Returns:
+        numpy.ndarray: The model weights, or None if no model is trained.
+    """
+    global _weights
+    if _weights is None and os.path.exists(path):
+        _weights = np.load(path)
+    return _weights
+
+
+def predict_proba(text, weights=None):
+    """
+    Scores a message with the hashed bag-of-words logistic regression.
+
+    Returns:
+        float: The probability that the message is a song request.
+    """
+    if weights is None:
+        weights = load_weights()
+    if weights is None:
+        return 0.5
+    score = weights[hash_features(text)].sum() + weights[-1]
+    return float(1.0 / (1.0 + np.exp(-score)))
+
+
+def classify_intent(user_input, weights=None):
+    """
+    Decides locally whether the user is asking for a song recommendation.
+    Compiled rules handle the clear-cut messages; the trained model handles
+        the rest and abstains when it is not confident.
+
+    Args:
+        user_input (str): The user's input message.
+        weights (numpy.ndarray): Optional weights, defaults to the
+            trained model on disk.
+
+    Returns:
+        bool: True or False when confident, None to escalate to Gemini.
+    """
+    text = user_input.lower().strip()
+    if not MUSIC_WORDS_RE.search(text):
+        return False
+    if SONG_QUESTION_RE.search(text) or SONG_REFUSAL_RE.search(text):
+        return False
+    if SONG_REQUEST_RE.search(text):
+        return True
+
+    probability = predict_proba(text, weights)
+    if probability >= UPPER_CONFIDENCE:
+        return True
+    if probability <= LOWER_CONFIDENCE:
+        return False
+    return None
+
+
+def load_examples(path):
+    """
+    Reads a labelled dataset of `label<TAB>text` lines.
+
+    Returns:
+        list: (text, label) tuples, label being 1 for song requests.
+    """
+    examples = []
+    with open(path, encoding="utf-8") as dataset:
+        for line in dataset:
+            if line.strip():
+                label, text = line.rstrip("\n").split("\t", 1)
+                examples.append((text, int(label)))
+    return examples
+
+
+def train(examples, epochs=300, learning_rate=0.5, l2=1e-3):
+    """
+    Fits the logistic regression with full-batch gradient descent.
+
+    Args:
+        examples (list): (text, label) tuples.
+
+    Returns:
+        numpy.ndarray: The weights, with the bias as the last element.
+    """
+    features = np.zeros((len(examples), N_FEATURES + 1), dtype=np.float32)
+    for row, (text, _) in enumerate(examples):
+        features[row, hash_features(text)] = 1.0
+    features[:, -1] = 1.0
+    labels = np.array([label for _, label in examples], dtype=np.float32)
+
+    weights = np.zeros(N_FEATURES + 1, dtype=np.float32)
+    for _ in range(epochs):
+        predictions = 1.0 / (1.0 + np.exp(-features @ weights))
+        gradient = features.T @ (predictions - labels) / len(examples)
+        gradient[:-1] += l2 * weights[:-1]
+        weights -= learning_rate * gradient
+    return weights
+
+
+def evaluate(examples, weights=None):
+    """
+    Measures the local tier on a labelled dataset.
+
+    Returns:
+        dict: The number of examples, the escalation rate and the
+            accuracy of the locally decided examples.
+    """
+    decided = correct = 0
+    for text, label in examples:
+        prediction = classify_intent(text, weights)
+        if prediction is not None:
+            decided += 1
+            correct += int(prediction == bool(label))
+    return {
+        "examples": len(examples),
+        "escalation_rate": 1 - decided / len(examples),
+        "local_accuracy": correct / decided if decided else 0.0,
+    }
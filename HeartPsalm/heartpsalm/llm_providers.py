@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+""" Language model providers, chosen per kind of call. """
+from heartpsalm import model_registry, verses
+from heartpsalm.intent_classifier import classify_intent, predict_proba
+from heartpsalm.sentiment import detect_emotion
+import abc
+import json
+import os
+import threading
+import time
+import zlib
+
+# The provider answering every call not routed elsewhere: "gemini" or
+# "local", the deterministic in-process provider for tests and benchmarks
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+# Routes for kinds of calls, comma separated "kind=provider[:model]", e.g.
+# "intent=gemini:gemini-1.5-flash-8b,summary=local"
+LLM_ROUTES = os.getenv("LLM_ROUTES", "")
+# Seconds the local provider waits before answering, to stand in for a
+# remote model's latency
+LOCAL_LLM_LATENCY = float(os.getenv("LOCAL_LLM_LATENCY", "0"))
+
+# The app's calls: chat replies, streamed replies, turn plans, intent
+# checks and session summaries
+CALL_KINDS = ("reply", "stream", "plan", "intent", "summary")
+
+# The local provider's reply when no verse fits the message
+LOCAL_REPLY = (
+    "I hear you. Whatever you are carrying today, you do not carry it "
+    "alone. Would you like a verse or a song?"
+)
+# Words per chunk of the local provider's streamed replies
+LOCAL_STREAM_WORDS = 4
+
+
+class LLMProvider(abc.ABC):
+    """
+    The calls the app makes to a language model. History is a list of
+        `{"role": ..., "parts": [...]}` dicts, oldest first; `model`
+        names one of the provider's models, None for its default.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def generate(self, message, history, model=None):
+        """
+        Answers a message.
+
+        Returns:
+            str: The reply.
+        """
+
+    def stream(self, message, history, model=None):
+        """
+        Answers a message a chunk at a time. Providers without streaming
+            send the whole reply as one chunk.
+
+        Yields:
+            str: Successive chunks of the reply.
+        """
+        yield self.generate(message, history, model)
+
+    @abc.abstractmethod
+    def classify(self, message, instructions, history, model=None):
+        """
+        Describes a message as a JSON object, e.g. the turn plan.
+
+        Args:
+            message (str): The user's message.
+            instructions (str): What to answer and under which keys.
+            history (list): The chat so far.
+            model (str): Optional model name.
+
+        Returns:
+            str: The JSON object's text.
+        """
+
+
+class GeminiProvider(LLMProvider):
+    """Google's Gemini models, shared through `model_registry`."""
+
+    name = "gemini"
+
+    def generate(self, message, history, model=None):
+        """Sends the message in a chat started from the history."""
+        chat = model_registry.get_model(model_name=model).start_chat(
+                history=history
+            )
+        return chat.send_message(message).text
+
+    def stream(self, message, history, model=None):
+        """Yields Gemini's chunks as they arrive."""
+        chat = model_registry.get_model(model_name=model).start_chat(
+                history=history
+            )
+        for chunk in chat.send_message(message, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    def classify(self, message, instructions, history, model=None):
+        """Asks for the JSON object with a JSON response MIME type."""
+        chat = model_registry.get_model(
+                model_registry.JSON_RESPONSE, model_name=model
+            ).start_chat(history=history)
+        return chat.send_message(f"{instructions}\nMessage: {message}").text
+
+
+class LocalProvider(LLMProvider):
+    """
+    A deterministic, templated provider running in process. Replies quote
+        a verse for the message's emotion, picked by a hash of the
+        message, and turn plans come from the local intent and sentiment
+        models. Nothing leaves the process, so tests and benchmarks get
+        the same answers every run; the model name and history are
+        ignored.
+    """
+
+    name = "local"
+
+    def __init__(self, latency=LOCAL_LLM_LATENCY):
+        """
+        Args:
+            latency (float): Seconds to wait before each answer.
+        """
+        self.latency = latency
+
+    def _wait(self):
+        """Waits for the configured latency."""
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _reply(self, message):
+        """Builds the templated reply to a message."""
+        candidates = verses.verses_for_emotion(detect_emotion(message))
+        if not candidates:
+            return LOCAL_REPLY
+        verse = candidates[zlib.crc32(message.encode()) % len(candidates)]
+        return f"I hear you. **{verse.reference}**: {verse.text}"
+
+    def generate(self, message, history, model=None):
+        """Answers with the templated reply."""
+        self._wait()
+        return self._reply(message)
+
+    def stream(self, message, history, model=None):
+        """Yields the templated reply a few words at a time."""
+        self._wait()
+        words = self._reply(message).split(" ")
+        for start in range(0, len(words), LOCAL_STREAM_WORDS):
+            chunk = " ".join(words[start:start + LOCAL_STREAM_WORDS])
+            if start + LOCAL_STREAM_WORDS < len(words):
+                chunk += " "
+            yield chunk
+
+    def classify(self, message, instructions, history, model=None):
+        """
+        Answers with a turn plan, see `core_functions.plan_turn`; messages
+            the intent model abstains on are decided at even odds.
+        """
+        self._wait()
+        song_request = classify_intent(message)
+        if song_request is None:
+            song_request = predict_proba(message.lower().strip()) >= 0.5
+        return json.dumps({
+            "song_request": song_request,
+            "emotion": detect_emotion(message),
+            "reply": self._reply(message),
+        })
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    LocalProvider.name: LocalProvider,
+}
+
+_lock = threading.Lock()
+_providers = {}
+
+
+def parse_routes(spec):
+    """
+    Parses LLM_ROUTES.
+
+    Args:
+        spec (str): Comma separated "kind=provider[:model]" entries.
+
+    Returns:
+        dict: (provider name, model name or None) by call kind.
+    """
+    routes = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        kind, _, target = (part.strip() for part in entry.partition("="))
+        if kind not in CALL_KINDS or not target:
+            print(f"Error in LLM_ROUTES: ignoring {entry.strip()!r}")
+            continue
+        provider, _, model = (part.strip() for part in target.partition(":"))
+        routes[kind] = (provider, model or None)
+    return routes
+
+
+routes = parse_routes(LLM_ROUTES)
+
+
+def get_provider(name):
+    """
+    Returns the process's shared instance of a provider.
+
+    Args:
+        name (str): A key of PROVIDERS.
+
+    Returns:
+        LLMProvider: The provider.
+
+    Raises:
+        ValueError: If no provider has that name.
+    """
+    provider = _providers.get(name)
+    if provider is None:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown LLM provider: {name!r}")
+        with _lock:
+            provider = _providers.setdefault(name, PROVIDERS[name]())
+    return provider
+
+
+def route(kind):
+    """
+    Picks the provider and model for a kind of call.
+
+    Args:
+        kind (str): One of CALL_KINDS.
+
+    Returns:
+        tuple: The LLMProvider and the model name, None for its default.
+    """
+    name, model = routes.get(kind, (LLM_PROVIDER, None))
+    return get_provider(name), model
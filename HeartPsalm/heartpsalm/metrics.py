@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+""" Timing spans, histograms and the Prometheus text exposition. """
+from heartpsalm import app
+from flask import g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import atexit
+import bisect
+import functools
+import glob
+import inspect
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+# A directory shared by the gunicorn workers; each one writes its numbers
+# there so any worker can serve the totals. Empty keeps them in process.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+# How often a worker writes its numbers to METRICS_DIR
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "1"))
+# When set, /metrics requires `Authorization: Bearer <token>`
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Adds a Server-Timing header with each response's spans
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+    5.0, 10.0,
+)
+
+REQUEST_SECONDS = "heartpsalm_request_seconds"
+SPAN_SECONDS = "heartpsalm_span_seconds"
+CACHE_REQUESTS = "heartpsalm_cache_requests_total"
+
+METRICS = {
+    REQUEST_SECONDS: (
+        "histogram", "Time to handle a request, by endpoint and status."
+    ),
+    SPAN_SECONDS: (
+        "histogram",
+        "Time spent in database queries, Gemini and Spotify calls and "
+        "template rendering."
+    ),
+    CACHE_REQUESTS: ("counter", "Cache lookups, by cache and result."),
+}
+
+# The files in METRICS_DIR: one per live worker, one per worker that
+# exited since the last scrape, and the totals of all exited workers
+WORKER_FILE_RE = re.compile(r"metrics-\d+\.json$")
+EXITED_FILES = "metrics-*-exited-*.json"
+EXITED_TOTALS = "metrics-exited.json"
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_flushed_at = 0.0
+
+
+def _key(name, labels):
+    """Builds the hashable key of a series."""
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """
+    Records a duration in a histogram.
+
+    Args:
+        name (str): The histogram, e.g. SPAN_SECONDS.
+        seconds (float): The duration.
+        **labels: The series' labels.
+    """
+    bucket = bisect.bisect_left(BUCKETS, seconds)
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+        series[0][bucket] += 1
+        series[1] += seconds
+
+
+def increment(name, amount=1, **labels):
+    """
+    Adds to a counter.
+
+    Args:
+        name (str): The counter, e.g. CACHE_REQUESTS.
+        amount (int): How much to add.
+        **labels: The series' labels.
+    """
+    if not amount:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def record_span(name, seconds):
+    """
+    Records a span in the histograms and, during a request, in the
+        request's Server-Timing breakdown.
+    """
+    observe(SPAN_SECONDS, seconds, span=name)
+    if has_request_context():
+        spans = g.setdefault("timing_spans", {})
+        total, count = spans.get(name, (0.0, 0))
+        spans[name] = (total + seconds, count + 1)
+
+
+@contextmanager
+def span(name):
+    """Times the enclosed block as a span."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """
+    Decorates a function so each call is timed as a span. A generator
+        is timed from its first to its last chunk.
+
+    Args:
+        name (str): The span's name.
+    """
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    yield from fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_cache(cache_name, hits, misses):
+    """Counts a cache's hits and misses."""
+    increment(CACHE_REQUESTS, hits, cache=cache_name, result="hit")
+    increment(CACHE_REQUESTS, misses, cache=cache_name, result="miss")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context,
+                      executemany):
+    """Notes when a query starts, per connection."""
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    """Records a finished query as a "db" span."""
+    started = conn.info.get("query_started")
+    if started:
+        record_span("db", time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(exception_context):
+    """Forgets the start of a query that failed."""
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    """Notes when a template starts rendering."""
+    g.setdefault("render_started", []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def record_render(sender, template, context, **extra):
+    """Records a rendered template as a "render_template" span."""
+    started = g.get("render_started")
+    if started:
+        record_span("render_template", time.perf_counter() - started.pop())
+
+
+@app.before_request
+def start_request_timer():
+    """Notes when the request started."""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    """
+    Records the request's duration, adds the Server-Timing header if
+        enabled and writes this worker's numbers to METRICS_DIR when due.
+    """
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    observe(
+        REQUEST_SECONDS, elapsed, method=request.method,
+        endpoint=request.endpoint or "unmatched",
+        status=str(response.status_code)
+    )
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(elapsed)
+    flush()
+    return response
+
+
+def server_timing(elapsed):
+    """
+    Formats the current request's spans as a Server-Timing header.
+
+    Args:
+        elapsed (float): The request's duration so far, in seconds.
+
+    Returns:
+        str: e.g. `db;dur=3.1;desc="4 calls", total;dur=12.0`.
+    """
+    entries = [
+        f'{name};dur={total * 1000:.1f};desc="{count} calls"'
+        for name, (total, count) in g.get("timing_spans", {}).items()
+    ]
+    entries.append(f"total;dur={elapsed * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _serialize(histograms, counters):
+    """Lists series keyed by (name, labels) as a JSON-serializable dict."""
+    return {
+        "histograms": [
+            [name, list(labels), list(buckets), total]
+            for (name, labels), (buckets, total) in histograms.items()
+        ],
+        "counters": [
+            [name, list(labels), value]
+            for (name, labels), value in counters.items()
+        ],
+    }
+
+
+def snapshot():
+    """
+    Copies this process's numbers into a JSON-serializable dict.
+
+    Returns:
+        dict: `histograms` and `counters`, each a list of series.
+    """
+    with _lock:
+        return _serialize(_histograms, _counters)
+
+
+def _merge(totals, data):
+    """Adds a snapshot's series into `totals`."""
+    for name, labels, buckets, total in data.get("histograms", ()):
+        key = (name, tuple(tuple(label) for label in labels))
+        merged = totals["histograms"].setdefault(
+            key, [[0] * len(buckets), 0.0]
+        )
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += total
+    for name, labels, value in data.get("counters", ()):
+        key = (name, tuple(tuple(label) for label in labels))
+        totals["counters"][key] = totals["counters"].get(key, 0) + value
+
+
+def _read(path):
+    """Reads a snapshot file, or nothing if it is missing or partial."""
+    try:
+        with open(path, encoding="utf-8") as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path, data):
+    """Writes a snapshot file atomically."""
+    with tempfile.NamedTemporaryFile(
+            "w", dir=os.path.dirname(path), suffix=".tmp",
+            delete=False, encoding="utf-8") as temporary:
+        json.dump(data, temporary)
+    os.replace(temporary.name, path)
+
+
+def _process_file(pid):
+    """The snapshot file of a worker."""
+    return os.path.join(METRICS_DIR, f"metrics-{pid}.json")
+
+
+def flush(force=False):
+    """Writes this worker's numbers to METRICS_DIR, at most once a second."""
+    global _flushed_at
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _flushed_at < METRICS_FLUSH_SECONDS:
+        return
+    _flushed_at = now
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write(_process_file(os.getpid()), snapshot())
+    except OSError as e:
+        print(f"Error writing metrics: {e}")
+
+
+@contextmanager
+def _directory_lock():
+    """Holds an exclusive lock on METRICS_DIR across the workers."""
+    import fcntl
+    with open(os.path.join(METRICS_DIR, "metrics.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _compact_exited():
+    """
+    Folds the files of workers that exited, which gunicorn's `child_exit`
+        hook renames, into EXITED_TOTALS and deletes them, so restarts
+        never add files for every scrape to read. Call it holding the
+        directory lock.
+    A file listed as merged but not yet deleted is only deleted.
+    """
+    paths = sorted(glob.glob(os.path.join(METRICS_DIR, EXITED_FILES)))
+    if not paths:
+        return
+    totals_path = os.path.join(METRICS_DIR, EXITED_TOTALS)
+    exited = _read(totals_path)
+    merged = set(exited.get("merged", ()))
+    totals = {"histograms": {}, "counters": {}}
+    _merge(totals, exited)
+    for path in paths:
+        if os.path.basename(path) not in merged:
+            _merge(totals, _read(path))
+    data = _serialize(totals["histograms"], totals["counters"])
+    data["merged"] = [os.path.basename(path) for path in paths]
+    _write(totals_path, data)
+    for path in paths:
+        os.remove(path)
+
+
+def collect():
+    """
+    Adds up the numbers of every worker: this one from memory, the others
+        from METRICS_DIR, and those of exited workers from their totals.
+
+    Returns:
+        dict: `histograms` and `counters` keyed by (name, labels).
+    """
+    totals = {"histograms": {}, "counters": {}}
+    _merge(totals, snapshot())
+    if not METRICS_DIR:
+        return totals
+    own = os.path.basename(_process_file(os.getpid()))
+    try:
+        with _directory_lock():
+            _compact_exited()
+            _merge(totals, _read(os.path.join(METRICS_DIR, EXITED_TOTALS)))
+    except OSError as e:
+        print(f"Error compacting metrics: {e}")
+    for name in os.listdir(METRICS_DIR):
+        if WORKER_FILE_RE.match(name) and name != own:
+            _merge(totals, _read(os.path.join(METRICS_DIR, name)))
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    """Formats labels as `{name="value",...}`, escaping the values."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\")
+        .replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_metrics():
+    """
+    Renders every worker's numbers in the Prometheus text format.
+
+    Returns:
+        str: The exposition, one `# TYPE` block per metric.
+    """
+    totals = collect()
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (series, labels), value in sorted(totals["counters"].items()):
+                if series == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+        for (series, labels), (buckets, total) in sorted(
+                totals["histograms"].items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), buckets):
+                cumulative += count
+                labelled = _format_labels(labels, [("le", bound)])
+                lines.append(f"{name}_bucket{labelled} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+atexit.register(flush, force=True)
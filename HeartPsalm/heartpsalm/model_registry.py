@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+""" Per-process registry of configured Gemini models. """
+from heartpsalm import app, genai
+from google.generativeai import client as genai_client
+import os
+import threading
+import time
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Generation configs the app uses, warmed together at worker boot
+JSON_RESPONSE = {"response_mime_type": "application/json"}
+WARM_CONFIGS = (None, JSON_RESPONSE)
+
+_lock = threading.Lock()
+_models = {}
+
+
+def _registry_key(model_name, generation_config):
+    """Builds a hashable key from a model name and generation config."""
+    if not generation_config:
+        return model_name, None
+    return model_name, tuple(sorted(generation_config.items()))
+
+
+def get_model(generation_config=None, model_name=None):
+    """
+    Returns the process's shared GenerativeModel for a model name and
+        generation config, creating it on first use.
+    Models hold no chat state, so one instance serves every request, and
+        they all share the SDK's default client and its channel.
+
+    Args:
+        generation_config (dict): Optional Gemini generation settings.
+        model_name (str): Optional model, defaults to GEMINI_MODEL.
+
+    Returns:
+        genai.GenerativeModel: The configured model.
+    """
+    key = _registry_key(model_name or GEMINI_MODEL, generation_config)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(
+                        key[0], generation_config=generation_config
+                    )
+                _models[key] = model
+    return model
+
+
+def warm_models(configs=WARM_CONFIGS):
+    """
+    Creates the app's models and opens the client's channel ahead of the
+        first request with one cheap token count. Failures are logged and
+        ignored so a Gemini outage never blocks a worker from booting.
+
+    Args:
+        configs (tuple): The generation configs to create models for.
+
+    Returns:
+        float: How long warming took, in milliseconds.
+    """
+    started = time.perf_counter()
+    for generation_config in configs:
+        get_model(generation_config)
+    try:
+        genai_client.get_default_generative_client()
+        get_model().count_tokens("warm up")
+    except Exception as e:
+        print(f"Error warming the Gemini client: {e}")
+    elapsed = (time.perf_counter() - started) * 1000
+    app.logger.info("warmed Gemini models in %.1f ms", elapsed)
+    return elapsed
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 """ App's models/classes. """
-from heartpsalm import db, bcrypt, login_manager
+from heartpsalm import db, login_manager, passwords
+from heartpsalm.rendering import render_message
 from flask_login import UserMixin
 from datetime import datetime
 import uuid
-from sqlalchemy import Index
+from sqlalchemy import (
+        Index, UniqueConstraint, event,
+        case, delete, insert, update)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 
 
 @login_manager.user_loader
@@ -30,6 +35,10 @@ class User(db.Model, UserMixin):
     email_address = db.Column(db.String(120), nullable=False, unique=True)
     password_hash = db.Column(db.String(60), nullable=False)
 
+    __table_args__ = (
+            Index('idx_user_username', 'username', unique=True),
+    )
+
     @property
     def password(self):
         """Getter for the password property"""
@@ -38,14 +47,20 @@ class User(db.Model, UserMixin):
     @password.setter
     def password(self, text_passwd):
         """Hashes and sets the user's password."""
-        self.password_hash = (
-                bcrypt.generate_password_hash(text_passwd)
-                .decode('utf-8')
-            )
+        self.password_hash = passwords.hash_password(text_passwd)
 
     def check_for_correct_paswd(self, inputed_paswd):
-        """Validates the provided password against the stored hash."""
-        return bcrypt.check_password_hash(self.password_hash, inputed_paswd)
+        """
+        Validates the provided password against the stored hash.
+        A hash made at another cost than BCRYPT_LOG_ROUNDS is replaced
+            by a new one once the password is known to be correct; the
+            caller commits it.
+        """
+        if not passwords.check_password(self.password_hash, inputed_paswd):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.password = inputed_paswd
+        return True
 
 
 class ChatMessage(db.Model):
@@ -61,12 +76,154 @@ class ChatMessage(db.Model):
         )
     role = db.Column(db.String(1250), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # `content` rendered once on insert, see `render_chat_message`
+    rendered_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     session_id = db.Column(db.String(255), nullable=False)
 
     user = db.relationship('User', backref=db.backref('messages', lazy=True))
     __table_args__ = (
             Index('idx_chatmessage_timestamp', 'timestamp'),
+            Index(
+                'idx_chatmessage_session_timestamp',
+                'user_id', 'session_id', 'timestamp', 'id'
+            ),
+    )
+
+
+class ChatSession(db.Model):
+    """
+    Summary of a user's chat session, kept up to date as messages are
+        added and deleted so the sidebar never has to scan ChatMessage.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(
+            db.String(36),
+            db.ForeignKey('user.id'),
+            nullable=False
+        )
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_message_at = db.Column(db.DateTime)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    preview = db.Column(db.String(255))
+    # rolling summary of the messages up to and including this position
+    summary = db.Column(db.Text)
+    summary_through_at = db.Column(db.DateTime)
+    summary_through_id = db.Column(db.Integer)
+
+    __table_args__ = (
+            UniqueConstraint('user_id', 'session_id'),
+            Index(
+                'idx_chatsession_user_last_message',
+                'user_id', 'last_message_at'
+            ),
+    )
+
+
+def make_preview(content):
+    """
+    Shortens a message to the preview shown in the chat sidebar.
+
+    Returns:
+        str: The first 30 characters of the message.
+    """
+    return content[:30] + "..." if len(content) > 30 else content
+
+
+# Dialects whose INSERT ... ON CONFLICT adds to an existing summary row
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def record_chat_messages(connection, user_id, session_id, messages):
+    """
+    Adds newly inserted messages to their session's summary row,
+        creating the row for the session's first messages. Two first
+        messages stored at once both count, as the one that loses the
+        race on the (user_id, session_id) constraint updates the row the
+        other created.
+
+    Args:
+        connection (Connection): The connection the messages were
+            inserted on, so the summary commits with them.
+        user_id (str): The owner of the session.
+        session_id (str): The session the messages belong to.
+        messages (list): (timestamp, content) tuples, oldest first.
+    """
+    summary = ChatSession.__table__
+    first_at = messages[0][0]
+    last_at = messages[-1][0]
+    counted = {
+        "message_count": summary.c.message_count + len(messages),
+        "last_message_at": case(
+            (summary.c.last_message_at.is_(None), last_at),
+            (summary.c.last_message_at < last_at, last_at),
+            else_=summary.c.last_message_at
+        ),
+    }
+    row = {
+        "user_id": user_id,
+        "session_id": session_id,
+        "created_at": first_at,
+        "last_message_at": last_at,
+        "message_count": len(messages),
+        "preview": make_preview(messages[0][1]),
+    }
+
+    upsert = UPSERT_INSERTS.get(connection.dialect.name)
+    if upsert is not None:
+        connection.execute(
+            upsert(summary).values(**row).on_conflict_do_update(
+                index_elements=["user_id", "session_id"], set_=counted
+            )
+        )
+        return
+
+    add_to_row = (
+        update(summary)
+        .where(summary.c.user_id == user_id)
+        .where(summary.c.session_id == session_id)
+        .values(**counted)
+    )
+    if connection.execute(add_to_row).rowcount == 0:
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(summary).values(**row))
+        except IntegrityError:
+            connection.execute(add_to_row)
+
+
+@event.listens_for(ChatMessage, 'before_insert')
+def render_chat_message(mapper, connection, target):
+    """Renders a message's HTML once, as it is stored."""
+    if target.rendered_html is None:
+        target.rendered_html = render_message(target.content, target.role)
+
+
+@event.listens_for(ChatMessage, 'after_insert')
+def chat_message_inserted(mapper, connection, target):
+    """Counts an inserted message in its session summary."""
+    record_chat_messages(
+        connection, target.user_id, target.session_id,
+        [(target.timestamp, target.content)]
+    )
+
+
+@event.listens_for(ChatMessage, 'after_delete')
+def chat_message_deleted(mapper, connection, target):
+    """Uncounts a deleted message, dropping summaries left empty."""
+    summary = ChatSession.__table__
+    in_session = (
+        (summary.c.user_id == target.user_id)
+        & (summary.c.session_id == target.session_id)
+    )
+    connection.execute(
+        update(summary).where(in_session)
+        .values(message_count=summary.c.message_count - 1)
+    )
+    connection.execute(
+        delete(summary).where(in_session)
+        .where(summary.c.message_count <= 0)
     )
 
 
@@ -85,6 +242,36 @@ class ChatConfiguration(db.Model):
         return f'<ChatConfiguration {self.role}>'
 
 
+class GospelTrack(db.Model):
+    """
+    A gospel track harvested from Spotify into the local catalog,
+        tagged with the emotion it was found for.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    spotify_id = db.Column(db.String(64), nullable=False)
+    emotion = db.Column(db.String(32), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    artist = db.Column(db.String(255), nullable=False)
+    url = db.Column(db.String(255), nullable=False)
+    popularity = db.Column(db.Integer, nullable=False, default=0)
+    harvested_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+            Index('idx_gospeltrack_emotion', 'emotion'),
+            UniqueConstraint('spotify_id', 'emotion'),
+    )
+
+    def to_dict(self):
+        """Returns the track in the shape used by `search_gospel_song`."""
+        return {
+            "id": self.spotify_id,
+            "name": self.name,
+            "artist": self.artist,
+            "url": self.url,
+            "popularity": self.popularity,
+        }
+
+
 def create_default_config():
     """
     Creates default configurations for the user and assistant roles in
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+""" Password hashing on a bounded process pool. """
+from heartpsalm import app
+from concurrent.futures import ProcessPoolExecutor
+import atexit
+import multiprocessing
+import os
+import threading
+import bcrypt
+
+# Processes per worker that run bcrypt; 0 hashes on the request's thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "1"))
+# The gunicorn worker class; gunicorn.conf.py sets the one actually in use
+WORKER_CLASS = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+# Worker classes serving all their requests on one thread, which an inline
+# hash would stall. Sync and gthread workers hash inline, as bcrypt
+# releases the GIL and a pool would only add IPC to every hash
+ASYNC_WORKER_CLASSES = ("gevent", "eventlet", "tornado")
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def _context():
+    """
+    The pool's start method. Processes are forked from a fork server that
+        has only imported bcrypt, or spawned where there is none, so they
+        never copy a worker's threads, sockets and gRPC state, nor import
+        the app.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["bcrypt"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def pool_size():
+    """
+    The processes to hash on: PASSWORD_HASH_WORKERS under an async worker
+        class, otherwise 0.
+    """
+    worker_class = WORKER_CLASS.lower().rsplit(".", 1)[-1]
+    if not worker_class.startswith(ASYNC_WORKER_CLASSES):
+        return 0
+    return max(PASSWORD_HASH_WORKERS, 0)
+
+
+def _get_pool():
+    """Returns this process's pool, creating it on first use."""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                    max_workers=pool_size(), mp_context=_context()
+                )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def start_pool():
+    """Starts all of the pool's processes ahead of the first login."""
+    size = pool_size()
+    if size > 0:
+        pool = _get_pool()
+        for future in [pool.submit(bcrypt.gensalt, 4) for _ in range(size)]:
+            future.result()
+
+
+def _run(fn, *args):
+    """Runs a bcrypt function on the pool, or inline without one."""
+    if pool_size() <= 0:
+        return fn(*args)
+    return _get_pool().submit(fn, *args).result()
+
+
+def shutdown():
+    """Stops this process's pool, if it started one."""
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+def log_rounds():
+    """The configured bcrypt cost factor, BCRYPT_LOG_ROUNDS."""
+    return app.config["BCRYPT_LOG_ROUNDS"]
+
+
+def hash_password(password):
+    """
+    Hashes a password at the configured cost.
+
+    Args:
+        password (str): The plain-text password.
+
+    Returns:
+        str: The bcrypt hash, as Flask-Bcrypt would store it.
+    """
+    salt = bcrypt.gensalt(log_rounds())
+    return _run(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+
+def check_password(password_hash, password):
+    """
+    Checks a password against a stored hash.
+
+    Args:
+        password_hash (str): The stored bcrypt hash.
+        password (str): The plain-text password to check.
+
+    Returns:
+        bool: True if they match, False otherwise or if the hash is invalid.
+    """
+    try:
+        return _run(
+                bcrypt.checkpw, password.encode("utf-8"),
+                password_hash.encode("utf-8")
+            )
+    except ValueError:
+        return False
+
+
+def needs_rehash(password_hash):
+    """
+    Checks if a hash was made at another cost than the configured one.
+
+    Args:
+        password_hash (str): A bcrypt hash such as `$2b$12$...`.
+
+    Returns:
+        bool: True if it should be hashed again at the configured cost.
+    """
+    try:
+        return int(password_hash.split("$")[2]) != log_rounds()
+    except (IndexError, ValueError):
+        return True
+
+
+atexit.register(shutdown)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+""" Renders chat messages to the HTML shown in the chat box. """
+import re
+from markupsafe import escape
+
+# `**bold**` spans, or stray asterisks which are dropped
+EMPHASIS_RE = re.compile(r"\*\*(.*?)\*\*|\*")
+
+# The song card built by `search_gospel_song`, with its fields escaped
+SONG_CARD_RE = re.compile(
+    r"<div>I found a gospel song for you: <strong>'[^<>]*'</strong> by "
+    r"<em>[^<>]*</em>\. <a href=\"https://[^\"<>]*\" target=\"_blank\" "
+    r"class=\"spotify-btn\"><i class=\"fab fa-spotify\"></i> "
+    r"Listen on Spotify</a></div>"
+)
+
+
+def _emphasis(match):
+    """Turns a bold span into <strong>, and a stray asterisk into nothing."""
+    if match.group(1) is None:
+        return ""
+    return f"<strong>{match.group(1)}</strong>"
+
+
+def render_message(content, role=None):
+    """
+    Converts a message to HTML once, when it is stored.
+    The text is escaped, `**` spans become bold and every line becomes a
+        paragraph. Only the assistant's own song cards are kept as markup.
+
+    Args:
+        content (str): The raw message text.
+        role (str): "user" or "assistant".
+
+    Returns:
+        str: The HTML to show for the message.
+    """
+    if role == "assistant" and SONG_CARD_RE.fullmatch(content):
+        return f'<div class="message-content">{content}</div>'
+
+    text = EMPHASIS_RE.sub(_emphasis, str(escape(content)))
+    return "\n".join(
+            f"<p>{line}</p>" if line else line
+            for line in text.split("\n")
+        )
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+""" Exact-match cache of Gemini answers to context-free turns. """
+from heartpsalm import cache, metrics
+from heartpsalm.config_cache import get_chat_instructions
+from collections import Counter
+import hashlib
+import os
+import re
+import threading
+
+# How long a cached answer is served; 0 turns the cache off
+RESPONSE_CACHE_SECONDS = int(os.getenv("RESPONSE_CACHE_SECONDS", "3600"))
+# Longer inputs are rarely repeated word for word, so are not cached
+RESPONSE_CACHE_MAX_INPUT = int(os.getenv("RESPONSE_CACHE_MAX_INPUT", "200"))
+# Larger answers are not worth the cache memory
+RESPONSE_CACHE_MAX_ANSWER = int(
+    os.getenv("RESPONSE_CACHE_MAX_ANSWER", "8000")
+)
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def normalize_input(text):
+    """
+    Normalizes a message so trivially different spellings share a key.
+
+    Returns:
+        str: The text lowercased, without punctuation and with single
+            spaces.
+    """
+    text = PUNCTUATION_RE.sub("", text.lower())
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def is_context_free(chat_history):
+    """
+    Whether a turn's history holds only the configured instructions,
+        i.e. the turn is the first message of its session.
+
+    Returns:
+        bool: True if the answer depends on the message alone.
+    """
+    return tuple(chat_history) == get_chat_instructions().history_prefix
+
+
+def _cache_key(kind, user_input):
+    """Builds the key of an answer, or None if the input is not eligible."""
+    if RESPONSE_CACHE_SECONDS <= 0:
+        return None
+    normalized = normalize_input(user_input)
+    if not normalized or len(normalized) > RESPONSE_CACHE_MAX_INPUT:
+        return None
+    version = get_chat_instructions().version or "0"
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    return f"response:{kind}:{version}:{digest}"
+
+
+def count(kind, outcome):
+    """Counts a cache hit or miss, here and in the exported metrics."""
+    with _stats_lock:
+        _stats[(kind, outcome)] += 1
+    hit = outcome == "hits"
+    metrics.count_cache(f"response_{kind}", int(hit), int(not hit))
+
+
+def lookup(kind, user_input):
+    """
+    Looks up a cached answer for a context-free turn.
+
+    Args:
+        kind (str): What is cached, e.g. "reply" or "intent".
+        user_input (str): The user's message.
+
+    Returns:
+        The cached answer, or None on a miss.
+    """
+    key = _cache_key(kind, user_input)
+    if key is None:
+        return None
+    answer = cache.get(key)
+    count(kind, "hits" if answer is not None else "misses")
+    return answer
+
+
+def store(kind, user_input, answer):
+    """
+    Caches the answer to a context-free turn for RESPONSE_CACHE_SECONDS.
+
+    Args:
+        kind (str): What is cached, see `lookup`.
+        user_input (str): The user's message.
+        answer (str or dict): The answer to cache.
+    """
+    key = _cache_key(kind, user_input)
+    if key is None or len(str(answer)) > RESPONSE_CACHE_MAX_ANSWER:
+        return
+    cache.set(key, answer, timeout=RESPONSE_CACHE_SECONDS)
+
+
+def stats():
+    """
+    Reports this process's hits and misses per kind of answer.
+
+    Returns:
+        dict: Maps each kind to its `hits`, `misses` and `hit_rate`.
+    """
+    with _stats_lock:
+        counts = dict(_stats)
+    report = {}
+    for kind in sorted({kind for kind, _ in counts}):
+        hits = counts.get((kind, "hits"), 0)
+        misses = counts.get((kind, "misses"), 0)
+        report[kind] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+    return report
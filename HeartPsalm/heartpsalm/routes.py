@@ -1,36 +1,31 @@
 #!/usr/bin/env python3
 """ Routes to differnt functionalites. """
-from heartpsalm import app, db, cache
-from heartpsalm.models import User, ChatMessage, ChatConfiguration
+from heartpsalm import app, db
+from heartpsalm.models import User, ChatMessage, ChatSession
 from heartpsalm.forms import RegisterForm, LoginForm
 from flask_login import login_user, logout_user, login_required, current_user
 from datetime import datetime, timezone
+import json
+from sqlalchemy.exc import IntegrityError
 from flask import (
         render_template,
         request, redirect,
         url_for, flash,
-        session, jsonify)
+        session, jsonify,
+        Response, stream_with_context)
 from heartpsalm.core_functions import (
-        search_gospel_song,
-        generative_ai_response,
-        detect_sentiment_with_gemini,
-        analyze_intent_with_gemini)
+        respond_to_message,
+        stream_response_to_message)
+from heartpsalm.config_cache import get_chat_instructions
+from heartpsalm.context_builder import build_context
 
 from heartpsalm.helper_functions import (
-        process_message_for_bold_and_paragraphs,
         generate_session_id, load_chat_history,
         save_chat_history, get_chat_files_for_user,
-        get_chat_preview)
-
-
-@app.context_processor
-def utility_functions():
-    """
-    Registers `get_chat_preview` as a global template function.
-    Returns:
-        dict: Maps `get_chat_preview` to be used in templates.
-    """
-    return dict(get_chat_preview=get_chat_preview)
+        get_chat_previews, mark_chat_changed,
+        get_message_page, decode_cursor)
+from heartpsalm.write_behind import store_turn
+from heartpsalm import metrics
 
 
 @app.route("/")
@@ -65,7 +60,17 @@ def register_page():
                 password=form.password1.data
                 )
         db.session.add(create_user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # taken by a concurrent registration since the form was checked
+            db.session.rollback()
+            flash(
+                    "There was an error creating a user: "
+                    "Username or email address already exists!",
+                    category="danger"
+                )
+            return render_template("register.html", form=form)
 
         login_user(create_user)
         flash(
@@ -107,6 +112,8 @@ def login_page():
         if inputed_username and inputed_username.check_for_correct_paswd(
                 inputed_paswd=form.password.data
                 ):
+            # stores the hash redone at the current cost, if it was
+            db.session.commit()
             login_user(inputed_username)
 
             # Clear any existing session ID when logging in
@@ -155,26 +162,10 @@ def chat_page():
     if 'session_id' not in session:
         session['session_id'] = generate_session_id()
 
-    # fetch chat history from the database
-    chat_history_query = ChatMessage.query.filter_by(
-            user_id=current_user.id,
-            session_id=session['session_id']
-            ).order_by(ChatMessage.timestamp).all()
-
-    chat_history = [
-            {"role": msg.role,
-             "content": process_message_for_bold_and_paragraphs(msg.content)}
-            for msg in chat_history_query
-        ]
-
-    # load instructions from the database
-    user_instruction = ChatConfiguration.query.filter_by(role='user').first()
-
-    assistant_instruction = (
-            ChatConfiguration.query
-            .filter_by(role='assistant')
-            .first()
-        )
+    # instructions are cached in process, see `get_chat_instructions`
+    instructions = get_chat_instructions()
+    user_instruction = instructions.user
+    assistant_instruction = instructions.assistant
 
     if not user_instruction or not assistant_instruction:
         flash(
@@ -183,96 +174,177 @@ def chat_page():
                 "error"
             )
 
-        return render_template("chat.html", history=chat_history)
+        return render_template("chat.html", history=[])
 
     if request.method == "POST":
         user_input = request.form.get("user_feeling", "").strip()
         if not user_input:
             return jsonify({"error": "Message cannot be empty"}), 400
 
-        # save user message to the database
-        user_message = ChatMessage(
-                user_id=current_user.id,
-                role='user',
-                content=user_input,
-                timestamp=datetime.now(timezone.utc),
-                session_id=session['session_id']
-                )
-        db.session.add(user_message)
-        db.session.commit()
+        user_id = current_user.id
+        chat_history_for_gemini = build_context(
+                instructions.history_prefix, user_id, session['session_id']
+            )
 
-        detected_emotion = detect_sentiment_with_gemini(user_input)
-        if analyze_intent_with_gemini(user_input):
-            assistant_response = search_gospel_song(detected_emotion)
-        else:
-            chat_history_for_gemini = []
-            if user_instruction:
-                chat_history_for_gemini.append(
-                        {
-                            "role": "user",
-                            "parts": [user_instruction.content]
-                        }
-                    )
-
-            if assistant_instruction:
-                chat_history_for_gemini.append(
-                        {
-                            "role": "assistant",
-                            "parts": [assistant_instruction.content]
-                        }
-                    )
-
-            for message in chat_history_query:
-                chat_history_for_gemini.append(
-                        {
-                            "role": message.role,
-                            "parts": [
-                                process_message_for_bold_and_paragraphs(
-                                    message.content
-                                )
-                            ]
-                        }
-                    )
-
-            assistant_response = generative_ai_response(
-                    user_input, chat_history_for_gemini
-                )
+        user_timestamp = datetime.now(timezone.utc)
+        # release the connection while the reply is generated
+        db.session.close()
 
-        # save assistant response to the database
-        assistant_message = ChatMessage(
-                user_id=current_user.id,
-                role='assistant',
-                content=assistant_response,
-                timestamp=datetime.now(timezone.utc),
-                session_id=session['session_id']
-                )
-        db.session.add(assistant_message)
-        db.session.commit()
+        assistant_response = respond_to_message(
+                user_input, chat_history_for_gemini, user_id
+            )
+
+        # save both messages of the turn, see `store_turn`
+        user_row, assistant_row = store_turn(
+                user_id, session['session_id'],
+                [
+                    ('user', user_input, user_timestamp),
+                    ('assistant', assistant_response,
+                     datetime.now(timezone.utc)),
+                ]
+            )
 
         return jsonify(
                 {
                     "user_input": user_input,
-                    "assistant_response": assistant_response
+                    "assistant_response": assistant_response,
+                    "rendered_html": assistant_row["rendered_html"]
                 }
             )
 
-    chat_sessions = db.session.query(ChatMessage.session_id) \
-        .filter_by(user_id=current_user.id) \
-        .group_by(ChatMessage.session_id) \
-        .order_by(db.func.max(ChatMessage.timestamp).desc()) \
-        .all()
-    chat_files = [session_id[0] for session_id in chat_sessions]
+    # only the latest page is rendered, older ones load on scroll
+    messages, next_cursor = get_message_page(
+            current_user.id, session['session_id']
+        )
+    chat_history = [
+            {"role": msg.role, "content": msg.rendered_html}
+            for msg in messages
+        ]
+
+    chat_files = get_chat_files_for_user(current_user.id)
 
     return render_template(
             "chat.html",
             history=chat_history,
+            session_id=session['session_id'],
+            next_cursor=next_cursor,
             user_instruction=user_instruction,
             assistant_instruction=assistant_instruction,
             chat_files=chat_files,
-            get_chat_preview=get_chat_preview,
+            chat_previews=get_chat_previews(current_user.id, chat_files),
             )
 
 
+@app.route("/chat/<session_id>/messages")
+@login_required
+def chat_messages(session_id):
+    """
+    Returns a page of a session's older messages for infinite scroll.
+    The `before` query parameter is the cursor from the previous page;
+        without it the latest messages are returned.
+
+    Returns:
+        JSON with the page's `messages`, oldest first, and the
+        `next_cursor` to request the page before it, or null.
+    """
+    before = request.args.get("before")
+    cursor = None
+    if before:
+        cursor = decode_cursor(before)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    messages, next_cursor = get_message_page(
+            current_user.id, session_id, cursor
+        )
+    return jsonify(
+            {
+                "messages": [
+                    {
+                        "id": msg.id,
+                        "role": msg.role,
+                        "rendered_html": msg.rendered_html
+                    }
+                    for msg in messages
+                ],
+                "next_cursor": next_cursor
+            }
+        )
+
+
+@app.route("/chat/stream", methods=["POST"])
+@login_required
+def chat_stream():
+    """
+    Streaming variant of the chat POST. Sends the assistant's reply as
+        Server-Sent Events while Gemini generates it, then saves the
+        complete reply once the stream has finished.
+
+    Returns:
+        A `text/event-stream` response. Each event carries a `delta` with
+        the next chunk of text; the final event carries `done` and the
+        full `assistant_response`.
+    """
+    if 'session_id' not in session:
+        session['session_id'] = generate_session_id()
+
+    user_input = request.form.get("user_feeling", "").strip()
+    if not user_input:
+        return jsonify({"error": "Message cannot be empty"}), 400
+
+    instructions = get_chat_instructions()
+    if not instructions.user or not instructions.assistant:
+        return jsonify({"error": "Chat configuration not found"}), 500
+
+    user_id = current_user.id
+    session_id = session['session_id']
+
+    chat_history_for_gemini = build_context(
+            instructions.history_prefix, user_id, session_id
+        )
+
+    user_timestamp = datetime.now(timezone.utc)
+    # release the connection while the reply is generated
+    db.session.close()
+
+    def generate():
+        """Yields the reply as SSE events and saves it when complete."""
+        parts = []
+        for chunk in stream_response_to_message(
+                user_input, chat_history_for_gemini, user_id
+        ):
+            parts.append(chunk)
+            yield f"data: {json.dumps({'delta': chunk})}\n\n"
+
+        assistant_response = "".join(parts)
+
+        # save both messages of the turn, see `store_turn`
+        user_row, assistant_row = store_turn(
+                user_id, session_id,
+                [
+                    ('user', user_input, user_timestamp),
+                    ('assistant', assistant_response,
+                     datetime.now(timezone.utc)),
+                ]
+            )
+
+        done = {
+                "done": True,
+                "assistant_response": assistant_response,
+                "rendered_html": assistant_row["rendered_html"]
+            }
+        yield f"data: {json.dumps(done)}\n\n"
+
+    return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no"
+            }
+        )
+
+
 @app.route("/new_chat", methods=["GET", "POST"])
 @login_required
 def new_chat():
@@ -292,7 +364,8 @@ def new_chat():
         if user_message.strip():
             save_chat_history(
                     current_user.id,
-                    session['session_id'], [user_message]
+                    session['session_id'],
+                    [{"role": "user", "content": user_message}]
                 )
         else:
             return redirect(url_for('new_chat'))
@@ -311,7 +384,11 @@ def load_chats():
     """
     user_id = current_user.id
     chat_files = get_chat_files_for_user(user_id)
-    return render_template("load_chats.html", chat_files=chat_files)
+    return render_template(
+            "load_chats.html",
+            chat_files=chat_files,
+            chat_previews=get_chat_previews(user_id, chat_files)
+        )
 
 
 @app.route("/load_chat/<session_id>")
@@ -343,11 +420,12 @@ def delete_chat(session_id):
         ChatMessage.query.filter_by(
                 user_id=current_user.id, session_id=session_id
             ).delete()
+        ChatSession.query.filter_by(
+                user_id=current_user.id, session_id=session_id
+            ).delete()
+        mark_chat_changed(db.session(), current_user.id, session_id)
         db.session.commit()
 
-        cache.delete_memoized(get_chat_files_for_user, current_user.id)
-        cache.delete_memoized(load_chat_history, current_user.id, session_id)
-        cache.delete_memoized(get_chat_preview, current_user.id, session_id)
         flash('Chat deleted successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -358,3 +436,21 @@ def delete_chat(session_id):
         return redirect(url_for('new_chat'))
 
     return redirect(url_for('chat_page'))
+
+
+@app.route("/metrics")
+def metrics_page():
+    """
+    Exposes request and span timings of every worker for Prometheus.
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when a token is set.
+
+    Returns:
+        Response: The metrics in the Prometheus text format.
+    """
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization") != \
+            f"Bearer {metrics.METRICS_TOKEN}":
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(
+            metrics.render_metrics(),
+            mimetype="text/plain; version=0.0.4; charset=utf-8"
+        )
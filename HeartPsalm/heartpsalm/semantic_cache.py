@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+""" Semantic cache of Gemini replies using local hashed embeddings. """
+import json
+import numpy as np
+import os
+import re
+import tempfile
+import threading
+import zlib
+from heartpsalm import response_cache
+from heartpsalm.config_cache import get_chat_instructions
+from heartpsalm.response_cache import normalize_input
+from heartpsalm.sentiment import NEGATORS
+import atexit
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "false").lower() == "true"
+
+# Replies are reused for messages at least this similar
+SEMANTIC_CACHE_THRESHOLD = float(
+    os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8")
+)
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "20000"))
+# Where the cache is saved between restarts; empty keeps it in memory
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "")
+# The cache is saved after this many new replies, and at exit
+SEMANTIC_CACHE_SAVE_EVERY = int(
+    os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "100")
+)
+
+DIMENSIONS = 256
+
+# Entries are grouped around up to this many centroids, and a lookup
+# only scans the groups of the closest few
+CENTROIDS = 256
+PROBES = 8
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Words that say little about what a message means
+STOPWORDS = {
+    "a", "an", "the", "i", "im", "me", "my", "am", "is", "are", "was",
+    "be", "been", "so", "very", "really", "just", "today", "now", "and",
+    "or", "to", "of", "in", "on", "at", "it", "its", "that", "this",
+    "feel", "feeling", "felt", "you", "your", "do", "does", "with",
+    "for", "about", "quite", "bit", "little", "kind", "of", "right",
+}
+
+
+# Capitalized words that name no one in particular
+COMMON_CAPITALIZED = {
+    "i", "i'm", "i've", "i'll", "i'd", "god", "jesus", "christ", "lord",
+    "bible", "holy", "spirit", "heartpsalm",
+}
+
+WORD_RE = re.compile(r"[A-Za-z0-9']+|[.!?]")
+
+
+def content_words(text):
+    """
+    The words of a message that carry its meaning.
+
+    Returns:
+        list: The lowercase words, without STOPWORDS, in order.
+    """
+    return [
+        word for word in TOKEN_RE.findall(normalize_input(text))
+        if word not in STOPWORDS
+    ]
+
+
+def has_personal_details(text):
+    """
+    Whether a message has a number or a capitalized word inside a
+        sentence, such as a name, a date or an age, which its reply may
+        repeat to whoever sends a similar message.
+    """
+    sentence_start = True
+    for token in WORD_RE.findall(text):
+        if token in ".!?":
+            sentence_start = True
+            continue
+        if any(char.isdigit() for char in token):
+            return True
+        if not sentence_start and token[0].isupper() and \
+                token.lower() not in COMMON_CAPITALIZED:
+            return True
+        sentence_start = False
+    return False
+
+
+def embed(text):
+    """
+    Embeds a message as a unit vector of signed, hashed features: its
+        content words, weighted double, and their character trigrams.
+
+    Returns:
+        numpy.ndarray: The float32 embedding, all zeros for empty text.
+    """
+    words = content_words(text)
+    features = [(f"w:{word}", 2.0) for word in words]
+    for word in words:
+        padded = f" {word} "
+        features.extend(
+            (padded[start:start + 3], 1.0)
+            for start in range(len(padded) - 2)
+        )
+    if not features:
+        return np.zeros(DIMENSIONS, dtype=np.float32)
+
+    hashes = np.fromiter(
+        (zlib.crc32(feature.encode()) for feature, _ in features),
+        dtype=np.int64, count=len(features)
+    )
+    weights = np.fromiter(
+        (weight for _, weight in features),
+        dtype=np.float64, count=len(features)
+    )
+    # the bit above the bucket picks the sign, so collisions cancel out
+    signs = np.where((hashes // DIMENSIONS) % 2 == 0, 1.0, -1.0)
+    vector = np.bincount(
+        hashes % DIMENSIONS, weights * signs, minlength=DIMENSIONS
+    ).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def is_negated(text):
+    """Whether a message contains a negation, which flips its meaning."""
+    return any(
+        token in NEGATORS for token in TOKEN_RE.findall(text.lower())
+    )
+
+
+class SemanticCache:
+    """
+    A bounded, least-recently-used map from message embeddings to
+        replies, searched by cosine similarity. A reply is only reused
+        for a message with the same content words, so one written about
+        "Mark" is never sent to someone writing about "Tom".
+    Embeddings live in one contiguous block per centroid (an inverted
+        file index), so a lookup scans only the few blocks closest to
+        the message instead of every entry.
+    """
+
+    def __init__(self, capacity=SEMANTIC_CACHE_CAPACITY,
+                 threshold=SEMANTIC_CACHE_THRESHOLD):
+        """Creates an empty cache."""
+        self.capacity = capacity
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self, version=None):
+        """Drops every entry, e.g. when the instructions change."""
+        self.version = version
+        self._clock = 0
+        self.centroids = np.zeros((CENTROIDS, DIMENSIONS), dtype=np.float32)
+        self.n_centroids = 0
+        # per centroid: a block of vectors and the slots they belong to
+        self._vectors = [None] * CENTROIDS
+        self._slots = [None] * CENTROIDS
+        self._sizes = np.zeros(CENTROIDS, dtype=np.int64)
+        # per slot
+        self.replies = [None] * self.capacity
+        self.words = [None] * self.capacity
+        self.negated = np.zeros(self.capacity, dtype=bool)
+        self.last_used = np.full(self.capacity, -1, dtype=np.int64)
+        self._group = np.full(self.capacity, -1, dtype=np.int64)
+        self._position = np.zeros(self.capacity, dtype=np.int64)
+        self.size = 0
+
+    def use_version(self, version):
+        """Empties the cache if it holds replies for other instructions."""
+        with self._lock:
+            if self.version != version:
+                self.clear(version)
+
+    def __len__(self):
+        """The number of cached replies."""
+        return self.size
+
+    def _tick(self):
+        """Advances the clock used to find the least recently used."""
+        self._clock += 1
+        return self._clock
+
+    def lookup(self, text, vector=None):
+        """
+        Finds the reply cached for the most similar message.
+
+        Args:
+            text (str): The user's message.
+            vector (numpy.ndarray): Optional precomputed `embed(text)`.
+
+        Returns:
+            str: The cached reply, or None if nothing is similar enough.
+        """
+        if vector is None:
+            vector = embed(text)
+        negated = is_negated(text)
+        words = frozenset(content_words(text))
+        with self._lock:
+            if self.n_centroids == 0 or not vector.any():
+                return None
+            closest = self.centroids[:self.n_centroids] @ vector
+            probes = min(PROBES, self.n_centroids)
+            groups = np.argpartition(-closest, probes - 1)[:probes]
+
+            best_slot, best_score = -1, self.threshold
+            for group in groups:
+                size = self._sizes[group]
+                if not size:
+                    continue
+                scores = self._vectors[group][:size] @ vector
+                for position in np.flatnonzero(scores >= best_score):
+                    slot = self._slots[group][position]
+                    if scores[position] >= best_score and \
+                            self.negated[slot] == negated and \
+                            self.words[slot] == words:
+                        best_slot, best_score = slot, scores[position]
+            if best_slot < 0:
+                return None
+            self.last_used[best_slot] = self._tick()
+            return self.replies[best_slot]
+
+    def add(self, text, reply, vector=None):
+        """
+        Caches a reply, evicting the least recently used one when full.
+
+        Args:
+            text (str): The user's message.
+            reply (str): The reply to reuse for similar messages.
+            vector (numpy.ndarray): Optional precomputed `embed(text)`.
+        """
+        if vector is None:
+            vector = embed(text)
+        if not vector.any():
+            return
+        with self._lock:
+            if self.size < self.capacity:
+                slot = self.size
+                self.size += 1
+            else:
+                slot = int(np.argmin(self.last_used))
+                self._remove(slot)
+            self._insert(
+                slot, vector, reply, is_negated(text),
+                frozenset(content_words(text))
+            )
+
+    def _insert(self, slot, vector, reply, negated, words, group=None):
+        """Stores an entry in a slot and in its centroid's block."""
+        if group is None and self.n_centroids < CENTROIDS:
+            # the first entries seed the centroids
+            group = self.n_centroids
+            self.centroids[group] = vector
+            self.n_centroids += 1
+        elif group is None:
+            group = int(np.argmax(self.centroids @ vector))
+
+        size = self._sizes[group]
+        block = self._vectors[group]
+        if block is None or size == len(block):
+            grown = max(16, 2 * size)
+            new_block = np.zeros((grown, DIMENSIONS), dtype=np.float32)
+            new_slots = np.zeros(grown, dtype=np.int64)
+            if block is not None:
+                new_block[:size] = block[:size]
+                new_slots[:size] = self._slots[group][:size]
+            self._vectors[group] = new_block
+            self._slots[group] = new_slots
+        self._vectors[group][size] = vector
+        self._slots[group][size] = slot
+        self._sizes[group] = size + 1
+
+        self.replies[slot] = reply
+        self.words[slot] = words
+        self.negated[slot] = negated
+        self.last_used[slot] = self._tick()
+        self._group[slot] = group
+        self._position[slot] = size
+
+    def _remove(self, slot):
+        """Removes a slot's vector, moving its block's last one into it."""
+        group = self._group[slot]
+        position = self._position[slot]
+        last = self._sizes[group] - 1
+        if position != last:
+            moved = self._slots[group][last]
+            self._vectors[group][position] = self._vectors[group][last]
+            self._slots[group][position] = moved
+            self._position[moved] = position
+        self._sizes[group] = last
+        self.replies[slot] = None
+        self.words[slot] = None
+        self._group[slot] = -1
+
+    def save(self, path):
+        """
+        Writes the cache to disk atomically, so it survives restarts.
+
+        Args:
+            path (str): The .npz file to write.
+        """
+        with self._lock:
+            vectors = np.zeros((self.size, DIMENSIONS), dtype=np.float32)
+            for group in range(self.n_centroids):
+                size = self._sizes[group]
+                if size:
+                    slots = self._slots[group][:size]
+                    vectors[slots] = self._vectors[group][:size]
+            arrays = {
+                "vectors": vectors,
+                "centroids": self.centroids[:self.n_centroids],
+                "groups": self._group[:self.size],
+                "negated": self.negated[:self.size],
+                "last_used": self.last_used[:self.size],
+                # text goes in as JSON so loading never unpickles
+                "meta": np.frombuffer(json.dumps({
+                    "version": self.version,
+                    "replies": self.replies[:self.size],
+                    "words": [
+                        sorted(words) for words in self.words[:self.size]
+                    ],
+                }).encode(), dtype=np.uint8),
+            }
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+                dir=directory, suffix=".npz", delete=False) as temporary:
+            np.savez(temporary, **arrays)
+        os.replace(temporary.name, path)
+
+    def load(self, path):
+        """
+        Reads a cache written by `save`, keeping the most recently used
+            entries that fit in this cache's capacity.
+
+        Args:
+            path (str): The .npz file to read.
+        """
+        with np.load(path) as saved:
+            meta = json.loads(saved["meta"].tobytes())
+            if "words" not in meta:
+                # saved before replies were matched on their words
+                return
+            vectors = saved["vectors"]
+            centroids = saved["centroids"]
+            groups = saved["groups"]
+            negated = saved["negated"]
+            # oldest first, so the reloaded clock keeps their order
+            order = np.argsort(saved["last_used"])[-self.capacity:]
+        entries = [
+            (vectors[index], meta["replies"][index], bool(negated[index]),
+             frozenset(meta["words"][index]), int(groups[index]))
+            for index in order
+        ]
+        with self._lock:
+            self.clear(meta["version"])
+            self.centroids[:len(centroids)] = centroids
+            self.n_centroids = len(centroids)
+            for slot, entry in enumerate(entries):
+                self.size += 1
+                self._insert(slot, *entry)
+
+
+semantic_cache = SemanticCache()
+_state_lock = threading.Lock()
+_state = {"loaded": False, "unsaved": 0}
+
+
+def _eligible(user_input):
+    """
+    Whether a message is short enough to be worth matching and names no
+        one, as replies to first messages often repeat what they say.
+    """
+    normalized = normalize_input(user_input)
+    return bool(normalized) and \
+        len(normalized) <= response_cache.RESPONSE_CACHE_MAX_INPUT and \
+        not has_personal_details(user_input)
+
+
+def _current_cache():
+    """
+    Returns the process's cache, loading it from SEMANTIC_CACHE_PATH on
+        first use and emptying it when the instructions change.
+    """
+    with _state_lock:
+        if not _state["loaded"]:
+            _state["loaded"] = True
+            if SEMANTIC_CACHE_PATH and os.path.exists(SEMANTIC_CACHE_PATH):
+                try:
+                    semantic_cache.load(SEMANTIC_CACHE_PATH)
+                except Exception as e:
+                    print(f"Error loading the semantic cache: {e}")
+    semantic_cache.use_version(get_chat_instructions().version or "0")
+    return semantic_cache
+
+
+def lookup_reply(user_input):
+    """
+    Finds a cached reply to a context-free message similar to this one.
+
+    Args:
+        user_input (str): The user's message.
+
+    Returns:
+        str: The cached reply, or None on a miss or when the cache is off.
+    """
+    if not SEMANTIC_CACHE or not _eligible(user_input):
+        return None
+    reply = _current_cache().lookup(user_input)
+    response_cache.count(
+        "semantic", "hits" if reply is not None else "misses"
+    )
+    return reply
+
+
+def store_reply(user_input, reply):
+    """
+    Caches the reply to a context-free message, saving the cache to disk
+        every SEMANTIC_CACHE_SAVE_EVERY replies.
+
+    Args:
+        user_input (str): The user's message.
+        reply (str): Gemini's reply.
+    """
+    if not SEMANTIC_CACHE or not _eligible(user_input) or \
+            len(reply) > response_cache.RESPONSE_CACHE_MAX_ANSWER:
+        return
+    _current_cache().add(user_input, reply)
+    with _state_lock:
+        _state["unsaved"] += 1
+        due = _state["unsaved"] >= SEMANTIC_CACHE_SAVE_EVERY
+    if due:
+        save()
+
+
+def save():
+    """Writes the cache to SEMANTIC_CACHE_PATH, if set and changed."""
+    with _state_lock:
+        if not SEMANTIC_CACHE_PATH or not _state["unsaved"]:
+            return
+        _state["unsaved"] = 0
+    try:
+        semantic_cache.save(SEMANTIC_CACHE_PATH)
+    except Exception as e:
+        print(f"Error saving the semantic cache: {e}")
+
+
+atexit.register(save)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+""" Local lexicon-based sentiment and emotion analysis. """
+import re
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z']+")
+
+# Valence of common feeling words, from -3 (very negative) to 3
+VALENCE = {
+    "happy": 2, "glad": 2, "joy": 3, "joyful": 3, "excited": 2,
+    "great": 2, "good": 1, "wonderful": 3, "amazing": 2, "awesome": 2,
+    "love": 2, "loved": 2, "loving": 2, "hope": 1, "hopeful": 2,
+    "peace": 2, "peaceful": 2, "calm": 1, "content": 1, "fine": 1,
+    "better": 1, "best": 2, "proud": 2, "strong": 1, "confident": 2,
+    "relieved": 2, "delighted": 3, "cheerful": 2, "smile": 1,
+    "smiling": 1, "laugh": 1, "fun": 1, "beautiful": 2, "nice": 1,
+    "encouraged": 2, "inspired": 2, "free": 1, "safe": 1, "healed": 2,
+    "celebrate": 2, "celebrating": 2, "won": 2, "success": 2,
+    "promoted": 2, "married": 1, "wedding": 1, "okay": 0, "ok": 0,
+    "sad": -2, "unhappy": -2, "depressed": -3, "down": -1, "low": -1,
+    "lonely": -2, "alone": -1, "empty": -2, "hopeless": -3,
+    "helpless": -2, "worthless": -3, "anxious": -2, "anxiety": -2,
+    "worried": -2, "worry": -2, "stressed": -2, "stress": -2,
+    "afraid": -2, "scared": -2, "fear": -2, "fearful": -2,
+    "nervous": -1, "panic": -3, "angry": -2, "anger": -2, "mad": -2,
+    "furious": -3, "frustrated": -2, "annoyed": -1, "bitter": -2,
+    "hurt": -2, "pain": -2, "painful": -2, "broken": -2,
+    "heartbroken": -3, "grief": -3, "grieving": -3, "mourning": -3,
+    "lost": -2, "loss": -2, "died": -3, "death": -2, "dead": -2,
+    "sick": -2, "ill": -2, "tired": -1, "exhausted": -2, "weary": -2,
+    "overwhelmed": -2, "confused": -1, "guilty": -2, "guilt": -2,
+    "ashamed": -2, "shame": -2, "betrayed": -3, "rejected": -2,
+    "abandoned": -3, "hate": -3, "terrible": -3, "awful": -3,
+    "bad": -2, "worse": -2, "worst": -3, "cry": -2, "crying": -2,
+    "tears": -2, "miss": -1, "struggle": -2, "struggling": -2,
+    "suffering": -3, "failed": -2, "failure": -2, "fired": -2,
+    "jobless": -2, "divorce": -2, "sorrow": -3, "doubt": -1,
+    "hard": -1, "difficult": -1, "troubled": -2, "trouble": -2,
+    "upset": -2, "insecure": -2, "jealous": -1, "sleepless": -2,
+}
+
+# Gratitude and praise words point to a praise song
+PRAISE = {
+    "thank": 2, "thanks": 2, "thankful": 3, "grateful": 3,
+    "gratitude": 3, "blessed": 3, "blessing": 2, "blessings": 2,
+    "praise": 3, "praising": 3, "hallelujah": 3, "glory": 2,
+    "glorify": 3, "amen": 1, "testimony": 2, "favour": 2, "favor": 2,
+    "faithful": 1, "answered": 2, "goodness": 2, "rejoice": 3,
+    "rejoicing": 3,
+}
+
+# Reverent, devotional words point to a worship song
+WORSHIP = {
+    "worship": 3, "pray": 2, "praying": 2, "prayer": 2, "holy": 2,
+    "lord": 1, "god": 1, "jesus": 1, "spirit": 1, "adore": 3,
+    "reverence": 3, "devotion": 2, "meditate": 2, "presence": 2,
+    "surrender": 2, "seek": 1, "quiet": 1, "still": 1, "church": 1,
+}
+
+NEGATORS = {
+    "not", "no", "never", "don't", "dont", "can't", "cant", "cannot",
+    "isn't", "wasn't", "aren't", "didn't", "doesn't", "won't", "hardly",
+}
+NEGATION_SCOPE = 3
+
+VOCABULARY = sorted(set(VALENCE) | set(PRAISE) | set(WORSHIP) | NEGATORS)
+WORD_INDEX = {word: index for index, word in enumerate(VOCABULARY)}
+
+# One row per vocabulary word: valence, praise and worship weights
+WEIGHTS = np.zeros((len(VOCABULARY), 3), dtype=np.float32)
+for _column, _lexicon in enumerate((VALENCE, PRAISE, WORSHIP)):
+    for _word, _weight in _lexicon.items():
+        WEIGHTS[WORD_INDEX[_word], _column] = _weight
+IS_NEGATOR = np.array([word in NEGATORS for word in VOCABULARY])
+
+VALENCE_THRESHOLD = 1.0
+
+
+def _lexicon_hits(text):
+    """
+    Finds the lexicon words of a message and whether each is negated.
+
+    Returns:
+        tuple: Lists of vocabulary indices and +1/-1 negation signs.
+    """
+    indices = []
+    signs = []
+    negated_until = -1
+    for position, token in enumerate(TOKEN_RE.findall(text.lower())):
+        index = WORD_INDEX.get(token)
+        if index is None:
+            continue
+        if IS_NEGATOR[index]:
+            negated_until = position + NEGATION_SCOPE
+            continue
+        indices.append(index)
+        signs.append(-1.0 if position <= negated_until else 1.0)
+    return indices, signs
+
+
+def score_messages(messages):
+    """
+    Scores many messages at once. The lexicon hits of every message are
+        gathered into flat arrays and summed per message in one NumPy pass.
+
+    Args:
+        messages (list): The messages to score.
+
+    Returns:
+        numpy.ndarray: One row per message holding its valence,
+            praise and worship scores.
+    """
+    message_ids = []
+    indices = []
+    signs = []
+    for message_id, text in enumerate(messages):
+        hit_indices, hit_signs = _lexicon_hits(text)
+        message_ids.extend([message_id] * len(hit_indices))
+        indices.extend(hit_indices)
+        signs.extend(hit_signs)
+
+    scores = np.zeros((len(messages), 3), dtype=np.float32)
+    if indices:
+        contributions = WEIGHTS[indices]
+        # negation flips valence and cancels praise and worship
+        contributions[:, 0] *= signs
+        contributions[:, 1:] *= np.maximum(signs, 0)[:, None]
+        np.add.at(scores, message_ids, contributions)
+    return scores
+
+
+def emotions_from_scores(scores):
+    """
+    Maps score rows onto the emotions `search_gospel_song` understands.
+
+    Returns:
+        list: "praise", "joyful", "comforting" or "worship" per row.
+    """
+    valence, praise, worship = scores[:, 0], scores[:, 1], scores[:, 2]
+    is_praise = (praise > 0) & (praise >= worship)
+    labels = np.select(
+        [
+            is_praise & (valence > -VALENCE_THRESHOLD),
+            valence >= VALENCE_THRESHOLD,
+            valence <= -VALENCE_THRESHOLD,
+        ],
+        ["praise", "joyful", "comforting"],
+        default="worship",
+    )
+    return labels.tolist()
+
+
+def detect_emotions(messages):
+    """
+    Detects the emotion of many messages at once, e.g. for backfills.
+
+    Returns:
+        list: The detected emotion of each message.
+    """
+    return emotions_from_scores(score_messages(messages))
+
+
+def detect_emotion(message):
+    """
+    Detects the emotion of a single message.
+
+    Returns:
+        str: "joyful", "worship", "comforting" or "praise".
+    """
+    return detect_emotions([message])[0]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" Runs the independent external calls of a chat turn concurrently. """
+from heartpsalm import app
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import threading
+import time
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TURN_EXECUTOR_WORKERS", "8")),
+    thread_name_prefix="turn"
+)
+
+
+def timed(name, fn, *args, **kwargs):
+    """
+    Calls `fn` on the current thread and logs how long it took.
+
+    Args:
+        name (str): The name the call is logged under.
+        fn (callable): The function to call with the remaining arguments.
+
+    Returns:
+        The result of `fn`.
+    """
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        app.logger.info(
+            "turn call %s took %.1f ms",
+            name, (time.perf_counter() - started) * 1000
+        )
+
+
+def _run_in_app_context(name, fn, args, kwargs):
+    """Runs a timed call on a pool thread inside an app context."""
+    with app.app_context():
+        return timed(name, fn, *args, **kwargs)
+
+
+def submit(name, fn, *args, **kwargs):
+    """
+    Starts `fn` on the bounded turn pool.
+
+    Args:
+        name (str): The name the call is logged under.
+        fn (callable): The function to call with the remaining arguments.
+
+    Returns:
+        concurrent.futures.Future: The pending result of `fn`.
+    """
+    return executor.submit(_run_in_app_context, name, fn, args, kwargs)
+
+
+class SpeculativeStream:
+    """
+    Consumes a generator on the turn pool ahead of time, buffering its
+        chunks until the caller decides whether it wants them.
+    """
+    _DONE = object()
+
+    def __init__(self, name, generator_fn, *args, **kwargs):
+        """Starts consuming `generator_fn(*args, **kwargs)` in the pool."""
+        self._chunks = queue.Queue()
+        self._cancelled = threading.Event()
+        self.future = submit(name, self._fill, generator_fn, args, kwargs)
+
+    def _fill(self, generator_fn, args, kwargs):
+        """Moves chunks into the buffer until exhausted or cancelled."""
+        chunks = generator_fn(*args, **kwargs)
+        try:
+            for chunk in chunks:
+                if self._cancelled.is_set():
+                    break
+                self._chunks.put(chunk)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            self._chunks.put(self._DONE)
+
+    def cancel(self):
+        """Discards the stream, stopping it early if it is still running."""
+        self._cancelled.set()
+        self.future.cancel()
+
+    def __iter__(self):
+        """Yields the buffered chunks, waiting for new ones as they come."""
+        while True:
+            chunk = self._chunks.get()
+            if chunk is self._DONE:
+                return
+            yield chunk
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+""" Local Bible verse corpus with full-text and emotion-tag indexes. """
+from collections import defaultdict, namedtuple
+import os
+import random
+import re
+import threading
+import numpy as np
+from heartpsalm.sentiment import NEGATORS
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Curated `reference<TAB>tags<TAB>text` lines (KJV, public domain)
+VERSES_PATH = os.path.join(DATA_DIR, "verses.tsv")
+# Optional full translation as `reference<TAB>text` lines, e.g. the WEB;
+# its wording replaces the curated text and its verses become searchable
+VERSE_CORPUS_PATH = os.getenv("VERSE_CORPUS_PATH", "")
+
+# "off", "ground" to quote a few verses to Gemini, or "answer" to also
+# reply to routine "I feel X" messages from the corpus alone
+VERSE_RETRIEVAL = os.getenv("VERSE_RETRIEVAL", "ground").lower()
+GROUNDING_VERSES = int(os.getenv("GROUNDING_VERSES", "3"))
+# The BM25 score a searched verse needs to be quoted; one shared common
+# word scores about 3, a shared rare word or two common ones more than 4
+GROUNDING_MIN_SCORE = float(os.getenv("GROUNDING_MIN_SCORE", "4.0"))
+# Longer messages say more than a feeling and are left to Gemini
+ROUTINE_MAX_WORDS = 10
+
+Verse = namedtuple("Verse", ["reference", "text", "tags"])
+
+TOKEN_RE = re.compile(r"[a-z']+")
+REFERENCE_RE = re.compile(r"^(.+?) (\d+):(\d+)(?:-(\d+))?$")
+
+# "I feel so X", "I'm really X", "feeling X"...
+FEELING_RE = re.compile(
+    r"\b(?:i (?:am|feel|felt)|i'm|im|feeling)"
+    r"(?: (?:so|very|really|quite|pretty|extremely|too|just|a bit|"
+    r"a little|kind of|sort of))* ([a-z]+)"
+)
+
+# The words a user may name a feeling with, by the tag of its verses
+FEELINGS = {
+    "anxious": (
+        "anxious", "anxiety", "worried", "nervous", "stressed",
+        "overwhelmed", "uneasy", "restless", "tense", "panicking",
+    ),
+    "afraid": ("afraid", "scared", "fearful", "frightened", "terrified"),
+    "sad": (
+        "sad", "unhappy", "depressed", "down", "low", "blue",
+        "heartbroken", "broken", "miserable", "hurt", "hurting",
+    ),
+    "grieving": ("grieving", "mourning", "bereaved"),
+    "lonely": ("lonely", "alone", "isolated", "abandoned", "forgotten"),
+    "weary": (
+        "tired", "weary", "exhausted", "drained", "burnt", "weak", "worn",
+    ),
+    "angry": (
+        "angry", "mad", "furious", "frustrated", "bitter", "annoyed",
+        "resentful", "irritated",
+    ),
+    "guilty": ("guilty", "ashamed", "condemned", "unworthy"),
+    "doubting": ("doubtful", "doubting", "confused", "lost", "unsure"),
+    "sick": ("sick", "ill", "unwell", "injured"),
+    "hopeless": (
+        "hopeless", "helpless", "discouraged", "defeated", "desperate",
+        "stuck",
+    ),
+    "rejected": (
+        "rejected", "unloved", "worthless", "unwanted", "betrayed",
+        "insecure",
+    ),
+    "joyful": (
+        "happy", "joyful", "glad", "excited", "cheerful", "great",
+        "wonderful", "amazing", "good", "delighted",
+    ),
+    "grateful": ("grateful", "thankful", "blessed", "appreciative"),
+}
+FEELING_TAGS = {
+    word: tag for tag, words in FEELINGS.items() for word in words
+}
+
+# The emotions of `heartpsalm.sentiment` are tags too
+EMOTION_TAGS = {
+    "joyful": ("joyful",),
+    "praise": ("grateful",),
+    "worship": ("worship",),
+    "comforting": (
+        "anxious", "afraid", "sad", "grieving", "lonely", "weary", "angry",
+        "guilty", "doubting", "sick", "hopeless", "rejected",
+    ),
+}
+
+OPENERS = {
+    "joyful": "I'm so glad you're feeling {feeling}! "
+              "Here is a verse to celebrate with:",
+    "grateful": "Amen! Here is a verse for your thanksgiving:",
+}
+DEFAULT_OPENER = (
+    "I'm sorry you're feeling {feeling}. Here is a verse to hold on to:"
+)
+
+# Common, conversational and archaic words that carry no meaning in a
+# search, so small talk such as "can you tell me a joke" matches nothing
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "to", "in", "on", "for", "with", "at",
+    "by", "from", "about", "into", "out", "up", "down", "over", "off",
+    "is", "are", "was", "were", "be", "been", "being", "it", "its", "that",
+    "this", "these", "those", "there", "here", "then", "than", "i", "im",
+    "i'm", "me", "my", "myself", "you", "your", "you're", "we", "us",
+    "our", "he", "him", "his", "she", "her", "they", "them", "their",
+    "as", "but", "or", "if", "so", "not", "no", "all", "any", "some",
+    "which", "who", "whom", "what", "when", "where", "why", "how", "am",
+    "do", "does", "did", "don't", "have", "has", "had", "will", "would",
+    "shall", "should", "can", "can't", "could", "may", "might", "must",
+    "just", "like", "want", "need", "get", "got", "go", "going", "make",
+    "let", "tell", "say", "said", "know", "think", "really", "very",
+    "too", "also", "only", "now", "today", "tomorrow", "yesterday",
+    "please", "thanks", "thank", "hello", "hi", "hey", "ok", "okay",
+    "yes", "yeah", "well", "oh", "again", "more", "much", "one",
+    "something", "anything", "what's", "that's", "it's", "unto", "thee",
+    "thou", "thy", "thine", "ye", "hath", "doth", "upon", "feel",
+    "feeling",
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_lock = threading.Lock()
+_index = None
+
+
+def tokenize(text):
+    """
+    Lowercases a text and splits it into the words worth indexing.
+
+    Returns:
+        list: The tokens of the text, without stopwords.
+    """
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+def _reference_keys(reference):
+    """Expands "Book 1:2-3" into the single-verse references it covers."""
+    match = REFERENCE_RE.match(reference)
+    if not match:
+        return [reference]
+    book, chapter, first, last = match.groups()
+    return [
+        f"{book} {chapter}:{number}"
+        for number in range(int(first), int(last or first) + 1)
+    ]
+
+
+def load_verses(path=VERSES_PATH, corpus_path=VERSE_CORPUS_PATH):
+    """
+    Reads the curated verses and, optionally, a full translation.
+
+    Args:
+        path (str): The curated `reference<TAB>tags<TAB>text` file.
+        corpus_path (str): Optional `reference<TAB>text` translation.
+
+    Returns:
+        list: The Verse tuples, curated ones first in file order.
+    """
+    translation = {}
+    if corpus_path:
+        with open(corpus_path, encoding="utf-8") as corpus:
+            for line in corpus:
+                if "\t" in line:
+                    reference, text = line.rstrip("\n").split("\t", 1)
+                    translation[reference.strip()] = text.strip()
+
+    verses = []
+    curated = set()
+    with open(path, encoding="utf-8") as dataset:
+        for line in dataset:
+            if not line.strip():
+                continue
+            reference, tags, text = line.rstrip("\n").split("\t", 2)
+            keys = _reference_keys(reference)
+            if all(key in translation for key in keys):
+                text = " ".join(translation[key] for key in keys)
+            curated.update(keys)
+            verses.append(Verse(reference, text, tuple(tags.split(","))))
+
+    verses.extend(
+        Verse(reference, text, ())
+        for reference, text in translation.items()
+        if reference not in curated
+    )
+    return verses
+
+
+class VerseIndex:
+    """
+    An inverted index of verse words scored with BM25, and a tag index
+        from feelings and emotions to their verses.
+    Postings and their BM25 weights are computed once, so a search is a
+        few NumPy scatter-adds and a tag lookup is a dict access.
+    """
+
+    def __init__(self, verses):
+        """Builds both indexes over the verses."""
+        self.verses = verses
+        lengths = np.zeros(len(verses), dtype=np.float32)
+        counts = defaultdict(lambda: defaultdict(int))
+        for verse_id, verse in enumerate(verses):
+            tokens = tokenize(verse.text)
+            lengths[verse_id] = len(tokens)
+            for token in tokens:
+                counts[token][verse_id] += 1
+
+        average = lengths.mean() if len(verses) else 1.0
+        self.postings = {}
+        for token, by_verse in counts.items():
+            ids = np.fromiter(by_verse, dtype=np.int32, count=len(by_verse))
+            frequencies = np.fromiter(
+                by_verse.values(), dtype=np.float32, count=len(by_verse)
+            )
+            idf = np.log(
+                1 + (len(verses) - len(ids) + 0.5) / (len(ids) + 0.5)
+            )
+            weights = idf * frequencies * (K1 + 1) / (
+                frequencies + K1 * (1 - B + B * lengths[ids] / average)
+            )
+            self.postings[token] = (ids, weights.astype(np.float32))
+
+        by_tag = defaultdict(list)
+        for verse in verses:
+            for tag in verse.tags:
+                by_tag[tag].append(verse)
+        for emotion, tags in EMOTION_TAGS.items():
+            by_tag[emotion] = [
+                verse for verse in verses
+                if any(tag in verse.tags for tag in tags)
+            ]
+        self.tags = {tag: tuple(found) for tag, found in by_tag.items()}
+
+    def for_tag(self, tag, k=None):
+        """
+        Returns the verses of a feeling or emotion tag, best first.
+
+        Args:
+            tag (str): A FEELINGS or EMOTION_TAGS key.
+            k (int): Optional maximum number of verses.
+
+        Returns:
+            tuple: The matching Verse tuples.
+        """
+        found = self.tags.get(tag, ())
+        return found if k is None else found[:k]
+
+    def search(self, query, k=3):
+        """
+        Finds the verses whose words best match a query.
+
+        Args:
+            query (str): Free text, e.g. the user's message.
+            k (int): The maximum number of verses.
+
+        Returns:
+            list: (Verse, score) tuples, best first, all scoring above 0.
+        """
+        scores = np.zeros(len(self.verses), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.verses[i], float(scores[i])) for i in matched]
+
+
+def get_index():
+    """
+    Returns the process's verse index, built on first use.
+
+    Returns:
+        VerseIndex: The index over the curated verses and VERSE_CORPUS_PATH.
+    """
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = VerseIndex(load_verses())
+    return _index
+
+
+def detect_feeling(user_input):
+    """
+    Finds the feeling named by an "I feel X" style message.
+
+    Returns:
+        tuple: The feeling tag and the user's word for it, or None when
+            no known feeling is named or the message is negated.
+    """
+    text = user_input.lower()
+    if any(token in NEGATORS for token in TOKEN_RE.findall(text)):
+        return None
+    for match in FEELING_RE.finditer(text):
+        tag = FEELING_TAGS.get(match.group(1))
+        if tag is not None:
+            return tag, match.group(1)
+    return None
+
+
+def verses_for_emotion(emotion, k=GROUNDING_VERSES):
+    """
+    Returns the top verses for a detected feeling or emotion.
+
+    Args:
+        emotion (str): A feeling tag, or an emotion from `detect_emotion`.
+        k (int): The maximum number of verses.
+
+    Returns:
+        tuple: The Verse tuples, best first.
+    """
+    return get_index().for_tag(emotion, k)
+
+
+def answer_from_verses(user_input):
+    """
+    Answers a routine "I feel X" message with a verse for the feeling.
+    Only short statements are answered, questions and longer messages
+        are left to Gemini.
+
+    Args:
+        user_input (str): The user's input message.
+
+    Returns:
+        str: The reply, or None if the message is not routine or
+            VERSE_RETRIEVAL is not "answer".
+    """
+    if VERSE_RETRIEVAL != "answer" or "?" in user_input or \
+            len(user_input.split()) > ROUTINE_MAX_WORDS:
+        return None
+    feeling = detect_feeling(user_input)
+    if feeling is None:
+        return None
+    tag, word = feeling
+    verses = get_index().for_tag(tag)
+    if not verses:
+        return None
+    verse = random.choice(verses)
+    opener = OPENERS.get(tag, DEFAULT_OPENER).format(feeling=word)
+    return (
+        f"{opener}\n\n**{verse.reference}**: {verse.text}\n\n"
+        "Would you like a song to go with it?"
+    )
+
+
+def ground_message(user_input):
+    """
+    Adds a few retrieved verses to a message before it goes to Gemini,
+        so the reply quotes real scripture instead of recalling it.
+    Verses come from the named feeling, else from a full-text search
+        that keeps only those scoring GROUNDING_MIN_SCORE or more.
+
+    Args:
+        user_input (str): The user's input message.
+
+    Returns:
+        str: The message with the verses appended, or unchanged when
+            nothing relevant is found or VERSE_RETRIEVAL is "off".
+    """
+    if VERSE_RETRIEVAL not in ("ground", "answer"):
+        return user_input
+    feeling = detect_feeling(user_input)
+    if feeling is not None:
+        verses = verses_for_emotion(feeling[0])
+    else:
+        verses = [
+            verse for verse, score in get_index().search(
+                user_input, GROUNDING_VERSES
+            )
+            if score >= GROUNDING_MIN_SCORE
+        ]
+    if not verses:
+        return user_input
+    quoted = "\n".join(
+        f"- {verse.reference}: {verse.text}" for verse in verses
+    )
+    return (
+        f"{user_input}\n\n"
+        "(Bible verses you may draw on, quoting only the ones that fit:\n"
+        f"{quoted})"
+    )
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+""" Optional write-behind queue that stores chat turns off the request. """
+from heartpsalm import app
+from heartpsalm.helper_functions import (
+        build_message_rows, store_message_rows, write_messages,
+        add_pending_rows, discard_pending_rows)
+from sqlalchemy.exc import DataError, IntegrityError
+import atexit
+import os
+import queue
+import threading
+import time
+
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() == "true"
+
+# Turns held in memory before requests wait for the flusher
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "1000"))
+# A batch is written once it has this many rows or is this old
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "100"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.05"))
+
+FLUSH_ATTEMPTS = 3
+
+
+class WriteBehindQueue:
+    """
+    A bounded queue of chat turns drained in batches by a background
+        flusher thread, each batch stored in one transaction.
+    """
+
+    def __init__(self, maxsize=WRITE_BEHIND_QUEUE_SIZE,
+                 batch_rows=WRITE_BEHIND_BATCH_ROWS,
+                 interval=WRITE_BEHIND_INTERVAL):
+        """Creates the queue; the flusher starts with the first turn."""
+        self.batch_rows = batch_rows
+        self.interval = interval
+        self._turns = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        # batches whose flush failed, each retried on its own before any
+        # newer turn
+        self._held = []
+
+    def _ensure_flusher(self):
+        """Starts the flusher in this process, e.g. after a worker fork."""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() \
+                    and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def put(self, rows):
+        """
+        Queues a turn's rows and shows them in the pending overlay.
+        Blocks while the queue is full, so a slow database slows requests
+            down instead of growing memory without bound.
+        """
+        self._ensure_flusher()
+        add_pending_rows(rows)
+        self._turns.put(rows)
+
+    def _run(self):
+        """
+        Collects batches by size or age and stores them. Held batches
+            are retried first and alone, so the queue still bounds memory
+            while the database is unavailable.
+        """
+        while not self._stopping.is_set():
+            if self._held:
+                self._flush(self._held.pop(0))
+                continue
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    turn = self._turns.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if turn is None:
+                    if batch:
+                        self._flush(batch)
+                    return
+                batch.extend(turn)
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, rows):
+        """
+        Stores a batch, retrying a few times. A batch that still fails
+            stays in the pending overlay and is held for a later cycle.
+        A batch the database rejects for its data is split to store
+            every other row, see `_isolate`.
+
+        Returns:
+            bool: True if every row was stored.
+        """
+        with app.app_context():
+            for attempt in range(1, FLUSH_ATTEMPTS + 1):
+                try:
+                    store_message_rows(rows)
+                except (IntegrityError, DataError) as e:
+                    return self._isolate(rows, e)
+                except Exception as e:
+                    app.logger.error(
+                        "writing %d queued chat messages failed "
+                        "(attempt %d): %s", len(rows), attempt, e
+                    )
+                    time.sleep(self.interval * attempt)
+                else:
+                    discard_pending_rows(rows)
+                    return True
+        self._held.append(rows)
+        return False
+
+    def _isolate(self, rows, error):
+        """
+        Stores the halves of a rejected batch separately until the
+            rejected rows are alone, then drops those, as retrying cannot
+            fix a constraint or data error.
+
+        Returns:
+            bool: True if every row was stored.
+        """
+        if len(rows) == 1:
+            row = rows[0]
+            app.logger.error(
+                "dropping a queued %s message of user %s in session %s at "
+                "%s the database rejects: %s", row["role"], row["user_id"],
+                row["session_id"], row["timestamp"], error
+            )
+            discard_pending_rows(rows)
+            return False
+        middle = len(rows) // 2
+        stored = self._flush(rows[:middle])
+        return self._flush(rows[middle:]) and stored
+
+    def drain(self):
+        """Stores the held batches and every queued turn on this thread."""
+        held, self._held = self._held, []
+        for rows in held:
+            self._flush(rows)
+        rows = []
+        while True:
+            try:
+                turn = self._turns.get_nowait()
+            except queue.Empty:
+                break
+            rows.extend(turn or ())
+        if rows:
+            self._flush(rows)
+
+    def shutdown(self, timeout=10):
+        """Stops the flusher and stores whatever is still queued."""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            try:
+                # wakes the flusher if it is waiting to fill a batch
+                self._turns.put_nowait(None)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+        self.drain()
+        if self._held:
+            app.logger.error(
+                "%d chat messages could not be stored before exiting",
+                sum(len(rows) for rows in self._held)
+            )
+
+
+write_queue = WriteBehindQueue()
+atexit.register(write_queue.shutdown)
+
+
+def store_turn(user_id, session_id, messages):
+    """
+    Stores a chat turn: queued for the background flusher in
+        write-behind mode, otherwise written before returning.
+
+    Args:
+        user_id (str): The owner of the session.
+        session_id (str): The session the messages belong to.
+        messages (list): (role, content, timestamp) tuples, oldest first.
+
+    Returns:
+        list: The turn's rows, including the `rendered_html` of each
+            message.
+    """
+    if not WRITE_BEHIND:
+        return write_messages(user_id, session_id, messages)
+    rows = build_message_rows(user_id, session_id, messages)
+    write_queue.put(rows)
+    return rows
@@ -0,0 +1,92 @@
+"""add chat_session summaries
+
+Revision ID: 1e0d06fe4cc5
+Revises: 4143879aa7a9
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e0d06fe4cc5'
+down_revision = '4143879aa7a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # run.py's db.create_all() may already have created the table
+    if not sa.inspect(bind).has_table('chat_session'):
+        op.create_table(
+            'chat_session',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('session_id', sa.String(length=255), nullable=False),
+            sa.Column('user_id', sa.String(length=36), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_message_at', sa.DateTime(), nullable=True),
+            sa.Column('message_count', sa.Integer(), nullable=False),
+            sa.Column('preview', sa.String(length=255), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'session_id')
+        )
+        op.create_index(
+            'idx_chatsession_user_last_message', 'chat_session',
+            ['user_id', 'last_message_at'], unique=False
+        )
+
+    chat_message = sa.table(
+        'chat_message',
+        sa.column('user_id'), sa.column('session_id'),
+        sa.column('content'), sa.column('timestamp'), sa.column('id')
+    )
+    chat_session = sa.table(
+        'chat_session',
+        sa.column('user_id'), sa.column('session_id'),
+        sa.column('created_at'), sa.column('last_message_at'),
+        sa.column('message_count'), sa.column('preview')
+    )
+
+    # backfill one summary per session that does not have one yet
+    summarized = {
+        tuple(row) for row in bind.execute(
+            sa.select(chat_session.c.user_id, chat_session.c.session_id)
+        )
+    }
+    sessions = bind.execute(
+        sa.select(
+            chat_message.c.user_id, chat_message.c.session_id,
+            sa.func.min(chat_message.c.timestamp),
+            sa.func.max(chat_message.c.timestamp),
+            sa.func.count()
+        ).group_by(chat_message.c.user_id, chat_message.c.session_id)
+    ).all()
+
+    for user_id, session_id, first_at, last_at, count in sessions:
+        if (user_id, session_id) in summarized:
+            continue
+        content = bind.execute(
+            sa.select(chat_message.c.content)
+            .where(chat_message.c.user_id == user_id)
+            .where(chat_message.c.session_id == session_id)
+            .order_by(chat_message.c.timestamp, chat_message.c.id)
+            .limit(1)
+        ).scalar()
+        bind.execute(chat_session.insert().values(
+            user_id=user_id,
+            session_id=session_id,
+            created_at=first_at,
+            last_message_at=last_at,
+            message_count=count,
+            preview=content[:30] + "..." if len(content) > 30 else content
+        ))
+
+
+def downgrade():
+    op.drop_index(
+        'idx_chatsession_user_last_message', table_name='chat_session'
+    )
+    op.drop_table('chat_session')
@@ -0,0 +1,64 @@
+"""initial schema
+
+Revision ID: 22af70f3cfa9
+Revises:
+Create Date: 2025-01-12 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '22af70f3cfa9'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases made before the migrations, or by run.py's db.create_all(),
+    # already have these tables
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('user'):
+        op.create_table(
+            'user',
+            sa.Column('id', sa.String(length=36), nullable=False),
+            sa.Column('username', sa.String(length=30), nullable=False),
+            sa.Column('email_address', sa.String(length=120),
+                      nullable=False),
+            sa.Column('password_hash', sa.String(length=60), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email_address')
+        )
+    if not inspector.has_table('chat_configuration'):
+        op.create_table(
+            'chat_configuration',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('role', sa.String(length=1250), nullable=True),
+            sa.Column('content', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('chat_message'):
+        op.create_table(
+            'chat_message',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.String(length=36), nullable=False),
+            sa.Column('role', sa.String(length=1250), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.Column('session_id', sa.String(length=255), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(
+            'idx_chatmessage_timestamp', 'chat_message', ['timestamp'],
+            unique=False
+        )
+
+
+def downgrade():
+    op.drop_index('idx_chatmessage_timestamp', table_name='chat_message')
+    op.drop_table('chat_message')
+    op.drop_table('chat_configuration')
+    op.drop_table('user')
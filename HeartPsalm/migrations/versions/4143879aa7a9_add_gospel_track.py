@@ -0,0 +1,45 @@
+"""add gospel_track catalog
+
+Revision ID: 4143879aa7a9
+Revises: 22af70f3cfa9
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4143879aa7a9'
+down_revision = '22af70f3cfa9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # run.py's db.create_all() may already have created the table
+    if sa.inspect(op.get_bind()).has_table('gospel_track'):
+        return
+
+    op.create_table(
+        'gospel_track',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('spotify_id', sa.String(length=64), nullable=False),
+        sa.Column('emotion', sa.String(length=32), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('artist', sa.String(length=255), nullable=False),
+        sa.Column('url', sa.String(length=255), nullable=False),
+        sa.Column('popularity', sa.Integer(), nullable=False),
+        sa.Column('harvested_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('spotify_id', 'emotion')
+    )
+    op.create_index(
+        'idx_gospeltrack_emotion', 'gospel_track', ['emotion'],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('idx_gospeltrack_emotion', table_name='gospel_track')
+    op.drop_table('gospel_track')
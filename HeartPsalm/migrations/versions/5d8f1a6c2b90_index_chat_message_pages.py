@@ -0,0 +1,34 @@
+"""index chat_message for keyset pages
+
+Revision ID: 5d8f1a6c2b90
+Revises: 7c3b9e2d5a41
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8f1a6c2b90'
+down_revision = '7c3b9e2d5a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    indexes = sa.inspect(op.get_bind()).get_indexes('chat_message')
+    if 'idx_chatmessage_session_timestamp' in {
+            index['name'] for index in indexes}:
+        return
+
+    op.create_index(
+        'idx_chatmessage_session_timestamp', 'chat_message',
+        ['user_id', 'session_id', 'timestamp', 'id'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'idx_chatmessage_session_timestamp', table_name='chat_message'
+    )
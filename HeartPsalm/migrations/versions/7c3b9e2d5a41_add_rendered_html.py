@@ -0,0 +1,69 @@
+"""add chat_message.rendered_html
+
+Revision ID: 7c3b9e2d5a41
+Revises: 1e0d06fe4cc5
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from heartpsalm.rendering import render_message
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3b9e2d5a41'
+down_revision = '1e0d06fe4cc5'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = sa.inspect(bind).get_columns('chat_message')
+    if 'rendered_html' not in {column['name'] for column in columns}:
+        with op.batch_alter_table('chat_message') as batch_op:
+            batch_op.add_column(
+                sa.Column('rendered_html', sa.Text(), nullable=True)
+            )
+
+    chat_message = sa.table(
+        'chat_message',
+        sa.column('id'), sa.column('role'),
+        sa.column('content'), sa.column('rendered_html')
+    )
+
+    # render the existing messages in batches, walking the primary key
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                chat_message.c.id, chat_message.c.role,
+                chat_message.c.content
+            )
+            .where(chat_message.c.id > last_id)
+            .where(chat_message.c.rendered_html.is_(None))
+            .order_by(chat_message.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            chat_message.update()
+            .where(chat_message.c.id == sa.bindparam('message_id'))
+            .values(rendered_html=sa.bindparam('html')),
+            [
+                {
+                    'message_id': message_id,
+                    'html': render_message(content, role)
+                }
+                for message_id, role, content in rows
+            ]
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message') as batch_op:
+        batch_op.drop_column('rendered_html')
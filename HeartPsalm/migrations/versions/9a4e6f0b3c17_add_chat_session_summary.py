@@ -0,0 +1,41 @@
+"""add rolling summaries to chat_session
+
+Revision ID: 9a4e6f0b3c17
+Revises: 5d8f1a6c2b90
+Create Date: 2026-10-18 13:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e6f0b3c17'
+down_revision = '5d8f1a6c2b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {
+        column['name']
+        for column in sa.inspect(op.get_bind()).get_columns('chat_session')
+    }
+    with op.batch_alter_table('chat_session') as batch_op:
+        if 'summary' not in columns:
+            batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        if 'summary_through_at' not in columns:
+            batch_op.add_column(
+                sa.Column('summary_through_at', sa.DateTime(), nullable=True)
+            )
+        if 'summary_through_id' not in columns:
+            batch_op.add_column(
+                sa.Column('summary_through_id', sa.Integer(), nullable=True)
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('chat_session') as batch_op:
+        batch_op.drop_column('summary_through_id')
+        batch_op.drop_column('summary_through_at')
+        batch_op.drop_column('summary')
@@ -0,0 +1,54 @@
+"""unique index on user.username
+
+Revision ID: c4e8a2f6d1b5
+Revises: 9a4e6f0b3c17
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f6d1b5'
+down_revision = '9a4e6f0b3c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    indexes = sa.inspect(bind).get_indexes('user')
+    if 'idx_user_username' in {index['name'] for index in indexes}:
+        return
+
+    # check before creating the index, so the error names every clash
+    duplicates = bind.execute(sa.text(
+        'SELECT username, id FROM "user" WHERE username IN ('
+        'SELECT username FROM "user" GROUP BY username HAVING COUNT(*) > 1'
+        ') ORDER BY username, id'
+    )).all()
+    if duplicates:
+        clashes = {}
+        for username, user_id in duplicates:
+            clashes.setdefault(username, []).append(user_id)
+        raise RuntimeError(
+            "Usernames must be unique before upgrading, but these are "
+            "shared by several users: "
+            + "; ".join(
+                f"{username!r} (ids {', '.join(ids)})"
+                for username, ids in clashes.items()
+            )
+            + ". Rename all but one user of each, e.g. "
+            "UPDATE \"user\" SET username = '<new name>' WHERE id = '<id>'"
+            ", then run `flask --app heartpsalm db upgrade` again. The "
+            "earlier revisions are already applied."
+        )
+
+    op.create_index(
+        'idx_user_username', 'user', ['username'], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('idx_user_username', table_name='user')
@@ -0,0 +1,27 @@
+""" HeartPsalm with a slow Gemini stub, served by test_async_workers. """
+import os
+import time
+from heartpsalm import app, db, core_functions
+from heartpsalm.models import User, ChatConfiguration
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.5"))
+
+
+def slow_generative_ai_response(user_message, chat_history, kind="reply",
+                                instructions=None):
+    """Stands in for Gemini, taking STUB_LATENCY seconds to answer"""
+    time.sleep(STUB_LATENCY)
+    return "Peace be with you."
+
+
+core_functions.generative_ai_response = slow_generative_ai_response
+app.config['WTF_CSRF_ENABLED'] = False
+
+with app.app_context():
+    db.create_all()
+    db.session.add(ChatConfiguration(role='user', content='Test user'))
+    db.session.add(ChatConfiguration(role='assistant', content='Test bot'))
+    test_user = User(username='testuser', email_address='test@test.com')
+    test_user.password = 'password123'
+    db.session.add(test_user)
+    db.session.commit()
@@ -0,0 +1,95 @@
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_LATENCY = 0.5
+CONCURRENT_REQUESTS = 20
+
+
+@unittest.skipUnless(
+        importlib.util.find_spec('gevent'), 'gevent is not installed'
+    )
+class TestAsyncWorkers(unittest.TestCase):
+    def setUp(self):
+        """Start one gevent gunicorn worker serving a slow Gemini stub"""
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.db_dir = tempfile.TemporaryDirectory()
+
+        env = dict(
+                os.environ,
+                GUNICORN_WORKER_CLASS='gevent',
+                STUB_LATENCY=str(STUB_LATENCY),
+                SQLALCHEMY_DATABASE_URI=(
+                    f'sqlite:///{self.db_dir.name}/test.db'
+                )
+            )
+        self.server = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'gunicorn',
+                    '-w', '1', '-b', f'127.0.0.1:{port}',
+                    'tests.slow_stub_app:app'
+                ],
+                cwd=PROJECT_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f'{self.base_url}/home', timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.tearDown()
+        self.fail('gunicorn did not start')
+
+    def tearDown(self):
+        """Stop the server and remove its database"""
+        self.server.terminate()
+        self.server.wait(timeout=10)
+        self.db_dir.cleanup()
+
+    def test_concurrent_slow_requests_overlap(self):
+        """Test that N slow chat turns take about one stub latency"""
+        client = requests.Session()
+        client.post(f'{self.base_url}/login', data={
+            'username': 'testuser',
+            'password': 'password123'
+            })
+
+        def send_message(_):
+            return requests.post(
+                    f'{self.base_url}/chat',
+                    data={'user_feeling': 'Hello, how are you?'},
+                    cookies=client.cookies, timeout=30
+                )
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(CONCURRENT_REQUESTS) as pool:
+            responses = list(
+                    pool.map(send_message, range(CONCURRENT_REQUESTS))
+                )
+        elapsed = time.perf_counter() - started
+
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                    response.json()['assistant_response'],
+                    'Peace be with you.'
+                )
+        self.assertLess(elapsed, STUB_LATENCY * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import event
+from heartpsalm import app, db, cache
+from heartpsalm.models import User, ChatMessage, ChatSession
+from heartpsalm.helper_functions import (
+        get_chat_files_for_user, get_chat_previews, write_messages,
+        preview_cache_key)
+
+
+class TestChatSessions(unittest.TestCase):
+    def setUp(self):
+        """Set up a test database with one user"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(username='testuser', email_address='test@test.com')
+        self.user.password_hash = 'not-a-real-hash'
+        db.session.add(self.user)
+        db.session.commit()
+        cache.clear()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_message(self, session_id, content, minutes):
+        """Helper method to store a message at a fixed offset in time"""
+        message = ChatMessage(
+                user_id=self.user.id, role='user', content=content,
+                session_id=session_id,
+                timestamp=datetime(2025, 1, 1) + timedelta(minutes=minutes)
+            )
+        db.session.add(message)
+        db.session.commit()
+        return message
+
+    def test_summary_follows_inserts(self):
+        """Test that inserting messages maintains the session summary"""
+        self.add_message('s1', 'A first message that is rather long', 0)
+        self.add_message('s1', 'A reply', 5)
+
+        summary = ChatSession.query.filter_by(session_id='s1').one()
+        self.assertEqual(summary.message_count, 2)
+        self.assertEqual(summary.created_at, datetime(2025, 1, 1))
+        self.assertEqual(
+                summary.last_message_at, datetime(2025, 1, 1, 0, 5)
+            )
+        self.assertEqual(summary.preview, 'A first message that is rather...')
+
+    def test_concurrent_first_messages_share_a_summary(self):
+        """Test that a summary created by another writer is added to"""
+        raced = []
+
+        def create_summary_first(conn, cursor, statement, *args):
+            # another worker stores the session's first message between
+            # this writer finding no summary and creating it
+            if statement.startswith('INSERT INTO chat_session') \
+                    and not raced:
+                raced.append(statement)
+                cursor.execute(
+                        'INSERT INTO chat_session (user_id, session_id, '
+                        'created_at, last_message_at, message_count, '
+                        "preview) VALUES (?, 's1', ?, ?, 1, 'Other')",
+                        (self.user.id, '2025-01-01 00:00:00.000000',
+                         '2025-01-01 00:00:00.000000')
+                    )
+
+        event.listen(db.engine, 'before_cursor_execute', create_summary_first)
+        try:
+            write_messages(self.user.id, 's1', [
+                    ('user', 'Hello', datetime(2025, 1, 1, 0, 1)),
+                    ('assistant', 'Hi', datetime(2025, 1, 1, 0, 2)),
+                ])
+        finally:
+            event.remove(
+                    db.engine, 'before_cursor_execute', create_summary_first
+                )
+
+        self.assertTrue(raced)
+        summary = ChatSession.query.filter_by(session_id='s1').one()
+        self.assertEqual(summary.message_count, 3)
+        self.assertEqual(summary.preview, 'Other')
+        self.assertEqual(
+                summary.last_message_at, datetime(2025, 1, 1, 0, 2)
+            )
+
+    def test_summary_follows_deletes(self):
+        """Test that deleting the last message drops the summary"""
+        message = self.add_message('s1', 'Hello', 0)
+
+        db.session.delete(message)
+        db.session.commit()
+
+        self.assertIsNone(ChatSession.query.filter_by(session_id='s1').first())
+
+    def test_sidebar_orders_by_latest_message(self):
+        """Test that sessions are listed most recently active first"""
+        self.add_message('old', 'Hello', 0)
+        self.add_message('new', 'Hello', 10)
+        self.add_message('old', 'Back again', 20)
+
+        self.assertEqual(get_chat_files_for_user(self.user.id), ['old', 'new'])
+
+    def test_previews_fetched_in_one_query(self):
+        """Test that a whole sidebar of previews costs one query"""
+        self.add_message('s1', 'First chat', 0)
+        self.add_message('s2', 'Second chat', 5)
+
+        with patch.object(db.session, 'query',
+                          wraps=db.session.query) as query:
+            previews = get_chat_previews(self.user.id, ['s1', 's2', 'gone'])
+            cached = get_chat_previews(self.user.id, ['s1', 's2', 'gone'])
+
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(previews, cached)
+        self.assertEqual(previews, {
+                's1': 'First chat',
+                's2': 'Second chat',
+                'gone': 'No messages available',
+            })
+
+    def test_turn_written_in_one_transaction(self):
+        """Test that a turn is stored with one commit and bulk insert"""
+        self.add_message('s1', 'Earlier message', 0)
+        get_chat_previews(self.user.id, ['s1'])
+        self.assertIsNotNone(cache.get(preview_cache_key(self.user.id, 's1')))
+
+        with patch.object(db.session, 'commit',
+                          wraps=db.session.commit) as commit:
+            rows = write_messages(self.user.id, 's1', [
+                    ('user', 'How are you?', datetime(2025, 1, 1, 1)),
+                    ('assistant', '**Well**', datetime(2025, 1, 1, 1, 1)),
+                ])
+
+        self.assertEqual(commit.call_count, 1)
+        self.assertEqual(
+                rows[1]['rendered_html'], '<p><strong>Well</strong></p>'
+            )
+        summary = ChatSession.query.filter_by(session_id='s1').one()
+        self.assertEqual(summary.message_count, 3)
+        self.assertEqual(
+                summary.last_message_at, datetime(2025, 1, 1, 1, 1)
+            )
+        # the cached preview is dropped once the turn commits
+        self.assertIsNone(cache.get(preview_cache_key(self.user.id, 's1')))
+
+
+if __name__ == '__main__':
+    unittest.main()
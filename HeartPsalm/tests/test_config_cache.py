@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, db, cache
+from heartpsalm.models import ChatConfiguration
+from heartpsalm import config_cache
+from heartpsalm.config_cache import (
+        get_chat_instructions, CONFIG_VERSION_KEY)
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        """Set up a test database with both instructions"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        cache.clear()
+        db.session.add(ChatConfiguration(role='user', content='Be kind'))
+        db.session.add(ChatConfiguration(role='assistant', content='Hello'))
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_instructions_served_from_memory(self):
+        """Test that repeated lookups do not query the database"""
+        instructions = get_chat_instructions()
+        self.assertEqual(instructions.user.content, 'Be kind')
+        self.assertEqual(
+                instructions.history_prefix,
+                (
+                    {'role': 'user', 'parts': ['Be kind']},
+                    {'role': 'assistant', 'parts': ['Hello']},
+                )
+            )
+
+        with patch.object(config_cache, '_load') as mock_load:
+            self.assertIs(get_chat_instructions(), instructions)
+        mock_load.assert_not_called()
+
+    def test_edit_bumps_shared_version(self):
+        """Test that committing an edit reloads the instructions"""
+        get_chat_instructions()
+        version = cache.get(CONFIG_VERSION_KEY)
+
+        config = ChatConfiguration.query.filter_by(role='user').one()
+        config.content = 'Be very kind'
+        db.session.commit()
+
+        self.assertNotEqual(cache.get(CONFIG_VERSION_KEY), version)
+        self.assertEqual(get_chat_instructions().user.content, 'Be very kind')
+
+    @patch.object(config_cache, 'CONFIG_CHECK_SECONDS', 0)
+    def test_other_worker_edit_is_picked_up(self):
+        """Test that a version bumped elsewhere triggers a reload"""
+        get_chat_instructions()
+        # an edit committed by another worker process
+        db.session.execute(
+                db.update(ChatConfiguration)
+                .where(ChatConfiguration.role == 'assistant')
+                .values(content='Welcome')
+            )
+        db.session.commit()
+        self.assertEqual(get_chat_instructions().assistant.content, 'Hello')
+
+        cache.set(CONFIG_VERSION_KEY, 'elsewhere', timeout=0)
+        self.assertEqual(get_chat_instructions().assistant.content, 'Welcome')
+
+
+if __name__ == '__main__':
+    unittest.main()
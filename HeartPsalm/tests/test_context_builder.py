@@ -0,0 +1,168 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from heartpsalm import app, db, cache
+from heartpsalm.models import User, ChatMessage, ChatSession
+from heartpsalm.helper_functions import (
+        build_message_rows, add_pending_rows, discard_pending_rows)
+from heartpsalm.context_builder import (
+        build_context, update_session_summary, estimate_tokens,
+        context_report, SUMMARY_PREFIX)
+
+
+class TestContextBuilder(unittest.TestCase):
+    def setUp(self):
+        """Set up a test database with a ten message session"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        cache.clear()
+
+        self.user = User(username='testuser', email_address='test@test.com')
+        self.user.password_hash = 'not-a-real-hash'
+        db.session.add(self.user)
+        db.session.commit()
+
+        for number in range(10):
+            db.session.add(ChatMessage(
+                    user_id=self.user.id,
+                    role='user' if number % 2 == 0 else 'assistant',
+                    content=f'Message {number} ' + 'x' * 32,
+                    session_id='s1',
+                    timestamp=datetime(2025, 1, 1)
+                    + timedelta(minutes=number)
+                ))
+        db.session.commit()
+        self.message_tokens = estimate_tokens('Message 0 ' + 'x' * 32)
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def contents(self, history):
+        """Helper method listing the text of each history entry"""
+        return [entry['parts'][0] for entry in history]
+
+    @patch('heartpsalm.context_builder.schedule_summary_update')
+    def test_whole_session_within_budget(self, mock_schedule):
+        """Test that a session that fits is sent verbatim"""
+        history = build_context((), self.user.id, 's1', budget=1000)
+
+        self.assertEqual(len(history), 10)
+        self.assertTrue(self.contents(history)[0].startswith('Message 0 '))
+        mock_schedule.assert_not_called()
+
+    @patch('heartpsalm.context_builder.schedule_summary_update')
+    def test_budget_keeps_latest_messages(self, mock_schedule):
+        """Test that only the latest messages fit and the rest is queued"""
+        history = build_context(
+                (), self.user.id, 's1',
+                budget=self.message_tokens * 3
+            )
+
+        self.assertEqual(
+                [text.split()[1] for text in self.contents(history)],
+                ['7', '8', '9']
+            )
+        keep_from = mock_schedule.call_args[0][2]
+        self.assertEqual(keep_from[0], datetime(2025, 1, 1, 0, 7))
+
+    @patch('heartpsalm.context_builder.generative_ai_response',
+           return_value='The user said hello.')
+    def test_summary_replaces_older_messages(self, mock_ai_response):
+        """Test that folded messages are sent as the summary only"""
+        keep_from = ChatMessage.query.filter_by(
+                content='Message 7 ' + 'x' * 32
+            ).one()
+        update_session_summary(
+                self.user.id, 's1', (keep_from.timestamp, keep_from.id)
+            )
+
+        self.assertEqual(mock_ai_response.call_count, 1)
+        self.assertIn('Message 6', mock_ai_response.call_args[0][0])
+        self.assertNotIn('Message 7', mock_ai_response.call_args[0][0])
+        chat_session = ChatSession.query.filter_by(session_id='s1').one()
+        self.assertEqual(chat_session.summary, 'The user said hello.')
+
+        with patch('heartpsalm.context_builder.schedule_summary_update') \
+                as mock_schedule:
+            history = build_context((), self.user.id, 's1', budget=1000)
+        self.assertEqual(
+                self.contents(history)[0],
+                SUMMARY_PREFIX + 'The user said hello.'
+            )
+        self.assertEqual(len(history), 4)
+        mock_schedule.assert_not_called()
+
+    @patch('heartpsalm.context_builder.schedule_summary_update')
+    def test_pending_rows_in_window(self, mock_schedule):
+        """Test that rows still queued for the database fit the window"""
+        through = ChatMessage.query.filter_by(
+                content='Message 6 ' + 'x' * 32
+            ).one()
+        chat_session = ChatSession.query.filter_by(session_id='s1').one()
+        chat_session.summary = 'Earlier.'
+        chat_session.summary_through_at = through.timestamp
+        chat_session.summary_through_id = through.id
+        db.session.commit()
+        pending = build_message_rows(self.user.id, 's1', [
+                ('user', 'Queued ' + 'y' * 35, through.timestamp),
+                ('assistant', 'Queued ' + 'z' * 35,
+                 datetime(2025, 1, 1, 1)),
+            ])
+        add_pending_rows(pending)
+        self.addCleanup(discard_pending_rows, pending)
+        summary_tokens = estimate_tokens(SUMMARY_PREFIX + 'Earlier.')
+
+        history = build_context(
+                (), self.user.id, 's1',
+                budget=summary_tokens + 2 * self.message_tokens
+            )
+        self.assertEqual(
+                self.contents(history)[1:],
+                [row['content'] for row in pending]
+            )
+        mock_schedule.assert_called_once_with(self.user.id, 's1', None)
+
+    def test_report_counts_selected_messages(self):
+        """Test that the report counts whole messages that fit the budget"""
+        fixed = estimate_tokens('Be kind')
+        report = context_report(['Be kind'], budget=1000)
+        self.assertEqual(report['turns'], 5)
+        self.assertEqual(report['budgeted'], report['full'])
+        self.assertEqual(report['full'][1], fixed + 8 * self.message_tokens)
+
+        budget = fixed + 2 * self.message_tokens + self.message_tokens // 2
+        report = context_report(['Be kind'], budget=budget)
+        self.assertEqual(
+                report['budgeted'][1], fixed + 2 * self.message_tokens
+            )
+
+    @patch('heartpsalm.context_builder.generative_ai_response',
+           return_value='The user said hello.')
+    def test_report_counts_summary(self, mock_ai_response):
+        """Test that turns after the summarized messages count the summary"""
+        keep_from = ChatMessage.query.filter_by(
+                content='Message 7 ' + 'x' * 32
+            ).one()
+        update_session_summary(
+                self.user.id, 's1', (keep_from.timestamp, keep_from.id)
+            )
+
+        fixed = estimate_tokens('Be kind')
+        summary = estimate_tokens(SUMMARY_PREFIX + 'The user said hello.')
+        report = context_report(['Be kind'], budget=1000)
+        self.assertEqual(report['turns'], 5)
+        # turns up to Message 6 saw the messages before them verbatim;
+        # the turn of Message 8 sees the summary and Message 7
+        self.assertEqual(
+                report['budgeted'][0],
+                (4 * fixed + 12 * self.message_tokens
+                 + fixed + summary + self.message_tokens) / 5
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
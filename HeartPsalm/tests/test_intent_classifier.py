@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+from heartpsalm import intent_classifier
+from heartpsalm.core_functions import analyze_intent_with_gemini
+
+
+class TestIntentClassifier(unittest.TestCase):
+    def test_clear_cut_messages_are_decided_locally(self):
+        """Test that rules decide obvious requests and non-requests"""
+        self.assertTrue(intent_classifier.classify_intent("Play me a song"))
+        self.assertTrue(
+                intent_classifier.classify_intent("any worship music?")
+            )
+        self.assertFalse(
+                intent_classifier.classify_intent("I feel anxious today")
+            )
+        self.assertFalse(
+                intent_classifier.classify_intent("Who sang Amazing Grace?")
+            )
+
+    def test_eval_set_report(self):
+        """Test accuracy and escalation rate on the labelled eval set"""
+        examples = intent_classifier.load_examples(
+                intent_classifier.EVAL_PATH
+            )
+        report = intent_classifier.evaluate(examples)
+        self.assertGreaterEqual(report["local_accuracy"], 0.95)
+        self.assertLessEqual(report["escalation_rate"], 0.2)
+
+    @patch('heartpsalm.core_functions.plan_turn')
+    def test_only_ambiguous_inputs_reach_gemini(self, mock_plan_turn):
+        """Test that Gemini is only asked when the local tier abstains"""
+        mock_plan_turn.return_value = {
+                "song_request": True, "emotion": "praise", "reply": ""
+            }
+
+        self.assertFalse(analyze_intent_with_gemini("Hello there"))
+        mock_plan_turn.assert_not_called()
+
+        with patch.object(
+                intent_classifier, 'predict_proba', return_value=0.5
+        ):
+            self.assertTrue(
+                    analyze_intent_with_gemini("that song was something")
+                )
+        mock_plan_turn.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
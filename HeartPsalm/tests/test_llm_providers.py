@@ -0,0 +1,97 @@
+import json
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, cache, db, llm_providers
+from heartpsalm.core_functions import (
+        generative_ai_response, generative_ai_response_stream, plan_turn)
+from heartpsalm.llm_providers import LocalProvider, parse_routes
+from heartpsalm.model_registry import JSON_RESPONSE
+from heartpsalm.models import ChatConfiguration
+
+
+class TestLLMProviders(unittest.TestCase):
+    def setUp(self):
+        """Set up the chat instructions and an empty cache"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(ChatConfiguration(role='user', content='Be kind'))
+        db.session.add(ChatConfiguration(role='assistant', content='Hello'))
+        db.session.commit()
+        cache.clear()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_parse_routes(self):
+        """Test that routes are parsed and unknown kinds ignored"""
+        self.assertEqual(
+                parse_routes(
+                    "intent=gemini:gemini-1.5-flash-8b, summary=local,"
+                    "greeting=local"
+                ),
+                {
+                    "intent": ("gemini", "gemini-1.5-flash-8b"),
+                    "summary": ("local", None),
+                }
+            )
+
+    def test_local_provider_is_deterministic(self):
+        """Test that the local provider repeats itself, streamed or not"""
+        provider = LocalProvider()
+        reply = provider.generate("I feel so anxious today", [])
+
+        self.assertEqual(reply, provider.generate("I feel so anxious today",
+                                                  []))
+        self.assertEqual(
+                "".join(provider.stream("I feel so anxious today", [])),
+                reply
+            )
+
+    @patch('heartpsalm.model_registry.get_model')
+    def test_calls_routed_by_kind(self, mock_get_model):
+        """Test that intent checks go to their own model, replies do not"""
+        chat = mock_get_model.return_value.start_chat.return_value
+        chat.send_message.return_value.text = json.dumps(
+                {"song_request": True, "emotion": "joyful"}
+            )
+        routes = {"intent": ("gemini", "gemini-small")}
+        with patch.object(llm_providers, 'routes', routes):
+            plan = plan_turn("that song was something", [], with_reply=False)
+            generative_ai_response("Hello", [])
+
+        self.assertTrue(plan["song_request"])
+        self.assertEqual(mock_get_model.call_args_list[0].args,
+                         (JSON_RESPONSE,))
+        self.assertEqual(
+                mock_get_model.call_args_list[0].kwargs["model_name"],
+                "gemini-small"
+            )
+        self.assertIsNone(
+                mock_get_model.call_args_list[1].kwargs["model_name"]
+            )
+
+    @patch('heartpsalm.model_registry.get_model')
+    def test_local_provider_needs_no_gemini(self, mock_get_model):
+        """Test that the local provider plans and streams on its own"""
+        with patch.object(llm_providers, 'LLM_PROVIDER', 'local'):
+            plan = plan_turn("Please play me a worship song", [])
+            chunks = list(generative_ai_response_stream("I feel alone", []))
+
+        self.assertTrue(plan["song_request"])
+        self.assertTrue(plan["reply"])
+        self.assertGreater(len(chunks), 1)
+        mock_get_model.assert_not_called()
+
+    def test_unknown_provider(self):
+        """Test that an unknown provider is reported as an error reply"""
+        with patch.object(llm_providers, 'LLM_PROVIDER', 'nope'):
+            reply = generative_ai_response("Hello", [])
+        self.assertTrue(reply.startswith("Error generating response"))
+
+
+if __name__ == '__main__':
+    unittest.main()
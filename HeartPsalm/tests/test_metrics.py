@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, db, metrics
+from heartpsalm.models import User, ChatConfiguration
+
+
+def series_value(text, line_start):
+    """Returns the value of the exposition line starting with a series"""
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """Set up a logged-in client and empty metrics"""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(ChatConfiguration(role='user', content='Be kind'))
+        db.session.add(ChatConfiguration(role='assistant', content='Hello'))
+        user = User(username='testuser', email_address='test@test.com')
+        user.password = 'password123'
+        db.session.add(user)
+        db.session.commit()
+        metrics._histograms.clear()
+        metrics._counters.clear()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        """Helper method to log in the test user"""
+        return self.client.post('/login', data={
+            'username': 'testuser',
+            'password': 'password123'
+            })
+
+    def test_histogram_exposition(self):
+        """Test that buckets are cumulative and end with +Inf"""
+        metrics.observe(metrics.SPAN_SECONDS, 0.003, span='db')
+        metrics.observe(metrics.SPAN_SECONDS, 0.2, span='db')
+        text = metrics.render_metrics()
+
+        self.assertIn('# TYPE heartpsalm_span_seconds histogram', text)
+        self.assertEqual(series_value(
+                text, 'heartpsalm_span_seconds_bucket{span="db",le="0.005"}'
+            ), 1)
+        self.assertEqual(series_value(
+                text, 'heartpsalm_span_seconds_bucket{span="db",le="+Inf"}'
+            ), 2)
+        self.assertAlmostEqual(series_value(
+                text, 'heartpsalm_span_seconds_sum{span="db"}'
+            ), 0.203)
+
+    def test_chat_request_spans(self):
+        """Test that a chat page records request, db and render spans"""
+        self.login()
+        self.client.get('/chat')
+        response = self.client.get('/metrics')
+        text = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(series_value(
+                text, 'heartpsalm_request_seconds_count{endpoint="chat_page"'
+            ), 1)
+        self.assertGreater(series_value(
+                text, 'heartpsalm_span_seconds_count{span="db"}'
+            ), 0)
+        self.assertIsNotNone(series_value(
+                text, 'heartpsalm_span_seconds_count{span="render_template"}'
+            ))
+
+    @patch('heartpsalm.core_functions.classify_intent', return_value=False)
+    @patch('heartpsalm.model_registry.get_model')
+    def test_gemini_span_and_server_timing(self, mock_get_model,
+                                           mock_classify_intent):
+        """Test that Gemini calls are timed and shown in Server-Timing"""
+        chat = mock_get_model.return_value.start_chat.return_value
+        chat.send_message.return_value.text = 'Peace.'
+        self.login()
+        with patch.object(metrics, 'SERVER_TIMING', True):
+            response = self.client.post(
+                    '/chat', data={'user_feeling': 'Hello there'}
+                )
+
+        timing = response.headers['Server-Timing']
+        self.assertIn('generative_ai_response;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        self.assertEqual(series_value(
+                metrics.render_metrics(),
+                'heartpsalm_span_seconds_count{span="generative_ai_response"}'
+            ), 1)
+
+    def test_workers_are_added_up(self):
+        """Test that other workers' snapshots in METRICS_DIR are summed"""
+        metrics.increment(
+                metrics.CACHE_REQUESTS, 2, cache='chat_preview', result='hit'
+            )
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+                json.dump(metrics.snapshot(), f)
+            with patch.object(metrics, 'METRICS_DIR', directory):
+                text = metrics.render_metrics()
+
+        self.assertEqual(series_value(
+                text,
+                'heartpsalm_cache_requests_total'
+                '{cache="chat_preview",result="hit"}'
+            ), 4)
+
+    def test_exited_workers_compacted(self):
+        """Test that exited workers' files are folded into one file"""
+        metrics.increment(
+                metrics.CACHE_REQUESTS, 2, cache='chat_preview', result='hit'
+            )
+        series = 'heartpsalm_cache_requests_total' \
+            '{cache="chat_preview",result="hit"}'
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('metrics-1.json', 'metrics-2-exited-5.json',
+                         'metrics-3-exited-6.json'):
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump(metrics.snapshot(), f)
+            with patch.object(metrics, 'METRICS_DIR', directory):
+                self.assertEqual(
+                        series_value(metrics.render_metrics(), series), 8
+                    )
+                self.assertEqual(
+                        sorted(os.listdir(directory)),
+                        ['metrics-1.json', 'metrics-exited.json',
+                         'metrics.lock']
+                    )
+                with open(os.path.join(
+                        directory, 'metrics-4-exited-7.json'), 'w') as f:
+                    json.dump(metrics.snapshot(), f)
+                self.assertEqual(
+                        series_value(metrics.render_metrics(), series), 10
+                    )
+                self.assertEqual(len(os.listdir(directory)), 3)
+
+    def test_metrics_token(self):
+        """Test that a configured token is required"""
+        with patch.object(metrics, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get(
+                    '/metrics', headers={'Authorization': 'Bearer secret'}
+                )
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The schema `db.create_all()` made before the migrations existed
+BASELINE_SCHEMA = '''
+CREATE TABLE user (
+    id VARCHAR(36) NOT NULL,
+    username VARCHAR(30) NOT NULL,
+    email_address VARCHAR(120) NOT NULL,
+    password_hash VARCHAR(60) NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE (email_address)
+);
+CREATE TABLE chat_configuration (
+    id INTEGER NOT NULL,
+    role VARCHAR(1250),
+    content TEXT,
+    PRIMARY KEY (id)
+);
+CREATE TABLE chat_message (
+    id INTEGER NOT NULL,
+    user_id VARCHAR(36) NOT NULL,
+    role VARCHAR(1250) NOT NULL,
+    content TEXT NOT NULL,
+    timestamp DATETIME,
+    session_id VARCHAR(255) NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE INDEX idx_chatmessage_timestamp ON chat_message (timestamp);
+'''
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        """Set up an empty database file"""
+        self.db_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.db_dir.name, 'test.db')
+        self.env = dict(
+                os.environ,
+                SQLALCHEMY_DATABASE_URI=f'sqlite:///{self.db_path}'
+            )
+
+    def tearDown(self):
+        """Remove the database"""
+        self.db_dir.cleanup()
+
+    def run_app(self, *args):
+        """Helper method running a Python command against the database"""
+        return subprocess.run(
+                [sys.executable, *args], cwd=PROJECT_DIR, env=self.env,
+                capture_output=True, text=True, timeout=120
+            )
+
+    def upgrade(self):
+        """Helper method applying the migrations as the README says"""
+        return self.run_app(
+                '-m', 'flask', '--app', 'heartpsalm', 'db', 'upgrade'
+            )
+
+    def query(self, sql):
+        """Helper method reading rows from the database"""
+        with sqlite3.connect(self.db_path) as connection:
+            return connection.execute(sql).fetchall()
+
+    def create_baseline(self, usernames=('alice',)):
+        """Helper method making a baseline database with one session"""
+        with sqlite3.connect(self.db_path) as connection:
+            connection.executescript(BASELINE_SCHEMA)
+            for number, username in enumerate(usernames):
+                connection.execute(
+                    'INSERT INTO user VALUES (?, ?, ?, ?)',
+                    (f'u{number}', username, f'{number}@test.com', 'hash')
+                )
+            connection.executemany(
+                'INSERT INTO chat_message '
+                '(user_id, role, content, timestamp, session_id) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    ('u0', 'user', 'I feel **tired**',
+                     '2025-01-01 10:00:00.000000', 's1'),
+                    ('u0', 'assistant', 'Rest in Him',
+                     '2025-01-01 10:01:00.000000', 's1'),
+                ]
+            )
+
+    def test_upgrade_baseline_database(self):
+        """Test that a database from before the migrations upgrades"""
+        self.create_baseline()
+        result = self.upgrade()
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        self.assertEqual(
+                self.query('SELECT version_num FROM alembic_version'),
+                [('c4e8a2f6d1b5',)]
+            )
+        self.assertEqual(
+                self.query(
+                    'SELECT user_id, session_id, message_count, preview '
+                    'FROM chat_session'
+                ),
+                [('u0', 's1', 2, 'I feel **tired**')]
+            )
+
+    def test_upgrade_renders_stored_messages(self):
+        """Test that upgraded messages have HTML the app can page through"""
+        self.create_baseline()
+        result = self.upgrade()
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        self.assertEqual(
+                self.query(
+                    'SELECT rendered_html FROM chat_message ORDER BY id'
+                ),
+                [('<p>I feel <strong>tired</strong></p>',),
+                 ('<p>Rest in Him</p>',)]
+            )
+        result = self.run_app('-c', (
+                'from heartpsalm import app\n'
+                'from heartpsalm.helper_functions import (\n'
+                '    get_message_page, get_chat_files_for_user)\n'
+                'with app.app_context():\n'
+                '    messages, _ = get_message_page("u0", "s1")\n'
+                '    print(len(messages), len(get_chat_files_for_user("u0")))'
+            ))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split()[-2:], ['2', '1'])
+
+    def test_duplicate_usernames_stop_before_the_index(self):
+        """Test that shared usernames are reported and the upgrade resumes"""
+        self.create_baseline(('alice', 'alice', 'bob'))
+        result = self.upgrade()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("'alice' (ids u0, u1)", result.stderr)
+        self.assertIn('Rename all but one user', result.stderr)
+        self.assertEqual(
+                self.query('SELECT version_num FROM alembic_version'),
+                [('9a4e6f0b3c17',)]
+            )
+
+        with sqlite3.connect(self.db_path) as connection:
+            connection.execute(
+                "UPDATE user SET username = 'alice2' WHERE id = 'u1'"
+            )
+        result = self.upgrade()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(
+                self.query(
+                    "SELECT name FROM sqlite_master "
+                    "WHERE name = 'idx_user_username'"
+                ),
+                [('idx_user_username',)]
+            )
+
+    def test_upgrade_after_create_all(self):
+        """Test that a database made by run.py upgrades in place"""
+        result = self.run_app('-c', 'import run')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        result = self.upgrade()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(
+                self.query('SELECT version_num FROM alembic_version'),
+                [('c4e8a2f6d1b5',)]
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
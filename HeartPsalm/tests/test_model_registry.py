@@ -0,0 +1,30 @@
+import unittest
+from unittest.mock import patch
+from heartpsalm import model_registry
+from heartpsalm.model_registry import get_model, warm_models, JSON_RESPONSE
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_models_created_once_per_config(self):
+        """Test that each model and config pair is built only once"""
+        self.assertIs(get_model(), get_model())
+        self.assertIs(
+                get_model({"response_mime_type": "application/json"}),
+                get_model(JSON_RESPONSE)
+            )
+        self.assertIsNot(get_model(), get_model(JSON_RESPONSE))
+
+    @patch.object(model_registry, '_models', {})
+    @patch('heartpsalm.model_registry.genai.GenerativeModel')
+    def test_warm_tolerates_gemini_errors(self, mock_model):
+        """Test that warming creates the models even when Gemini fails"""
+        mock_model.return_value.count_tokens.side_effect = Exception('down')
+
+        warm_models()
+
+        self.assertEqual(mock_model.call_count, 2)
+        self.assertEqual(len(model_registry._models), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
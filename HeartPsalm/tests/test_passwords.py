@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch
+from sqlalchemy.exc import IntegrityError
+from heartpsalm import app, db, passwords
+from heartpsalm.forms import RegisterForm
+from heartpsalm.models import User, ChatConfiguration
+
+
+class TestPasswords(unittest.TestCase):
+    def setUp(self):
+        """Set up a test client and a user hashed at a low cost"""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        app.config['BCRYPT_LOG_ROUNDS'] = 4
+        self.client = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(ChatConfiguration(role='user', content='Be kind'))
+        db.session.add(ChatConfiguration(role='assistant', content='Hello'))
+        user = User(username='testuser', email_address='test@test.com')
+        user.password = 'password123'
+        db.session.add(user)
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        app.config['BCRYPT_LOG_ROUNDS'] = self.rounds
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch.object(passwords, 'WORKER_CLASS', 'gevent')
+    def test_pool_and_inline_hashes_agree(self):
+        """Test that hashes made on the pool check inline and back"""
+        with patch.object(passwords, 'PASSWORD_HASH_WORKERS', 1):
+            self.assertEqual(passwords.pool_size(), 1)
+            pooled = passwords.hash_password('secret')
+            self.assertTrue(passwords.check_password(pooled, 'secret'))
+        with patch.object(passwords, 'PASSWORD_HASH_WORKERS', 0):
+            self.assertTrue(passwords.check_password(pooled, 'secret'))
+            self.assertFalse(passwords.check_password(pooled, 'wrong'))
+            self.assertFalse(passwords.check_password('not a hash', 'x'))
+        self.assertTrue(pooled.startswith('$2b$04$'))
+
+    @patch.object(passwords, 'PASSWORD_HASH_WORKERS', 2)
+    def test_sync_workers_hash_inline(self):
+        """Test that only async worker classes start the pool"""
+        passwords.shutdown()
+        for worker_class in ('sync', 'gthread'):
+            with patch.object(passwords, 'WORKER_CLASS', worker_class):
+                self.assertEqual(passwords.pool_size(), 0)
+                passwords.start_pool()
+                password_hash = passwords.hash_password('secret')
+                self.assertTrue(
+                        passwords.check_password(password_hash, 'secret')
+                    )
+        self.assertIsNone(passwords._pool)
+        for worker_class in ('gevent', 'eventlet',
+                             'gunicorn.workers.ggevent.GeventWorker'):
+            with patch.object(passwords, 'WORKER_CLASS', worker_class):
+                self.assertEqual(passwords.pool_size(), 2)
+
+    def test_rehash_on_login(self):
+        """Test that logging in redoes a hash made at an older cost"""
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        response = self.client.post('/login', data={
+            'username': 'testuser',
+            'password': 'password123'
+            })
+
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        user = User.query.filter_by(username='testuser').first()
+        self.assertTrue(user.password_hash.startswith('$2b$05$'))
+        self.assertTrue(user.check_for_correct_paswd('password123'))
+
+    def test_wrong_password_keeps_hash(self):
+        """Test that a failed login never rehashes"""
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        self.client.post('/login', data={
+            'username': 'testuser',
+            'password': 'wrong-password'
+            })
+
+        db.session.expire_all()
+        user = User.query.filter_by(username='testuser').first()
+        self.assertTrue(user.password_hash.startswith('$2b$04$'))
+
+    def test_usernames_are_unique(self):
+        """Test that the database rejects a second user with a username"""
+        user = User(username='testuser', email_address='other@test.com')
+        user.password = 'password123'
+        db.session.add(user)
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    @patch.object(RegisterForm, 'validate_username', lambda self, field: None)
+    def test_concurrent_registration(self):
+        """Test that losing a registration race shows an error"""
+        response = self.client.post('/register', data={
+            'username': 'testuser',
+            'email_address': 'other@test.com',
+            'password1': 'password123',
+            'password2': 'password123'
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'already exists', response.data)
+        self.assertEqual(User.query.filter_by(username='testuser').count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
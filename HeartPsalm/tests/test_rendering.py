@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, db
+from heartpsalm.models import User, ChatMessage
+from heartpsalm.rendering import render_message
+from heartpsalm.core_functions import search_gospel_song
+
+
+class TestRendering(unittest.TestCase):
+    def test_bold_and_paragraphs(self):
+        """Test that bold spans and lines are rendered in one go"""
+        self.assertEqual(
+                render_message("**Hello** there*\n\nSecond line"),
+                "<p><strong>Hello</strong> there</p>\n\n<p>Second line</p>"
+            )
+
+    def test_markup_is_escaped(self):
+        """Test that HTML typed into a message is shown, not run"""
+        self.assertEqual(
+                render_message("<script>alert(1)</script>", "user"),
+                "<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>"
+            )
+
+    def test_song_card_kept(self):
+        """Test that the assistant's own song cards stay markup"""
+        track = {
+            'id': '1', 'name': 'Way <Maker>', 'artist': 'Sinach',
+            'url': 'https://open.spotify.com/track/1', 'popularity': 50
+        }
+        with patch('heartpsalm.core_functions.get_track_pool',
+                   return_value=[track]):
+            card = search_gospel_song('joyful')
+
+        self.assertIn('Way &lt;Maker&gt;', card)
+        self.assertEqual(
+                render_message(card, 'assistant'),
+                f'<div class="message-content">{card}</div>'
+            )
+        self.assertTrue(render_message(card, 'user').startswith('<p>&lt;'))
+
+    def test_rendered_on_insert(self):
+        """Test that a stored message carries its rendered HTML"""
+        with app.app_context():
+            db.create_all()
+            user = User(username='u', email_address='u@test.com')
+            user.password_hash = 'not-a-real-hash'
+            db.session.add(user)
+            db.session.commit()
+
+            message = ChatMessage(
+                    user_id=user.id, role='user', content='**hi**',
+                    session_id='s1'
+                )
+            db.session.add(message)
+            db.session.commit()
+
+            self.assertEqual(
+                    message.rendered_html, '<p><strong>hi</strong></p>'
+                )
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
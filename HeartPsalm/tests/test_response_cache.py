@@ -0,0 +1,97 @@
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, db, cache
+from heartpsalm.models import ChatConfiguration
+from heartpsalm import response_cache
+from heartpsalm.config_cache import get_chat_instructions
+from heartpsalm.core_functions import (
+        reply_to_message, reply_to_message_stream, analyze_intent_with_gemini)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        """Set up the instructions and an empty cache"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        cache.clear()
+        response_cache._stats.clear()
+        db.session.add(ChatConfiguration(role='user', content='Be kind'))
+        db.session.add(ChatConfiguration(role='assistant', content='Hello'))
+        db.session.commit()
+        self.first_turn = list(get_chat_instructions().history_prefix)
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_normalize_input(self):
+        """Test that case, spacing and punctuation are ignored"""
+        self.assertEqual(
+                response_cache.normalize_input('  Hello,   THERE!! '),
+                'hello there'
+            )
+
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='Peace be with you.')
+    def test_first_message_reply_cached(self, mock_ai_response):
+        """Test that a repeated greeting is answered from the cache"""
+        self.assertEqual(
+                reply_to_message('Hi!', self.first_turn), 'Peace be with you.'
+            )
+        self.assertEqual(
+                reply_to_message('  hi ', self.first_turn),
+                'Peace be with you.'
+            )
+        self.assertEqual(
+                list(reply_to_message_stream('HI', self.first_turn)),
+                ['Peace be with you.']
+            )
+
+        self.assertEqual(mock_ai_response.call_count, 1)
+        self.assertEqual(
+                response_cache.stats()['reply'],
+                {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3}
+            )
+
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='Tell me more.')
+    def test_turns_with_history_not_cached(self, mock_ai_response):
+        """Test that replies depending on earlier messages are not cached"""
+        history = self.first_turn + [{'role': 'user', 'parts': ['I lost']}]
+        reply_to_message('Hi', history)
+        reply_to_message('Hi', history)
+
+        self.assertEqual(mock_ai_response.call_count, 2)
+        self.assertEqual(response_cache.stats(), {})
+
+    @patch('heartpsalm.core_functions.classify_intent', return_value=None)
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='{"song_request": true, "emotion": "joyful"}')
+    def test_intent_cached(self, mock_ai_response, mock_classify_intent):
+        """Test that an escalated intent is classified once per input"""
+        self.assertTrue(analyze_intent_with_gemini('Music, maybe?'))
+        self.assertTrue(analyze_intent_with_gemini('music maybe'))
+
+        self.assertEqual(mock_ai_response.call_count, 1)
+        self.assertEqual(response_cache.stats()['intent']['hits'], 1)
+
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='Peace be with you.')
+    def test_instruction_edit_invalidates(self, mock_ai_response):
+        """Test that editing the instructions starts a fresh cache"""
+        reply_to_message('Hi', self.first_turn)
+        config = ChatConfiguration.query.filter_by(role='user').one()
+        config.content = 'Be very kind'
+        db.session.commit()
+
+        reply_to_message(
+                'Hi', list(get_chat_instructions().history_prefix)
+            )
+        self.assertEqual(mock_ai_response.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
+import json
 import unittest
 from unittest.mock import patch
 from flask import session
 from heartpsalm import app, db
 from heartpsalm.models import User, ChatMessage, ChatConfiguration
+from heartpsalm.core_functions import plan_turn
 from datetime import datetime, timezone
 
 
@@ -166,6 +168,61 @@ class TestFlaskRoutes(unittest.TestCase):
                     " ".join(expected_text.split())
                 )
 
+    @patch('heartpsalm.core_functions.classify_intent')
+    @patch('heartpsalm.core_functions.generative_ai_response_stream')
+    def test_chat_stream_message(self, mock_ai_stream, mock_classify_intent):
+        """Test streaming a reply and saving it once complete"""
+        mock_classify_intent.return_value = False
+        mock_ai_stream.return_value = iter(["Peace be ", "with you."])
+
+        with self.client:
+            self.login()
+            with self.client.session_transaction() as sess:
+                sess['session_id'] = 'test_session'
+
+            response = self.client.post(
+                    '/chat/stream', data={'user_feeling': 'Hello'}
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/event-stream')
+
+            events = [
+                    json.loads(line[len('data: '):])
+                    for line in response.get_data(as_text=True).split('\n\n')
+                    if line.startswith('data: ')
+                ]
+            self.assertEqual(
+                    [event.get('delta') for event in events[:-1]],
+                    ["Peace be ", "with you."]
+                )
+            self.assertTrue(events[-1]['done'])
+            self.assertEqual(
+                    events[-1]['assistant_response'], "Peace be with you."
+                )
+
+            saved = ChatMessage.query.filter_by(
+                    session_id='test_session', role='assistant'
+                ).first()
+            self.assertEqual(saved.content, "Peace be with you.")
+
+    @patch('heartpsalm.core_functions.generative_ai_response')
+    def test_plan_turn_single_call(self, mock_ai_response):
+        """Test that one structured Gemini call plans the whole turn"""
+        mock_ai_response.return_value = json.dumps({
+                "song_request": True,
+                "emotion": "Comforting",
+                "reply": "Here is a song."
+            })
+
+        plan = plan_turn("Play me something hopeful", [])
+
+        mock_ai_response.assert_called_once()
+        self.assertEqual(plan, {
+                "song_request": True,
+                "emotion": "comforting",
+                "reply": "Here is a song."
+            })
+
     def test_logout(self):
         """Test logout functionality"""
         with self.client:
@@ -201,6 +258,46 @@ class TestFlaskRoutes(unittest.TestCase):
                 ).all()
             self.assertEqual(len(messages), 0)
 
+    @patch('heartpsalm.helper_functions.CHAT_PAGE_SIZE', 3)
+    def test_chat_messages_pages_backwards(self):
+        """Test that older messages come back in keyset pages"""
+        with self.client:
+            self.login()
+            test_user = User.query.filter_by(username='testuser').first()
+            # messages sharing a timestamp are ordered by id
+            stamp = datetime(2025, 1, 1)
+            for number in range(7):
+                db.session.add(ChatMessage(
+                        user_id=test_user.id, role='user',
+                        content=f'Message {number}', session_id='long',
+                        timestamp=stamp if number < 4 else datetime.now()
+                    ))
+            db.session.commit()
+
+            pages = []
+            cursor = ''
+            while True:
+                response = self.client.get(
+                        f'/chat/long/messages?before={cursor}'
+                    )
+                page = response.get_json()
+                pages.append([
+                        msg['rendered_html'] for msg in page['messages']
+                    ])
+                cursor = page['next_cursor']
+                if not cursor:
+                    break
+
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            contents = [html for page in reversed(pages) for html in page]
+            self.assertEqual(
+                    contents,
+                    [f'<p>Message {number}</p>' for number in range(7)]
+                )
+
+            response = self.client.get('/chat/long/messages?before=bogus')
+            self.assertEqual(response.status_code, 400)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,162 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, db, cache
+from heartpsalm.models import ChatConfiguration
+from heartpsalm import response_cache, semantic_cache
+from heartpsalm.config_cache import get_chat_instructions
+from heartpsalm.core_functions import reply_to_message
+from heartpsalm.semantic_cache import SemanticCache, embed
+
+
+class TestSemanticCache(unittest.TestCase):
+    def test_embedding_is_normalized(self):
+        """Test that embeddings are unit vectors, or zero for no words"""
+        self.assertAlmostEqual(
+                float(embed('I feel so anxious') @ embed('I feel so anxious')),
+                1.0, places=5
+            )
+        self.assertFalse(embed('!!!').any())
+
+    def test_similar_message_hits(self):
+        """Test that a rephrased message gets the cached reply"""
+        semantic = SemanticCache(capacity=10)
+        semantic.add("I'm grieving my mother", 'God is near the grieving.')
+
+        self.assertEqual(
+                semantic.lookup('I am really grieving for my mother!'),
+                'God is near the grieving.'
+            )
+        self.assertIsNone(semantic.lookup('my mother died and I am grieving'))
+        self.assertIsNone(semantic.lookup('recommend a worship song'))
+
+    def test_other_names_do_not_match(self):
+        """Test that a reply naming someone is not reused for another"""
+        semantic = SemanticCache(capacity=10)
+        semantic.add('my husband mark died last night', 'Mark is with God.')
+
+        self.assertGreaterEqual(
+                float(embed('my husband mark died last night')
+                      @ embed('my husband tom died last night')),
+                semantic.threshold
+            )
+        self.assertIsNone(semantic.lookup('my husband tom died last night'))
+
+    def test_negation_does_not_match(self):
+        """Test that a negated message never reuses the plain reply"""
+        semantic = SemanticCache(capacity=10)
+        semantic.add('I am at peace', 'Praise God!')
+
+        self.assertIsNone(semantic.lookup('I am not at peace'))
+
+    def test_least_recently_used_evicted(self):
+        """Test that the entry used longest ago is evicted when full"""
+        semantic = SemanticCache(capacity=2)
+        semantic.add('lonely tonight', 'one')
+        semantic.add('grateful for family', 'two')
+        semantic.lookup('lonely tonight')
+        semantic.add('worried about my exam', 'three')
+
+        self.assertEqual(len(semantic), 2)
+        self.assertEqual(semantic.lookup('lonely tonight'), 'one')
+        self.assertIsNone(semantic.lookup('grateful for family'))
+        self.assertEqual(semantic.lookup('worried about my exam'), 'three')
+
+    def test_search_spans_many_groups(self):
+        """Test that lookups find entries after the centroids are seeded"""
+        semantic = SemanticCache(capacity=2000)
+        for number in range(1000):
+            semantic.add(f'prayer request number {number}', str(number))
+
+        self.assertEqual(
+                semantic.lookup('prayer request number 777'), '777'
+            )
+
+    def test_save_and_load(self):
+        """Test that a saved cache answers the same after loading"""
+        semantic = SemanticCache(capacity=10)
+        semantic.use_version('v1')
+        semantic.add('lonely tonight', 'one')
+        semantic.add('worried about my exam', 'two')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'semantic.npz')
+            semantic.save(path)
+            loaded = SemanticCache(capacity=10)
+            loaded.load(path)
+
+        self.assertEqual(loaded.version, 'v1')
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(loaded.lookup('worried about my exam'), 'two')
+
+
+@patch.object(semantic_cache, 'SEMANTIC_CACHE', True)
+class TestSemanticReplies(unittest.TestCase):
+    def setUp(self):
+        """Set up the instructions and empty caches"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        cache.clear()
+        response_cache._stats.clear()
+        semantic_cache.semantic_cache.clear()
+        db.session.add(ChatConfiguration(role='user', content='Be kind'))
+        db.session.add(ChatConfiguration(role='assistant', content='Hello'))
+        db.session.commit()
+        self.first_turn = list(get_chat_instructions().history_prefix)
+
+    def tearDown(self):
+        """Clean up after each test"""
+        semantic_cache.semantic_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='Cast your anxiety on Him.')
+    def test_rephrased_first_message_cached(self, mock_ai_response):
+        """Test that a rephrased first message skips Gemini"""
+        reply_to_message('I feel so anxious today', self.first_turn)
+
+        self.assertEqual(
+                reply_to_message("I'm really anxious!", self.first_turn),
+                'Cast your anxiety on Him.'
+            )
+        self.assertEqual(mock_ai_response.call_count, 1)
+        self.assertEqual(response_cache.stats()['semantic']['hits'], 1)
+
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           side_effect=['I am so sorry about Mark.', 'I am so sorry.'])
+    def test_personal_details_not_cached(self, mock_ai_response):
+        """Test that first messages naming someone are never reused"""
+        reply_to_message('My husband Mark died last night', self.first_turn)
+        self.assertEqual(
+                reply_to_message(
+                    'My husband Tom died last night', self.first_turn
+                ),
+                'I am so sorry.'
+            )
+        self.assertEqual(mock_ai_response.call_count, 2)
+        self.assertEqual(len(semantic_cache.semantic_cache), 0)
+        self.assertTrue(
+                semantic_cache.has_personal_details('I turned 40 today')
+            )
+        self.assertFalse(semantic_cache.has_personal_details(
+                'Anxious. I pray to God and Jesus every night'
+            ))
+
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='Tell me more.')
+    def test_turns_with_history_not_cached(self, mock_ai_response):
+        """Test that replies depending on earlier messages are not reused"""
+        history = self.first_turn + [{'role': 'user', 'parts': ['I lost']}]
+        reply_to_message('I feel anxious', history)
+        reply_to_message('I feel so anxious', history)
+
+        self.assertEqual(mock_ai_response.call_count, 2)
+        self.assertEqual(len(semantic_cache.semantic_cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
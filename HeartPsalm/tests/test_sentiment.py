@@ -0,0 +1,32 @@
+import unittest
+from heartpsalm.sentiment import detect_emotion, detect_emotions
+
+
+class TestSentiment(unittest.TestCase):
+    def test_detect_emotion_labels(self):
+        """Test that messages map onto the song search emotions"""
+        self.assertEqual(detect_emotion("I'm so happy today!"), "joyful")
+        self.assertEqual(
+                detect_emotion("I feel anxious and alone"), "comforting"
+            )
+        self.assertEqual(
+                detect_emotion("Thank you Lord, I am blessed"), "praise"
+            )
+        self.assertEqual(detect_emotion("I want to worship"), "worship")
+
+    def test_negation_flips_valence(self):
+        """Test that a negated feeling word counts the other way"""
+        self.assertEqual(detect_emotion("I am not happy"), "comforting")
+        self.assertEqual(detect_emotion("I'm not worried, I'm fine"), "joyful")
+
+    def test_batch_matches_single(self):
+        """Test that batch scoring agrees with scoring one at a time"""
+        messages = ["I feel sad", "hello", "", "Praise God, I got the job"]
+        self.assertEqual(
+                detect_emotions(messages),
+                [detect_emotion(message) for message in messages]
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import time
+import unittest
+from unittest.mock import patch
+from heartpsalm import app, db, cache
+from heartpsalm import core_functions
+from heartpsalm.models import GospelTrack
+
+
+def spotify_results(name):
+    """Builds a Spotify search result holding a single track"""
+    return {'tracks': {'items': [{
+        'id': name.lower().replace(' ', '-'),
+        'name': name,
+        'artists': [{'name': 'Test Artist'}],
+        'external_urls': {'spotify': 'https://open.spotify.com/track/1'}
+        }]}}
+
+
+class TestSongCache(unittest.TestCase):
+    def setUp(self):
+        """Start every test with an empty cache"""
+        cache.clear()
+
+    @patch('heartpsalm.core_functions.sp')
+    def test_song_requests_share_the_cached_pool(self, mock_sp):
+        """Test that only the first request for an emotion hits Spotify"""
+        mock_sp.search.return_value = spotify_results('Way Maker')
+
+        first = core_functions.search_gospel_song('joyful')
+        second = core_functions.search_gospel_song('joyful')
+
+        self.assertIn('Way Maker', first)
+        self.assertEqual(first, second)
+        mock_sp.search.assert_called_once()
+
+    @patch('heartpsalm.core_functions.sp')
+    def test_stale_pool_is_served_while_refreshing(self, mock_sp):
+        """Test stale-while-revalidate of an old track pool"""
+        cache.set('track_pool:praise', {
+            'tracks': [{'name': 'Old Song', 'artist': 'A', 'url': 'u'}],
+            'fetched_at': (
+                time.time() - core_functions.TRACK_POOL_FRESH_SECONDS - 1
+            )
+            }, timeout=300)
+        mock_sp.search.return_value = spotify_results('New Song')
+
+        self.assertIn(
+                'Old Song', core_functions.search_gospel_song('praise')
+            )
+
+        deadline = time.monotonic() + 5
+        while mock_sp.search.call_count == 0 or \
+                cache.get('track_pool_refresh:praise'):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertIn(
+                'New Song', core_functions.search_gospel_song('praise')
+            )
+
+
+@patch('heartpsalm.core_functions.SONG_SOURCE', 'catalog')
+class TestSongCatalog(unittest.TestCase):
+    def setUp(self):
+        """Set up a database holding a small harvested catalog"""
+        cache.clear()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for number in range(3):
+            db.session.add(GospelTrack(
+                spotify_id=f'track{number}', emotion='comforting',
+                name=f'Song {number}', artist='Test Artist',
+                url=f'https://open.spotify.com/track/{number}',
+                popularity=50
+                ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch('heartpsalm.core_functions.sp')
+    def test_catalog_serves_without_spotify(self, mock_sp):
+        """Test that songs come from the catalog with no network calls"""
+        recommendation = core_functions.search_gospel_song('comforting')
+
+        self.assertIn('Test Artist', recommendation)
+        mock_sp.search.assert_not_called()
+
+    @patch('heartpsalm.core_functions.sp')
+    def test_recent_tracks_are_not_repeated(self, mock_sp):
+        """Test that a user gets every catalog track before any repeat"""
+        recommendations = {
+                core_functions.search_gospel_song('comforting', 'user1')
+                for _ in range(3)
+            }
+
+        self.assertEqual(len(recommendations), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+from unittest.mock import patch
+from heartpsalm import cache
+from heartpsalm.core_functions import (
+        respond_to_message, stream_response_to_message)
+
+STUB_LATENCY = 0.2
+
+TRACK = {'id': 't1', 'name': 'A Song', 'artist': 'A', 'url': 'u'}
+
+
+def slow(result):
+    """Returns a stub that sleeps for STUB_LATENCY before answering"""
+    def stub(*args, **kwargs):
+        time.sleep(STUB_LATENCY)
+        return result
+    return stub
+
+
+@patch('heartpsalm.core_functions.classify_intent', return_value=None)
+class TestTurnExecutor(unittest.TestCase):
+    def test_song_search_overlaps_planning(self, mock_classify_intent):
+        """Test that an ambiguous turn takes the max of its calls"""
+        plan = {"song_request": True, "emotion": "praise", "reply": ""}
+        with patch('heartpsalm.core_functions.plan_turn', slow(plan)), \
+                patch('heartpsalm.core_functions.find_tracks',
+                      slow([TRACK])):
+            started = time.perf_counter()
+            response = respond_to_message("that song was something", [])
+            elapsed = time.perf_counter() - started
+
+        self.assertIn("A Song", response)
+        self.assertLess(elapsed, STUB_LATENCY * 1.75)
+
+    def test_speculative_reply_stream_wins(self, mock_classify_intent):
+        """Test that the speculative reply is kept when no song is wanted"""
+        plan = {"song_request": False, "emotion": "praise", "reply": ""}
+        with patch('heartpsalm.core_functions.plan_turn', slow(plan)), \
+                patch('heartpsalm.core_functions.find_tracks',
+                      slow([TRACK])), \
+                patch('heartpsalm.core_functions.'
+                      'generative_ai_response_stream',
+                      return_value=iter(["Grace ", "and peace."])):
+            chunks = list(
+                    stream_response_to_message("that song was something", [])
+                )
+
+        self.assertEqual(chunks, ["Grace ", "and peace."])
+
+    def test_losing_song_branch_is_not_remembered(self,
+                                                  mock_classify_intent):
+        """Test that a discarded speculative song never counts as shown"""
+        cache.clear()
+        plan = {"song_request": False, "emotion": "praise", "reply": "hello"}
+        with patch('heartpsalm.core_functions.plan_turn',
+                   return_value=plan), \
+                patch('heartpsalm.core_functions.get_track_pool',
+                      return_value=[TRACK]), \
+                patch('heartpsalm.core_functions.'
+                      'generative_ai_response_stream',
+                      return_value=iter(["hello"])):
+            response = respond_to_message(
+                    "that song was something", [], user_id='u1'
+                )
+            chunks = list(stream_response_to_message(
+                    "that song was something", [], user_id='u1'
+                ))
+
+        self.assertEqual(response, "hello")
+        self.assertEqual(chunks, ["hello"])
+        self.assertIsNone(cache.get("recent_tracks:u1"))
+
+    def test_winning_song_branch_is_remembered(self, mock_classify_intent):
+        """Test that a song shown from the speculative lookup is recorded"""
+        cache.clear()
+        plan = {"song_request": True, "emotion": "praise", "reply": ""}
+        with patch('heartpsalm.core_functions.plan_turn',
+                   return_value=plan), \
+                patch('heartpsalm.core_functions.get_track_pool',
+                      return_value=[TRACK]):
+            response = respond_to_message(
+                    "that song was something", [], user_id='u1'
+                )
+
+        self.assertIn("A Song", response)
+        self.assertEqual(cache.get("recent_tracks:u1"), ['t1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
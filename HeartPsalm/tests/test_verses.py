@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from heartpsalm import verses
+from heartpsalm.core_functions import reply_to_message
+from heartpsalm.verses import (
+        VerseIndex, load_verses, detect_feeling, verses_for_emotion,
+        answer_from_verses, ground_message)
+
+
+class TestVerses(unittest.TestCase):
+    def test_every_tag_has_verses(self):
+        """Test that each feeling and emotion has curated verses"""
+        for tag in list(verses.FEELINGS) + list(verses.EMOTION_TAGS):
+            self.assertTrue(verses_for_emotion(tag), tag)
+        self.assertEqual(
+                verses_for_emotion('anxious', 1)[0].reference,
+                'Philippians 4:6-7'
+            )
+
+    def test_detect_feeling(self):
+        """Test that "I feel X" messages name their feeling"""
+        self.assertEqual(
+                detect_feeling('I feel so anxious today'),
+                ('anxious', 'anxious')
+            )
+        self.assertEqual(
+                detect_feeling("I'm really tired"), ('weary', 'tired')
+            )
+        self.assertIsNone(detect_feeling('I am not happy'))
+        self.assertIsNone(detect_feeling('What is grace?'))
+
+    def test_search_ranks_matching_verses(self):
+        """Test that full-text search finds verses sharing rare words"""
+        results = verses.get_index().search("I can't sleep at night")
+        self.assertEqual(results[0][0].reference, 'Psalm 4:8')
+        self.assertEqual(verses.get_index().search('hello'), [])
+
+    def test_translation_replaces_text(self):
+        """Test that a full translation supplies text and extra verses"""
+        with tempfile.TemporaryDirectory() as directory:
+            curated = os.path.join(directory, 'curated.tsv')
+            corpus = os.path.join(directory, 'corpus.tsv')
+            with open(curated, 'w', encoding='utf-8') as dataset:
+                dataset.write('John 1:1-2\tworship\tOld wording.\n')
+            with open(corpus, 'w', encoding='utf-8') as dataset:
+                dataset.write('John 1:1\tIn the beginning.\n')
+                dataset.write('John 1:2\tThe same was.\n')
+                dataset.write('John 1:3\tAll things were made.\n')
+            index = VerseIndex(load_verses(curated, corpus))
+
+        self.assertEqual(
+                index.for_tag('worship')[0].text,
+                'In the beginning. The same was.'
+            )
+        self.assertEqual(
+                index.search('things made')[0][0].reference, 'John 1:3'
+            )
+
+    @patch.object(verses, 'VERSE_RETRIEVAL', 'answer')
+    def test_routine_feeling_answered_locally(self):
+        """Test that a short "I feel X" message gets a verse reply"""
+        reply = answer_from_verses('I feel lonely')
+        self.assertIn("I'm sorry you're feeling lonely.", reply)
+        self.assertTrue(any(
+                f'**{verse.reference}**' in reply
+                for verse in verses_for_emotion('lonely', None)
+            ))
+        self.assertIsNone(answer_from_verses('Why do I feel lonely?'))
+
+    @patch.object(verses, 'VERSE_RETRIEVAL', 'ground')
+    def test_grounding_quotes_feeling_verses(self):
+        """Test that Gemini is given the verses of the named feeling"""
+        self.assertIsNone(answer_from_verses('I feel lonely'))
+        grounded = ground_message('I feel lonely')
+        self.assertTrue(grounded.startswith('I feel lonely\n\n'))
+        self.assertIn('Hebrews 13:5', grounded)
+        self.assertEqual(ground_message('hello'), 'hello')
+
+    @patch.object(verses, 'VERSE_RETRIEVAL', 'ground')
+    def test_small_talk_is_not_grounded(self):
+        """Test that greetings and off-topic messages get no verses"""
+        for message in ('I just want to chat', 'Can you tell me a joke',
+                        'What is the weather like tomorrow?', 'Hello there',
+                        'Good morning!', 'Hi, how are you?'):
+            self.assertEqual(ground_message(message), message)
+        grounded = ground_message('How do I forgive my brother?')
+        self.assertIn('1 John 1:9', grounded)
+
+    @patch.object(verses, 'VERSE_RETRIEVAL', 'off')
+    @patch('heartpsalm.response_cache.is_context_free', return_value=False)
+    @patch('heartpsalm.core_functions.generative_ai_response',
+           return_value='Peace.')
+    def test_retrieval_off(self, mock_ai_response, mock_context_free):
+        """Test that the message reaches Gemini unchanged when off"""
+        reply_to_message('I feel lonely', [])
+        self.assertEqual(mock_ai_response.call_args[0][0], 'I feel lonely')
+
+
+if __name__ == '__main__':
+    unittest.main()
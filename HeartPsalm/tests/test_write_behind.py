@@ -0,0 +1,140 @@
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from heartpsalm import app, db, cache, write_behind
+from heartpsalm.models import User, ChatMessage, ChatSession
+from heartpsalm.helper_functions import (
+        build_message_rows, get_message_page, store_message_rows)
+from heartpsalm.write_behind import WriteBehindQueue
+
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        """Set up a test database with one user"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        cache.clear()
+
+        self.user = User(username='testuser', email_address='test@test.com')
+        self.user.password_hash = 'not-a-real-hash'
+        db.session.add(self.user)
+        db.session.commit()
+        self.user_id = self.user.id
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_pending_turn_readable_then_flushed(self):
+        """Test that queued messages are visible before and after a flush"""
+        write_queue = WriteBehindQueue(interval=5)
+        write_queue.put(build_message_rows(self.user_id, 's1', [
+                ('user', 'Hello', datetime(2025, 1, 1)),
+                ('assistant', 'Hi there', datetime(2025, 1, 1, 0, 1)),
+            ]))
+
+        messages, _ = get_message_page(self.user_id, 's1')
+        self.assertEqual(
+                [msg.rendered_html for msg in messages],
+                ['<p>Hello</p>', '<p>Hi there</p>']
+            )
+        self.assertEqual(ChatMessage.query.count(), 0)
+
+        write_queue.shutdown()
+        db.session.remove()
+
+        messages, _ = get_message_page(self.user_id, 's1')
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(all(msg.id is not None for msg in messages))
+        summary = ChatSession.query.filter_by(session_id='s1').one()
+        self.assertEqual(summary.message_count, 2)
+
+    def test_batches_many_turns(self):
+        """Test that the flusher stores turns from several sessions"""
+        write_queue = WriteBehindQueue(interval=0.01, batch_rows=4)
+        for number in range(10):
+            write_queue.put(build_message_rows(
+                    self.user_id, f's{number % 3}',
+                    [('user', f'Message {number}', datetime(2025, 1, 1))]
+                ))
+        write_queue.shutdown()
+        db.session.remove()
+
+        self.assertEqual(ChatMessage.query.count(), 10)
+        self.assertEqual(
+                sorted(s.message_count for s in ChatSession.query),
+                [3, 3, 4]
+            )
+
+    @patch.object(write_behind, 'FLUSH_ATTEMPTS', 1)
+    def test_failed_flush_keeps_rows(self):
+        """Test that a batch the database rejects is kept and retried"""
+        database_down = threading.Event()
+        database_down.set()
+        failures = []
+
+        def flaky_store(rows):
+            if database_down.is_set():
+                failures.append(len(rows))
+                raise RuntimeError('database is down')
+            store_message_rows(rows)
+
+        write_queue = WriteBehindQueue(interval=0.01)
+        with patch('heartpsalm.write_behind.store_message_rows',
+                   side_effect=flaky_store), \
+                self.assertLogs(app.logger, level='ERROR'):
+            write_queue.put(build_message_rows(
+                    self.user_id, 's1',
+                    [('user', 'Hello', datetime(2025, 1, 1))]
+                ))
+            deadline = time.monotonic() + 5
+            while len(failures) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertGreaterEqual(len(failures), 2)
+
+            messages, _ = get_message_page(self.user_id, 's1')
+            self.assertEqual([msg.content for msg in messages], ['Hello'])
+
+            database_down.clear()
+            write_queue.shutdown()
+        db.session.remove()
+
+        messages, _ = get_message_page(self.user_id, 's1')
+        self.assertEqual(len(messages), 1)
+        self.assertIsNotNone(messages[0].id)
+        self.assertEqual(ChatMessage.query.count(), 1)
+
+    def test_rejected_row_does_not_block_others(self):
+        """Test that a row the database rejects is dropped on its own"""
+        rejected = build_message_rows(
+                self.user_id, 's2', [('user', 'Bad', datetime(2025, 1, 1))]
+            )
+        rejected[0]['content'] = None
+        write_queue = WriteBehindQueue(interval=0.01, batch_rows=100)
+        with self.assertLogs(app.logger, level='ERROR') as logs:
+            for number in range(4):
+                write_queue.put(build_message_rows(
+                        self.user_id, 's1',
+                        [('user', f'Message {number}',
+                          datetime(2025, 1, 1, 0, number))]
+                    ))
+                if number == 1:
+                    write_queue.put(rejected)
+            write_queue.shutdown()
+        db.session.remove()
+
+        self.assertEqual(ChatMessage.query.count(), 4)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('dropping a queued user message', logs.output[0])
+        self.assertEqual(write_queue._held, [])
+        messages, _ = get_message_page(self.user_id, 's2')
+        self.assertEqual(messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()